@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# benchmarks/bench_current.py
+# 描述: `claude_env current` 提示符快速路径的微基准
+#   - 进程内: render_current() 单次调用耗时 (预算 < 5 ms，超出时以非零状态退出)
+#   - 进程级: `python -m claude_env current` 与空解释器 `python -c pass` 的差值
+#     (仅供参考，解释器本身的启动耗时不在 claude_env 的控制范围内)
+#   - 确认快速路径没有导入 Typer / Rich / Pydantic / PyYAML
+#
+# 用法:
+#   uv run python benchmarks/bench_current.py [--budget-ms 5]
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("typer", "rich", "pydantic", "yaml")
+
+
+def make_home(home: Path):
+    """
+    构造一个 pointer 模式的最小环境布局 (最坏情况: 读取布局缓存并两次 readlink)
+    """
+    base_dir = home / ".claude_env"
+    config = base_dir / "config.yaml"
+    base_dir.mkdir()
+    config.write_text("{}")
+    st = config.stat()
+    layout = {
+        "config": [st.st_ino, st.st_mtime_ns, st.st_size],
+        "base_dir": str(base_dir),
+        "primary": ".claude.json",
+    }
+    (base_dir / ".layout.json").write_text(json.dumps(layout))
+    (base_dir / "work" / ".claude").mkdir(parents=True)
+    (base_dir / "work" / ".claude.json").write_text("{}")
+    (base_dir / "current").symlink_to("work")
+    (home / ".claude.json").symlink_to(base_dir / "current" / ".claude.json")
+    index = {"work": {"signature": [0, 0, 0], "profile": {"is_valid": True}}}
+    (base_dir / "index.json").write_text(json.dumps(index))
+
+
+def best_process_ms(cmd: list[str], env: dict, runs: int) -> float:
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=5.0)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp_home = tempfile.mkdtemp(prefix="claude_env_current_")
+    env = dict(os.environ, HOME=tmp_home, PYTHONPATH=str(PROJECT_DIR))
+    try:
+        make_home(Path(tmp_home))
+
+        # 进程内耗时: 在子进程中测量，确保 HOME 生效
+        code = (
+            "import sys, timeit\n"
+            "from claude_env.prompt import render_current\n"
+            "assert render_current(True) == 'work ✓', render_current(True)\n"
+            "n = 2000\n"
+            "t = min(timeit.repeat(lambda: render_current(True), number=n, repeat=5))\n"
+            f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+            "print(t / n * 1000, ','.join(heavy))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            cwd=PROJECT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        per_call_ms, heavy = result.stdout.split(" ", 1)
+        per_call_ms = float(per_call_ms)
+        heavy = heavy.strip()
+
+        baseline = best_process_ms([sys.executable, "-c", "pass"], env, args.runs)
+        current = best_process_ms(
+            [sys.executable, "-m", "claude_env", "current", "--auth"], env, args.runs
+        )
+
+        print(f"render_current(--auth) 单次: {per_call_ms:.3f} ms")
+        print(f"空解释器 python -c pass:     {baseline:.1f} ms")
+        print(f"python -m claude_env current: {current:.1f} ms")
+        print(f"快速路径额外开销:            {current - baseline:.1f} ms")
+
+        if heavy:
+            print(f"✗ 快速路径导入了重量级模块: {heavy}")
+            return 1
+        if per_call_ms > args.budget_ms:
+            print(f"✗ 超出预算 {args.budget_ms} ms")
+            return 1
+        print(f"✓ 在预算 {args.budget_ms} ms 之内")
+        return 0
+    finally:
+        shutil.rmtree(tmp_home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# benchmarks/bench_du.py
+# 描述: 对比 `du` 在无目录缓存 (冷) 和有缓存 (热) 时的扫描耗时
+#
+# 用法:
+#   uv run python benchmarks/bench_du.py [环境数量] [每个环境的目录数] [每个目录的文件数]
+
+import io
+import os
+import sys
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+ENV_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+DIRS_PER_ENV = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+FILES_PER_DIR = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+# 必须在导入 claude_env 之前切换 HOME，所有路径常量都基于 Path.home()
+TMP_HOME = tempfile.mkdtemp(prefix="claude_env_bench_")
+os.environ["HOME"] = TMP_HOME
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rich.console import Console  # noqa: E402
+
+from claude_env.config import DU_CACHE_PATH  # noqa: E402
+from claude_env.manager import EnvironmentManager  # noqa: E402
+
+
+def make_envs(base_dir: Path):
+    """
+    生成 ENV_COUNT 个环境，每个在 .claude/projects 下有 DIRS_PER_ENV 个目录
+    """
+    names = []
+    for i in range(ENV_COUNT):
+        name = f"env-{i:04d}"
+        projects = base_dir / name / ".claude" / "projects"
+        for d in range(DIRS_PER_ENV):
+            project = projects / f"project-{d:05d}"
+            project.mkdir(parents=True)
+            for f in range(FILES_PER_DIR):
+                with open(project / f"{f:04d}.jsonl", "wb") as fh:
+                    fh.write(b"x" * 4096)
+        names.append(name)
+    return names
+
+
+def run_du(manager: EnvironmentManager, refresh: bool = False) -> float:
+    start = time.perf_counter()
+    manager.du(refresh=refresh)
+    return time.perf_counter() - start
+
+
+def main():
+    manager = EnvironmentManager()
+    manager.console = Console(file=io.StringIO())
+    for name in make_envs(manager.config.base_dir):
+        manager.registry.add(name)
+
+    total_files = ENV_COUNT * DIRS_PER_ENV * FILES_PER_DIR
+    print(f"环境数量: {ENV_COUNT}, 目录: {ENV_COUNT * DIRS_PER_ENV}, 文件: {total_files}")
+
+    DU_CACHE_PATH.unlink(missing_ok=True)
+    cold = run_du(manager)
+
+    # 热: 新的 manager (模拟一次新的 CLI 调用)，只靠 .du.json
+    warm_manager = EnvironmentManager()
+    warm_manager.console = Console(file=io.StringIO())
+    warm = run_du(warm_manager)
+
+    print(f"冷 du (scandir + stat 全部文件): {cold * 1000:8.1f} ms")
+    print(f"热 du (每个目录一次 lstat):      {warm * 1000:8.1f} ms")
+    print(f"加速比: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(TMP_HOME, ignore_errors=True)
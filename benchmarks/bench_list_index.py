@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# benchmarks/bench_list_index.py
+# 描述: 对比 `list` 在无索引 (冷) 和有索引 (热) 时的耗时
+#
+# 用法:
+#   uv run python benchmarks/bench_list_index.py [环境数量] [每个 .claude.json 的 MB 数]
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+ENV_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+JSON_MB = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+# 必须在导入 claude_env 之前切换 HOME，所有路径常量都基于 Path.home()
+TMP_HOME = tempfile.mkdtemp(prefix="claude_env_bench_")
+os.environ["HOME"] = TMP_HOME
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rich.console import Console  # noqa: E402
+
+from claude_env import utils  # noqa: E402
+from claude_env.config import PROFILE_INDEX_PATH  # noqa: E402
+from claude_env.manager import EnvironmentManager  # noqa: E402
+
+
+def make_envs(base_dir: Path):
+    """
+    生成 ENV_COUNT 个环境，每个带一个约 JSON_MB 大小的 .claude.json
+    """
+    history = "x" * 1024
+    projects = {
+        f"/work/project-{i}": {"history": [history]}
+        for i in range(int(JSON_MB * 1024))
+    }
+    names = []
+    for i in range(ENV_COUNT):
+        name = f"env-{i:04d}"
+        env_dir = base_dir / name
+        (env_dir / ".claude").mkdir(parents=True)
+        data = {"userID": f"{i:064x}", "projects": projects}
+        with open(env_dir / ".claude.json", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        names.append(name)
+    return names
+
+
+def run_list(manager: EnvironmentManager) -> float:
+    start = time.perf_counter()
+    manager.list_envs()
+    return time.perf_counter() - start
+
+
+def main():
+    manager = EnvironmentManager()
+    manager.console = Console(file=io.StringIO())
+    for name in make_envs(manager.config.base_dir):
+        manager.registry.add(name)
+
+    print(f"环境数量: {ENV_COUNT}, 每个 .claude.json 约 {JSON_MB} MB")
+
+    # 冷: 无索引、无进程内缓存
+    PROFILE_INDEX_PATH.unlink(missing_ok=True)
+    cold = run_list(manager)
+
+    # 热: 新的 manager (模拟一次新的 CLI 调用)，只靠 index.json
+    utils._profile_cache.clear()
+    warm_manager = EnvironmentManager()
+    warm_manager.console = Console(file=io.StringIO())
+    warm = run_list(warm_manager)
+
+    print(f"冷 list (解析全部 .claude.json): {cold * 1000:8.1f} ms")
+    print(f"热 list (仅 stat + index.json):  {warm * 1000:8.1f} ms")
+    print(f"加速比: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(TMP_HOME, ignore_errors=True)
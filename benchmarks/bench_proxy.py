@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# benchmarks/bench_proxy.py
+# 描述: 对本地负载均衡代理 (claude_env proxy) 做压测，上游为本地的模拟 API 服务
+#
+# 用法:
+#   uv run python benchmarks/bench_proxy.py [上游数量] [并发连接数] [请求总数] [上游延迟 ms]
+#
+# 第一个上游会以 10% 的概率返回 429，用来观察退避和重试；每 10 个请求中有一个是流式
+# (分块编码的 SSE) 响应。所有上游、代理和压测客户端运行在同一个事件循环中，
+# 结果包含了三者共享一个 CPU 核心的开销。
+
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+UPSTREAM_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+TOTAL_REQUESTS = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+UPSTREAM_LATENCY = (float(sys.argv[4]) if len(sys.argv) > 4 else 5.0) / 1000
+FLAKY_RATE = 0.1
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from claude_env.proxy import ProxyPool, Upstream, read_body, read_head, start_proxy  # noqa: E402
+from tests.stubs import StubUpstream  # noqa: E402
+
+TOKEN = "bench-token"
+
+
+async def client_worker(port: int, queue: asyncio.Queue, latencies: list, statuses: dict):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps({"model": "claude-sonnet-4-5", "max_tokens": 16}).encode()
+    try:
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            path = "/v1/messages?stream" if i % 10 == 0 else "/v1/messages"
+            start = time.perf_counter()
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: localhost\r\nx-api-key: {TOKEN}\r\n"
+                f"content-type: application/json\r\ncontent-length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            status_line, headers = await read_head(reader)
+            await read_body(reader, headers)
+            latencies.append(time.perf_counter() - start)
+            status = int(status_line.split(" ", 2)[1])
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def main():
+    stubs = [
+        StubUpstream(
+            f"sk-bench-{i}",
+            flaky_rate=FLAKY_RATE if i == 0 else 0.0,
+            latency=UPSTREAM_LATENCY,
+        )
+        for i in range(UPSTREAM_COUNT)
+    ]
+    upstreams = [
+        Upstream(f"env-{i}", stub.api_key, await stub.start()) for i, stub in enumerate(stubs)
+    ]
+    pool = ProxyPool(upstreams, token=TOKEN, retries=2, backoff_max=1.0)
+    proxy = await start_proxy(pool, "127.0.0.1", 0)
+    port = proxy.sockets[0].getsockname()[1]
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(TOTAL_REQUESTS):
+        queue.put_nowait(i)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    print(
+        f"上游: {UPSTREAM_COUNT} (延迟 {UPSTREAM_LATENCY * 1000:.0f} ms, "
+        f"env-0 以 {FLAKY_RATE:.0%} 概率返回 429), 并发连接: {CONCURRENCY}, 请求: {TOTAL_REQUESTS}"
+    )
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client_worker(port, queue, latencies, statuses) for _ in range(CONCURRENCY))
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"吞吐: {len(latencies) / elapsed:8.0f} req/s")
+    print(f"延迟: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+    print(f"客户端收到的状态码: {dict(sorted(statuses.items()))}")
+    for upstream, stub in zip(upstreams, stubs):
+        print(
+            f"  {upstream.name}: 成功 {stub.served}, 429 {stub.rejected}, "
+            f"新建连接 {upstream.connections_opened}, 错误的 API Key {stub.wrong_keys}"
+        )
+
+    proxy.close()
+    pool.close()
+    for stub in stubs:
+        stub.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
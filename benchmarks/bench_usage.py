@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# benchmarks/bench_usage.py
+# 描述: 对比 `usage` 在无检查点 (冷)、有检查点 (热) 以及少量追加后的统计耗时
+#
+# 用法:
+#   uv run python benchmarks/bench_usage.py [环境数量] [每个环境的对话记录数] [每个对话记录的消息数]
+
+import io
+import json
+import os
+import sys
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+ENV_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+FILES_PER_ENV = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+MESSAGES_PER_FILE = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+# 必须在导入 claude_env 之前切换 HOME，所有路径常量都基于 Path.home()
+TMP_HOME = tempfile.mkdtemp(prefix="claude_env_bench_")
+os.environ["HOME"] = TMP_HOME
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rich.console import Console  # noqa: E402
+
+from claude_env.config import USAGE_STATE_PATH  # noqa: E402
+from claude_env.manager import EnvironmentManager  # noqa: E402
+
+
+def message_lines(prefix: str, count: int) -> bytes:
+    """
+    模拟真实对话记录: 每条 assistant 消息前有一条用户消息，且流式输出会把同一条消息写两次
+    """
+    lines = []
+    for i in range(count):
+        lines.append(
+            json.dumps(
+                {
+                    "type": "user",
+                    "timestamp": "2026-10-01T10:00:00Z",
+                    "message": {"role": "user", "content": "x" * 400},
+                }
+            )
+        )
+        assistant = json.dumps(
+            {
+                "type": "assistant",
+                "requestId": f"req_{prefix}_{i}",
+                "timestamp": f"2026-10-{i % 28 + 1:02d}T10:00:01Z",
+                "message": {
+                    "id": f"msg_{prefix}_{i}",
+                    "model": "claude-sonnet-4-5",
+                    "content": [{"type": "text", "text": "y" * 600}],
+                    "usage": {
+                        "input_tokens": 10,
+                        "output_tokens": 20,
+                        "cache_creation_input_tokens": 30,
+                        "cache_read_input_tokens": 40,
+                    },
+                },
+            }
+        )
+        lines += [assistant, assistant]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def make_envs(base_dir: Path):
+    names = []
+    for i in range(ENV_COUNT):
+        name = f"env-{i:04d}"
+        projects = base_dir / name / ".claude" / "projects"
+        for f in range(FILES_PER_ENV):
+            project = projects / f"project-{f % 20:02d}"
+            project.mkdir(parents=True, exist_ok=True)
+            (project / f"{f:05d}.jsonl").write_bytes(message_lines(f"{i}_{f}", MESSAGES_PER_FILE))
+        names.append(name)
+    return names
+
+
+def run_usage() -> float:
+    # 每次使用新的 manager (模拟一次新的 CLI 调用)，只靠 .usage.json
+    manager = EnvironmentManager()
+    manager.console = Console(file=io.StringIO())
+    start = time.perf_counter()
+    manager.usage()
+    return time.perf_counter() - start
+
+
+def main():
+    manager = EnvironmentManager()
+    names = make_envs(manager.config.base_dir)
+    for name in names:
+        manager.registry.add(name)
+
+    total_bytes = sum(
+        p.stat().st_size for p in manager.config.base_dir.glob("env-*/.claude/projects/*/*.jsonl")
+    )
+    print(
+        f"环境数量: {ENV_COUNT}, 对话记录: {ENV_COUNT * FILES_PER_ENV}, "
+        f"总大小: {total_bytes / 1024 / 1024:.1f} MB"
+    )
+
+    USAGE_STATE_PATH.unlink(missing_ok=True)
+    cold = run_usage()
+    warm = run_usage()
+
+    # 模拟正在进行的会话: 每个环境的一个对话记录追加 10 条消息
+    for i, name in enumerate(names):
+        transcript = next((manager.config.base_dir / name / ".claude" / "projects").glob("*/*.jsonl"))
+        with open(transcript, "ab") as fh:
+            fh.write(message_lines(f"append_{i}", 10))
+    appended = run_usage()
+
+    print(f"冷 usage (解析全部对话记录):   {cold * 1000:8.1f} ms")
+    print(f"热 usage (每个文件一次 stat):   {warm * 1000:8.1f} ms")
+    print(f"追加后 (只解析新增的行):       {appended * 1000:8.1f} ms")
+    print(f"加速比: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(TMP_HOME, ignore_errors=True)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# benchmarks/check_import_time.py
+# 描述: 启动耗时回归检查
+#   1. 轻量客户端 (claude_env.client / claude_env.status) 不得导入 Typer / Rich / Pydantic / PyYAML
+#   2. 基于 `-X importtime` 统计冷启动 `claude_env status` 的导入耗时，
+#      超过预算或 status 本身失败时以非零状态退出
+# 临时 HOME 中预置一个已激活的环境，与日常使用相同，status 走 claude_env/status.py 的快速路径
+#
+# 用法:
+#   uv run python benchmarks/check_import_time.py [--budget-ms 100] [--runs 5]
+
+import os
+import sys
+import argparse
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("typer", "rich", "pydantic", "yaml")
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """
+    解析 -X importtime 输出，返回 {顶层模块: 累计耗时 (us)}
+    """
+    totals: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if name.startswith("  "):  # 只统计顶层导入，避免重复计算
+            continue
+        totals[name.strip()] = int(cumulative_us)
+    return totals
+
+
+def check_client_is_light(env: dict) -> list[str]:
+    code = (
+        "import sys, claude_env.client, claude_env.status;"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def make_home() -> str:
+    """
+    创建临时 HOME，包含一个已激活的 OAuth 环境 (~/.claude.json -> ~/.claude_env/work/.claude.json)
+    """
+    home = tempfile.mkdtemp(prefix="claude_env_importtime_")
+    env_dir = Path(home) / ".claude_env" / "work"
+    env_dir.mkdir(parents=True)
+    (env_dir / ".claude.json").write_text('{"user": {"email": "bench@example.com"}}')
+    (Path(home) / ".claude.json").symlink_to(env_dir / ".claude.json")
+    return home
+
+
+def run_status(cmd: list[str], env: dict) -> subprocess.CompletedProcess:
+    result = subprocess.run(cmd, cwd=PROJECT_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        stderr = "\n".join(
+            line for line in result.stderr.splitlines() if not line.startswith("import time:")
+        )
+        print(f"✗ status 退出码为 {result.returncode}:\n{result.stdout}{stderr}")
+        sys.exit(1)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_home = make_home()
+    env = dict(os.environ, HOME=tmp_home, PYTHONPATH=str(PROJECT_DIR))
+    try:
+        heavy = check_client_is_light(env)
+        if heavy:
+            print(f"✗ 轻量客户端导入了重量级模块: {', '.join(heavy)}")
+            return 1
+        print("✓ 轻量客户端只依赖标准库")
+
+        cmd = [sys.executable, "-X", "importtime", "-m", "claude_env", "status"]
+        # 预热一次: 生成默认 config.yaml、布局缓存、元数据索引和 .pyc
+        run_status(cmd, env)
+
+        best_import_us = None
+        best_totals: dict[str, int] = {}
+        best_wall = None
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = run_status(cmd, env)
+            wall = time.perf_counter() - start
+            totals = parse_importtime(result.stderr)
+            import_us = sum(totals.values())
+            if best_import_us is None or import_us < best_import_us:
+                best_import_us, best_totals = import_us, totals
+            best_wall = wall if best_wall is None else min(best_wall, wall)
+
+        import_ms = best_import_us / 1000
+        print(f"status 导入耗时: {import_ms:.1f} ms (预算 {args.budget_ms:.0f} ms)")
+        print(f"status 总耗时:   {best_wall * 1000:.1f} ms (含 -X importtime 开销)")
+        print("最慢的顶层导入:")
+        for name, us in sorted(best_totals.items(), key=lambda x: -x[1])[:8]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+        if import_ms > args.budget_ms:
+            print("✗ 超出启动耗时预算")
+            return 1
+        print("✓ 在预算之内")
+        return 0
+    finally:
+        shutil.rmtree(tmp_home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# benchmarks/stress_state.py
+# 描述: 并发压力测试，N 个进程同时执行 add / switch / remove，
+# 报告吞吐量，并检查最终的环境列表与各进程实际完成的操作一致 (没有丢失的更新)。
+#
+# 用法:
+#   uv run python benchmarks/stress_state.py [--workers 8] [--ops 30] [--registry yaml|sqlite]
+
+import io
+import os
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+import time
+import builtins
+import multiprocessing
+from contextlib import redirect_stdout
+from pathlib import Path
+
+# 必须在导入 claude_env 之前切换 HOME，所有路径常量都基于 Path.home()
+TMP_HOME = tempfile.mkdtemp(prefix="claude_env_stress_")
+os.environ["HOME"] = TMP_HOME
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rich.console import Console  # noqa: E402
+
+from claude_env.config import CONFIG_PATH, ENV_STATE_PATH  # noqa: E402
+from claude_env.manager import EnvironmentManager  # noqa: E402
+
+
+def new_manager() -> EnvironmentManager:
+    manager = EnvironmentManager()
+    manager.console = Console(file=io.StringIO())
+    return manager
+
+
+def worker(worker_id: int, ops: int, seed: int, results):
+    """
+    在自己的命名空间 (w<id>-<n>) 内随机执行 add / switch / remove，
+    返回该进程认为仍然存在的环境集合
+    """
+    rng = random.Random(seed)
+    builtins.input = lambda prompt="": "yes"  # remove 的交互式确认
+    alive: list[str] = []
+    counter = 0
+    done = 0
+    with redirect_stdout(io.StringIO()):
+        for _ in range(ops):
+            manager = new_manager()  # 每次操作模拟一次独立的 CLI 调用
+            action = rng.choice(["add", "add", "switch", "remove"])
+            if action == "add" or not alive:
+                name = f"w{worker_id}-{counter}"
+                counter += 1
+                manager.add(name)
+                alive.append(name)
+            elif action == "switch":
+                manager.switch(rng.choice(alive))
+            else:
+                name = rng.choice(alive)
+                manager.remove(name)
+                # 如果它恰好是其他进程刚激活的环境，remove 会拒绝；以目录是否存在为准
+                if not (manager.config.base_dir / name).exists():
+                    alive.remove(name)
+            done += 1
+    results.put((worker_id, alive, done))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=30)
+    parser.add_argument("--registry", choices=["yaml", "sqlite"], default="yaml")
+    args = parser.parse_args()
+
+    # 初始化默认配置
+    with redirect_stdout(io.StringIO()):
+        new_manager()
+    with open(CONFIG_PATH, "a", encoding="utf-8") as f:
+        f.write(f"registry: {args.registry}\n")
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(i, args.ops, i * 7919, results))
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    expected = {name for _, alive, _ in outcomes for name in alive}
+    total_ops = sum(done for _, _, done in outcomes)
+    with redirect_stdout(io.StringIO()):
+        actual = set(new_manager().registry.names())
+
+    print(f"注册表: {args.registry}, 进程数: {args.workers}, 每进程操作数: {args.ops}")
+    print(f"总操作数: {total_ops}, 耗时: {elapsed:.2f} s, 吞吐量: {total_ops / elapsed:.1f} ops/s")
+
+    lost = expected - actual
+    extra = actual - expected
+    corrupt = list(ENV_STATE_PATH.parent.glob("env.yaml.corrupt-*"))
+    if lost or extra or corrupt:
+        print(f"✗ 状态不一致: 丢失 {sorted(lost)}, 多出 {sorted(extra)}, 损坏备份 {corrupt}")
+        return 1
+    print(f"✓ 最终 {len(actual)} 个环境与各进程的操作结果一致，没有丢失的更新")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        shutil.rmtree(TMP_HOME, ignore_errors=True)
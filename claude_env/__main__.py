@@ -2,6 +2,7 @@
 # claude_env/__main__.py
 # 允许通过 `python -m claude_env` 运行
 
-from claude_env.cli import app
+# 优先通过轻量客户端分发 (守护进程运行时无需导入 Typer / Rich)
+from claude_env.client import main
 
-app()
+main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# claude_env/archive.py
+# 描述: 冷环境归档 (claude_env archive)
+# 长期未使用的环境被打包为 base_dir/.archive/<env>.tar.xz (或 .tar.gz) 并删除展开的目录；
+# switch / exec 时以流式解压恢复。所有操作在 state_lock 内进行，
+# 环境目录只通过 rename(2) 整体出现或消失，中断后不会留下半个环境。
+
+import os
+import json
+import time
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from claude_env.config import ARCHIVE_STATE_PATH
+from claude_env.utils import atomic_write_text
+
+ARCHIVE_DIR_NAME = ".archive"
+# 归档/恢复过程中使用的临时目录前缀 (中断后由 cleanup_leftovers 清理)
+_ARCHIVING_PREFIX = ".archiving-"
+_RESTORING_PREFIX = ".restoring-"
+
+
+def load_archive_state() -> dict:
+    """
+    格式: {env_name: {"file": ..., "archived_at": ..., "bytes_before": ..., "archive_bytes": ...}}
+    """
+    try:
+        with open(ARCHIVE_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_archive_state(state: dict):
+    atomic_write_text(ARCHIVE_STATE_PATH, json.dumps(state, ensure_ascii=False))
+
+
+def archive_path(base_dir: Path, file_name: str) -> Path:
+    return base_dir / ARCHIVE_DIR_NAME / file_name
+
+
+def exclusive_bytes(env_dir: Path) -> int:
+    """
+    统计环境目录中独占的数据量。
+    nlink > 1 的文件 (去重对象或克隆共享) 删除后空间并不会释放，不计入。
+    """
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(env_dir):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            if st.st_nlink == 1:
+                total += st.st_blocks * 512
+    return total
+
+
+def cleanup_leftovers(base_dir: Path):
+    """
+    删除被中断的归档/恢复留下的临时目录和文件 (调用方需持有 state_lock)
+    """
+    for entry in os.scandir(base_dir):
+        if entry.name.startswith((_ARCHIVING_PREFIX, _RESTORING_PREFIX)):
+            shutil.rmtree(entry.path, ignore_errors=True)
+    archive_dir = base_dir / ARCHIVE_DIR_NAME
+    if archive_dir.is_dir():
+        for entry in os.scandir(archive_dir):
+            if ".tmp-" in entry.name:
+                os.unlink(entry.path)
+
+
+def archive_env(base_dir: Path, env_name: str, compression: str) -> dict:
+    """
+    把环境目录打包为压缩包并删除展开的目录，返回要写入归档状态的条目
+    """
+    env_dir = base_dir / env_name
+    bytes_before = exclusive_bytes(env_dir)
+    file_name = f"{env_name}.tar.{compression}"
+    final_path = archive_path(base_dir, file_name)
+    tmp_path = final_path.with_name(f"{file_name}.tmp-{os.getpid()}")
+    os.makedirs(final_path.parent, exist_ok=True)
+
+    with open(tmp_path, "wb") as raw:
+        # symlink (共享层链接等) 按原样保存，不跟随
+        with tarfile.open(fileobj=raw, mode=f"w:{compression}") as tar:
+            tar.add(env_dir, arcname=env_name)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, final_path)
+
+    # 先整体移走再删除: 即使删除中断，base_dir/<env> 也不会是残缺的目录
+    doomed = base_dir / f"{_ARCHIVING_PREFIX}{env_name}-{os.getpid()}"
+    os.replace(env_dir, doomed)
+    shutil.rmtree(doomed, ignore_errors=True)
+
+    return {
+        "file": file_name,
+        "archived_at": time.time(),
+        "bytes_before": bytes_before,
+        "archive_bytes": final_path.stat().st_size,
+    }
+
+
+class _CountingReader:
+    """
+    包装文件对象，统计已读取的 (压缩) 字节数用于显示进度
+    """
+
+    def __init__(self, f, on_read: Callable[[int], None]):
+        self._f = f
+        self._on_read = on_read
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._on_read(len(data))
+        return data
+
+
+def rehydrate_env(
+    base_dir: Path,
+    env_name: str,
+    entry: dict,
+    on_progress: Optional[Callable[[int], None]] = None,
+):
+    """
+    以流式方式解压归档的环境 (不需要随机访问压缩包)，完成后删除压缩包。
+    on_progress 接收每次读取的压缩字节数。
+    """
+    src = archive_path(base_dir, entry["file"])
+    staging = base_dir / f"{_RESTORING_PREFIX}{env_name}-{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    try:
+        with open(src, "rb") as raw:
+            reader = _CountingReader(raw, on_progress or (lambda n: None))
+            with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                for member in tar:
+                    if member.name != env_name and not member.name.startswith(
+                        env_name + "/"
+                    ):
+                        raise tarfile.ExtractError(f"压缩包中包含意外的路径: {member.name}")
+                    tar.extract(member, staging, filter="tar")
+        os.replace(staging / env_name, base_dir / env_name)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    src.unlink(missing_ok=True)
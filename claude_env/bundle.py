@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# claude_env/bundle.py
+# 描述: 环境的流式导出/导入 (claude_env export / import)
+# bundle 是一个 tar.gz 流: 第一个成员是清单 MANIFEST.json，之后是 files/<相对路径>。
+# 写入和读取都使用流模式 (w|gz / r|*)，可以直接通过管道和 ssh 传输，不需要暂存目录。
+# 增量模式只发送相对于上一个 bundle 清单发生变化的文件，并在清单中列出被删除的文件。
+
+import os
+import io
+import json
+import time
+import uuid
+import fnmatch
+import shutil
+import tarfile
+from pathlib import Path
+from typing import IO, Optional
+
+from claude_env.config import BUNDLE_STATE_PATH
+from claude_env.utils import atomic_write_text, is_reserved_env_name
+
+MANIFEST_NAME = "MANIFEST.json"
+FILES_PREFIX = "files/"
+BUNDLE_FORMAT = 1
+
+
+class BundleError(Exception):
+    pass
+
+
+def load_bundle_state() -> dict:
+    try:
+        with open(BUNDLE_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_bundle_state(state: dict):
+    atomic_write_text(BUNDLE_STATE_PATH, json.dumps(state, ensure_ascii=False))
+
+
+def _matches(rel: str, patterns: list[str]) -> bool:
+    """
+    pattern 可以是路径前缀 (匹配整个子树) 或 fnmatch 通配符
+    """
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if rel == pattern or rel.startswith(pattern + "/") or fnmatch.fnmatch(rel, pattern):
+            return True
+    return False
+
+
+def scan_env(
+    env_dir: Path, include: list[str], exclude: list[str], follow: list[str]
+) -> dict:
+    """
+    扫描环境目录，返回 {相对路径: [size, mtime_ns] 或 ["symlink", target]}。
+    follow 中的路径若是符号链接 (共享层) 则导出其内容，使 bundle 在另一台机器上自包含。
+    """
+    files = {}
+    follow_set = {p.rstrip("/") for p in follow}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(env_dir / rel_dir) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                if exclude and _matches(rel, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=rel in follow_set):
+                    stack.append(rel)
+                    continue
+                if include and not _matches(rel, include):
+                    continue
+                if entry.is_symlink():
+                    files[rel] = ["symlink", os.readlink(entry.path)]
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files[rel] = [st.st_size, st.st_mtime_ns]
+    return files
+
+
+def new_bundle_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def build_manifest(env_name: str, files: dict, base: Optional[dict]) -> dict:
+    """
+    生成清单。base 为上一个 bundle 的清单时生成增量清单。
+    """
+    if base is not None:
+        if base.get("env") != env_name:
+            raise BundleError(
+                f"基准清单属于环境 '{base.get('env')}'，不是 '{env_name}'"
+            )
+        base_files = base.get("files", {})
+        changed = [rel for rel, sig in files.items() if base_files.get(rel) != sig]
+        deleted = [rel for rel in base_files if rel not in files]
+    else:
+        changed = list(files)
+        deleted = []
+    return {
+        "format": BUNDLE_FORMAT,
+        "env": env_name,
+        "id": new_bundle_id(),
+        "base": base.get("id") if base is not None else None,
+        "created_at": time.time(),
+        "files": files,
+        "changed": sorted(changed),
+        "deleted": sorted(deleted),
+    }
+
+
+def write_bundle(env_dir: Path, manifest: dict, out: IO[bytes]) -> int:
+    """
+    以流模式把清单和变化的文件写入 out，返回写入的文件内容字节数
+    """
+    total = 0
+    with tarfile.open(fileobj=out, mode="w|gz") as tar:
+        data = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        info.mtime = int(manifest["created_at"])
+        tar.addfile(info, io.BytesIO(data))
+        for rel in manifest["changed"]:
+            path = env_dir / rel
+            sig = manifest["files"][rel]
+            if sig[0] == "symlink":
+                info = tarfile.TarInfo(FILES_PREFIX + rel)
+                info.type = tarfile.SYMTYPE
+                info.linkname = sig[1]
+                tar.addfile(info)
+                continue
+            # 经由共享层链接的文件按其内容导出
+            info = tar.gettarinfo(os.path.realpath(path), arcname=FILES_PREFIX + rel)
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+            total += info.size
+    return total
+
+
+def read_manifest(path: Path) -> dict:
+    """
+    读取清单: 可以是单独的 manifest JSON，也可以是 bundle 文件 (只读取第一个成员)
+    """
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path, mode="r|*") as tar:
+            member = tar.next()
+            if member is None or member.name != MANIFEST_NAME:
+                raise BundleError(f"{path} 不是有效的 bundle")
+            return json.load(tar.extractfile(member))
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def import_bundle(
+    base_dir: Path, stream: IO[bytes], env_name: Optional[str], exists: callable
+) -> tuple[dict, str, int]:
+    """
+    从流中导入一个 bundle (调用方需持有 state_lock)。
+    完整 bundle 创建新环境；增量 bundle 要求目标环境最近一次导入的正是它的基准。
+    exists(name) 判断环境是否已注册。返回 (清单, 环境名称, 写入的文件数)。
+    """
+    staging = base_dir / f".importing-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            member = tar.next()
+            if member is None or member.name != MANIFEST_NAME:
+                raise BundleError("输入不是有效的 bundle (缺少清单)")
+            manifest = json.load(tar.extractfile(member))
+            if manifest.get("format") != BUNDLE_FORMAT:
+                raise BundleError(f"不支持的 bundle 格式: {manifest.get('format')}")
+
+            name = env_name or manifest["env"]
+            if is_reserved_env_name(name) or "/" in name:
+                raise BundleError(f"'{name}' 不能用作环境名称")
+            state = load_bundle_state()
+            if manifest["base"] is None:
+                if exists(name) or (base_dir / name).exists():
+                    raise BundleError(f"环境 '{name}' 已存在")
+            else:
+                if not exists(name):
+                    raise BundleError(f"增量 bundle 需要已存在的环境 '{name}'")
+                if state.get(name) != manifest["base"]:
+                    raise BundleError(
+                        f"增量 bundle 的基准是 {manifest['base']}，"
+                        f"但环境 '{name}' 最近导入的是 {state.get(name)}"
+                    )
+
+            count = 0
+            for member in tar:
+                if member.name == MANIFEST_NAME:
+                    continue  # 流模式下迭代会先返回已读取的清单
+                if not member.name.startswith(FILES_PREFIX):
+                    raise BundleError(f"bundle 中包含意外的路径: {member.name}")
+                tar.extract(member, staging, filter="tar")
+                count += 1
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    extracted = staging / FILES_PREFIX.rstrip("/")
+    env_dir = base_dir / name
+    try:
+        if manifest["base"] is None:
+            os.makedirs(extracted, exist_ok=True)
+            os.replace(extracted, env_dir)
+        else:
+            for rel in manifest["changed"]:
+                dest = env_dir / rel
+                os.makedirs(dest.parent, exist_ok=True)
+                if dest.is_dir() and not dest.is_symlink():
+                    shutil.rmtree(dest)
+                os.replace(extracted / rel, dest)
+            for rel in manifest["deleted"]:
+                try:
+                    os.unlink(env_dir / rel)
+                except FileNotFoundError:
+                    pass
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    state[name] = manifest["id"]
+    save_bundle_state(state)
+    return manifest, name, count
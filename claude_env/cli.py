@@ -4,9 +4,13 @@
 
 import typer
 from rich.console import Console
+from typing import TYPE_CHECKING, List, Optional
 from typing_extensions import Annotated
 
-from claude_env.manager import EnvironmentManager
+if TYPE_CHECKING:
+    # 仅用于类型标注；实际在 main_callback 中按需导入，
+    # 这样 --help 等不需要 manager 的调用不会加载 Pydantic / PyYAML
+    from claude_env.manager import EnvironmentManager
 
 # --- 初始化 Typer 应用和 Rich Console ---
 app = typer.Typer(
@@ -16,6 +20,9 @@ app = typer.Typer(
 )
 console = Console()
 
+daemon_app = typer.Typer(help="管理常驻守护进程 (加速 status / list)")
+app.add_typer(daemon_app, name="daemon")
+
 
 # --- Typer 回调 ---
 @app.callback(invoke_without_command=True)
@@ -26,6 +33,8 @@ def main_callback(ctx: typer.Context):
     2. 将 manager 实例存储在上下文中，供子命令使用。
     """
     try:
+        from claude_env.manager import EnvironmentManager
+
         manager = EnvironmentManager()
         # manager.init_manager()  # 运行初始化逻辑 <-- [删除] 不再自动初始化
         ctx.obj = manager  # 将 manager 传递给子命令
@@ -62,24 +71,46 @@ def add_env(
     env_name: Annotated[
         str, typer.Argument(help="要创建的新环境的名称 (例如: 'personal' 或 'work')")
     ],
+    from_env: Annotated[
+        Optional[str],
+        typer.Option("--from", help="从已有环境克隆 (写时复制，不复制登录凭据)"),
+    ] = None,
 ):
     """
-    添加一个新环境并切换到该空白环境。
+    添加一个新环境并切换到该空白环境 (或指定环境的克隆)。
     """
     manager: EnvironmentManager = ctx.obj
-    manager.add(env_name)
+    manager.add(env_name, from_env=from_env)
 
 
 @app.command("switch")
 def switch_env(
     ctx: typer.Context,
-    env_name: Annotated[str, typer.Argument(help="要切换到的环境名称")],
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="要切换到的环境名称")
+    ] = None,
+    fastest: Annotated[
+        bool,
+        typer.Option("--fastest", help="切换到 endpoint 延迟最低的 API Key 环境 (见 probe)"),
+    ] = False,
+    refresh: Annotated[
+        bool, typer.Option("--refresh", help="与 --fastest 一起使用: 忽略缓存，重新测量")
+    ] = False,
 ):
     """
     切换到指定的已保存环境。
     """
     manager: EnvironmentManager = ctx.obj
-    manager.switch(env_name)
+    if fastest:
+        if env_name:
+            manager.console.print("[bold red]错误[/bold red]: --fastest 不能与环境名称同时使用。")
+            raise typer.Exit(code=1)
+        manager.switch_fastest(refresh=refresh)
+    elif env_name:
+        manager.switch(env_name)
+    else:
+        manager.console.print("[bold red]错误[/bold red]: 请指定环境名称或使用 --fastest。")
+        raise typer.Exit(code=1)
 
 
 @app.command("rename")
@@ -95,12 +126,31 @@ def rename_env(
 
 
 @app.command("list")
-def list_envs(ctx: typer.Context):
+def list_envs(
+    ctx: typer.Context,
+    show_size: Annotated[
+        bool, typer.Option("--size", "-s", help="显示每个环境的磁盘占用")
+    ] = False,
+):
     """
     列出所有已保存的环境。
     """
     manager: EnvironmentManager = ctx.obj
-    manager.list_envs()
+    manager.list_envs(show_size=show_size)
+
+
+@app.command("current")
+def current_env(
+    auth: Annotated[
+        bool, typer.Option("--auth", help="附加认证状态标记 (来自元数据缓存)")
+    ] = False,
+):
+    """
+    输出当前激活环境的名称 (适用于 PS1 / tmux 状态栏)。
+    """
+    from claude_env.prompt import main as current_main
+
+    raise typer.Exit(code=current_main(["--auth"] if auth else []))
 
 
 @app.command("save")
@@ -121,6 +171,280 @@ def status(ctx: typer.Context):
     manager.status()
 
 
+@app.command("watch")
+def watch_env(
+    ctx: typer.Context,
+    interval: Annotated[
+        float, typer.Option(help="轮询模式下的检查间隔 (秒)")
+    ] = 1.0,
+    poll: Annotated[
+        bool, typer.Option("--poll", help="强制使用 stat 轮询 (不使用 inotify)")
+    ] = False,
+):
+    """
+    监听链接，被 Claude Code 覆盖后自动收回内容并恢复链接。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.watch(interval=interval, force_poll=poll)
+
+
+@app.command("du")
+def disk_usage(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="只统计指定环境 (显示完整明细)")
+    ] = None,
+    refresh: Annotated[
+        bool, typer.Option("--refresh", help="忽略目录缓存，完整重新扫描")
+    ] = False,
+):
+    """
+    显示各环境的磁盘占用及主要子目录 (projects、todos 等)。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.du(env_name, refresh=refresh)
+
+
+@app.command("prune")
+def prune_transcripts(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="只清理指定环境 (默认清理全部)")
+    ] = None,
+    older_than: Annotated[
+        Optional[int],
+        typer.Option("--older-than", min=1, help="删除超过 N 天未修改的对话记录"),
+    ] = None,
+    keep: Annotated[
+        Optional[int],
+        typer.Option("--keep", min=1, help="每个项目只保留最新的 N 个对话记录"),
+    ] = None,
+    max_size: Annotated[
+        Optional[int],
+        typer.Option("--max-size", min=1, help="每个环境的对话记录最多保留 N MB"),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option("--dry-run", help="只统计将被删除的文件和可回收的空间")
+    ] = False,
+):
+    """
+    按年龄 / 数量 / 总量策略清理 .claude/projects 中的对话记录。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.prune(
+        env_name,
+        older_than_days=older_than,
+        keep=keep,
+        max_size_mb=max_size,
+        dry_run=dry_run,
+    )
+
+
+@app.command("usage")
+def show_usage(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="只统计指定环境 (默认统计全部并按环境汇总)")
+    ] = None,
+    days: Annotated[
+        Optional[int], typer.Option("--days", min=1, help="只统计最近 N 天")
+    ] = None,
+):
+    """
+    从本地对话记录统计 token 用量 (按天 / 模型)，只增量解析新追加的内容。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.usage(env_name, days=days)
+
+
+@app.command("proxy")
+def run_proxy(
+    ctx: typer.Context,
+    env_names: Annotated[
+        Optional[List[str]],
+        typer.Argument(help="参与负载均衡的环境 (默认所有 API Key 环境)"),
+    ] = None,
+    host: Annotated[
+        Optional[str], typer.Option("--host", help="监听地址 (默认 proxy_host)")
+    ] = None,
+    port: Annotated[
+        Optional[int], typer.Option("--port", "-p", help="监听端口 (默认 proxy_port)")
+    ] = None,
+):
+    """
+    启动本地负载均衡代理，把 API 请求分摊到多个 API Key 环境。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.proxy(env_names or [], host=host, port=port)
+
+
+@app.command("probe")
+def probe_endpoints(
+    ctx: typer.Context,
+    env_names: Annotated[
+        Optional[List[str]],
+        typer.Argument(help="要测量的环境 (默认所有 API Key 环境)"),
+    ] = None,
+    refresh: Annotated[
+        bool, typer.Option("--refresh", help="忽略缓存，重新测量")
+    ] = False,
+):
+    """
+    并发测量各环境 endpoint 的连接 / TLS / 首字节时间，并按速度排序。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.probe(env_names or [], refresh=refresh)
+
+
+@app.command("archive")
+def archive_envs(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="只归档指定环境 (默认按策略选择)")
+    ] = None,
+    days: Annotated[
+        Optional[int],
+        typer.Option(
+            "--days", min=1, help="归档超过 N 天未使用的环境 (默认 archive_after_days)"
+        ),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option("--dry-run", help="只列出将被归档的环境")
+    ] = False,
+):
+    """
+    将长期未使用的环境打包压缩，switch 时自动解压恢复。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.archive(env_name, days=days, dry_run=dry_run)
+
+
+@app.command("snapshot")
+def snapshot_env(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="环境名称 (默认当前环境)")
+    ] = None,
+    list_only: Annotated[
+        bool, typer.Option("--list", "-l", help="列出已有快照而不是创建新快照")
+    ] = False,
+):
+    """
+    为环境创建快照 (reflink/硬链接，与环境共享未改变的文件)。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.snapshot(env_name, list_only=list_only)
+
+
+@app.command("restore")
+def restore_env(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="环境名称 (默认当前环境)")
+    ] = None,
+    snapshot_id: Annotated[
+        Optional[str], typer.Option("--id", help="快照 ID (默认最新的快照)")
+    ] = None,
+):
+    """
+    将环境恢复到某个快照，只重写有差异的文件。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.restore(env_name, snapshot_id=snapshot_id)
+
+
+@app.command("export")
+def export_env(
+    ctx: typer.Context,
+    env_name: Annotated[str, typer.Argument(help="要导出的环境名称")],
+    output: Annotated[
+        str,
+        typer.Option(
+            "--output", "-o", help="输出: '-' 为 stdout，或文件路径，或目录 (自动增量)"
+        ),
+    ] = "-",
+    since: Annotated[
+        Optional[str],
+        typer.Option("--since", help="增量导出的基准 (清单 JSON 或之前的 bundle)"),
+    ] = None,
+    include: Annotated[
+        Optional[List[str]], typer.Option("--include", help="只导出匹配的路径 (可重复)")
+    ] = None,
+    exclude: Annotated[
+        Optional[List[str]], typer.Option("--exclude", help="额外排除的路径 (可重复)")
+    ] = None,
+    manifest_out: Annotated[
+        Optional[str],
+        typer.Option("--manifest", help="同时把清单写到该文件，供下次 --since 使用"),
+    ] = None,
+):
+    """
+    将环境导出为流式 bundle (tar.gz)，可直接通过管道或 ssh 传输。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.export_env(
+        env_name,
+        output=output,
+        since=since,
+        include=include,
+        exclude=exclude,
+        manifest_out=manifest_out,
+    )
+
+
+@app.command("import")
+def import_env(
+    ctx: typer.Context,
+    source: Annotated[
+        str, typer.Argument(help="bundle 文件、export 使用的目录，或 '-' (stdin)")
+    ] = "-",
+    env_name: Annotated[
+        Optional[str], typer.Option("--name", help="导入为指定的环境名称")
+    ] = None,
+):
+    """
+    导入 export 生成的 bundle (完整或增量)。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.import_env(source, env_name=env_name)
+
+
+@app.command("exec")
+def exec_env(
+    ctx: typer.Context,
+    env_name: Annotated[str, typer.Argument(help="要使用的环境名称")],
+    command: Annotated[List[str], typer.Argument(help="要运行的命令 (写在 -- 之后)")],
+):
+    """
+    在指定环境中运行命令，不切换全局环境 (例如: exec work -- claude)。
+    """
+    manager: EnvironmentManager = ctx.obj
+    raise typer.Exit(code=manager.exec_in_env(env_name, command))
+
+
+@app.command("dedup")
+def dedup_envs(
+    ctx: typer.Context,
+    env_name: Annotated[
+        Optional[str], typer.Argument(help="只处理指定环境 (默认处理全部)")
+    ] = None,
+):
+    """
+    跨环境去重：内容相同的文件共享同一份对象 (reflink 或硬链接)。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.dedup(env_name)
+
+
+@app.command("gc")
+def gc_objects(ctx: typer.Context):
+    """
+    删除去重对象存储中不再被引用的对象。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.gc()
+
+
 @app.command("set-api")
 def set_api_key(
     ctx: typer.Context,
@@ -146,6 +470,18 @@ def remove_env(
     manager.remove(env_name)
 
 
+@app.command("undo-remove")
+def undo_remove_env(
+    ctx: typer.Context,
+    env_name: Annotated[str, typer.Argument(help="要恢复的环境名称")],
+):
+    """
+    撤销 remove，从回收站中恢复环境。
+    """
+    manager: EnvironmentManager = ctx.obj
+    manager.undo_remove(env_name)
+
+
 @app.command("uninstall")
 def uninstall_app(
     ctx: typer.Context,
@@ -155,3 +491,39 @@ def uninstall_app(
     """
     manager: EnvironmentManager = ctx.obj
     manager.uninstall()
+
+
+@daemon_app.command("start")
+def daemon_start(
+    detach: Annotated[
+        bool, typer.Option("--detach", "-d", help="在后台运行")
+    ] = False,
+):
+    """
+    启动守护进程，通过 Unix socket 为 status / list 提供服务。
+    """
+    from claude_env import daemon
+
+    if daemon.is_running():
+        console.print("[yellow]守护进程已在运行[/yellow]")
+        return
+
+    if detach:
+        daemon.start_detached()
+        console.print(f"[green]✓ 守护进程已在后台启动:[/green] {daemon.SOCKET_PATH}")
+    else:
+        console.print(f"守护进程正在监听: {daemon.SOCKET_PATH} [dim](Ctrl+C 退出)[/dim]")
+        daemon.serve()
+
+
+@daemon_app.command("stop")
+def daemon_stop():
+    """
+    停止正在运行的守护进程。
+    """
+    from claude_env import daemon
+
+    if daemon.stop():
+        console.print("[green]✓ 守护进程已停止[/green]")
+    else:
+        console.print("[yellow]守护进程未运行[/yellow]")
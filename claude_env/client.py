@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# claude_env/client.py
+# 描述: 轻量客户端入口
+# 只导入标准库。如果常驻守护进程 (claude_env daemon start) 正在运行，
+# 只读命令 (status / list) 通过 Unix socket 交给它执行；
+# 守护进程不可用时，status 先尝试只用标准库的快速路径 (claude_env/status.py)，
+# 再和 list 一样直接在进程内调用 EnvironmentManager (跳过 Typer)；
+# 其他命令退回到完整的 Typer 应用。
+# `current` 由 claude_env/prompt.py 处理，不导入 socket。
+
+import os
+import sys
+
+# 注意：不能从 claude_env.config 导入，那会引入 PyYAML / Pydantic
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".claude_env", "daemon.sock")
+
+# 可以交给守护进程执行的命令 (无交互、无参数)
+DAEMON_COMMANDS = {"status", "list"}
+
+
+def _terminal_width() -> int:
+    try:
+        # 伪终端可能报告 0 列
+        return os.get_terminal_size(sys.stdout.fileno()).columns or 80
+    except (OSError, ValueError):
+        return 80
+
+
+def send_request(request: dict, timeout: float = 5.0) -> dict:
+    """
+    向守护进程发送一行 JSON 请求，读取 JSON 响应。
+    守护进程不可用时抛出 OSError。
+    """
+    import json
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(SOCKET_PATH)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+def run_via_daemon(argv: list[str]) -> int | None:
+    """
+    尝试通过守护进程执行命令，返回退出码；无法交给守护进程时返回 None
+    """
+    if len(argv) != 1 or argv[0] not in DAEMON_COMMANDS:
+        return None
+    if not os.path.exists(SOCKET_PATH):
+        return None
+    try:
+        response = send_request(
+            {
+                "argv": argv,
+                "width": _terminal_width(),
+                "color": sys.stdout.isatty(),
+            }
+        )
+    except (OSError, ValueError):
+        return None
+    sys.stdout.write(response.get("output", ""))
+    sys.stdout.flush()
+    return int(response.get("code", 0))
+
+
+def run_in_process(argv: list[str]) -> int | None:
+    """
+    status / list 的进程内快速路径：不导入 Typer，直接调用 EnvironmentManager
+    """
+    if len(argv) != 1 or argv[0] not in DAEMON_COMMANDS:
+        return None
+
+    if argv[0] == "status":
+        from claude_env.status import run_status
+
+        code = run_status(_terminal_width(), sys.stdout.isatty())
+        if code is not None:
+            return code
+
+    from claude_env.manager import EnvironmentManager
+
+    manager = EnvironmentManager()
+    if argv[0] == "status":
+        manager.status()
+    else:
+        manager.list_envs()
+    return 0
+
+
+def main():
+    argv = sys.argv[1:]
+    if argv[:1] == ["current"]:
+        from claude_env.prompt import main as current_main
+
+        sys.exit(current_main(argv[1:]))
+
+    code = run_via_daemon(argv)
+    if code is None:
+        code = run_in_process(argv)
+    if code is not None:
+        sys.exit(code)
+
+    from claude_env.cli import app
+
+    app()
+
+
+if __name__ == "__main__":
+    main()
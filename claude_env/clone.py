@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# claude_env/clone.py
+# 描述: 环境克隆 (claude_env add <name> --from <env>)
+# 优先使用 reflink (写时复制，几乎不占额外空间)；文件系统不支持时退回到硬链接，
+# 并记录共享的文件及其克隆时的 stat 签名。硬链接无法拦截写入，因此只在保存环境时
+# (switch 离开、exec 结束、watch 修复链接) 检查这些文件：被写入过的才拆分出独立副本，
+# 共享的 inode 截断回克隆时的长度，其他环境看到的仍是原来的内容 (split_written_shared)。
+# 对话记录等只追加的文件可以这样完整恢复；原地改写的文件无法恢复，拆分时给出警告。
+
+import os
+import json
+import stat
+from pathlib import Path
+from typing import Optional
+
+from claude_env.config import SHARED_FILES_DIR
+from claude_env.models import CloneStats
+from claude_env.utils import atomic_write_text, fast_copy_file, reflink_file
+
+# 不复制的凭据文件 (相对于环境目录)
+CLONE_EXCLUDE = {".claude/.credentials.json"}
+
+# 克隆 .claude.json 时移除的认证字段，新环境需要重新登录或配置 API Key
+CREDENTIAL_KEYS = {
+    "apiKey",
+    "api_key",
+    "primaryApiKey",
+    "customApiKeyResponses",
+    "token",
+    "accessToken",
+    "oauthAccount",
+    "userID",
+    "user",
+}
+
+
+def _shared_list_path(env_name: str) -> Path:
+    return SHARED_FILES_DIR / f"{env_name}.json"
+
+
+def load_shared_paths(env_name: str) -> dict[str, Optional[list[int]]]:
+    """
+    环境中以硬链接共享的文件: {相对路径: 克隆时的 [size, mtime_ns]}。
+    旧版本的列表格式没有签名 (None)，这些文件在下次检查时直接拆分。
+    """
+    try:
+        with open(_shared_list_path(env_name), "r", encoding="utf-8") as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if isinstance(paths, list):
+        return {rel: None for rel in paths if isinstance(rel, str)}
+    return paths if isinstance(paths, dict) else {}
+
+
+def save_shared_paths(env_name: str, paths: dict[str, Optional[list[int]]]):
+    if paths:
+        atomic_write_text(_shared_list_path(env_name), json.dumps(paths))
+    else:
+        _shared_list_path(env_name).unlink(missing_ok=True)
+
+
+def rename_shared_paths(old_name: str, new_name: str):
+    """
+    环境重命名时同步移动共享文件列表
+    """
+    try:
+        os.replace(_shared_list_path(old_name), _shared_list_path(new_name))
+    except FileNotFoundError:
+        pass
+
+
+def clone_env_dir(
+    src_dir: Path,
+    dest_dir: Path,
+    primary_config_file: str,
+    shareable_paths: list[str],
+) -> CloneStats:
+    """
+    将 src_dir 克隆为 dest_dir。
+    凭据文件被跳过，主配置文件 (.claude.json) 去掉认证字段后重写。
+    shareable_paths (即 dedup_paths) 下的文件只会被整体替换，硬链接可以长期共享，
+    不记入需要拆分的列表。
+    """
+    prefixes = tuple(p.rstrip("/") + "/" for p in shareable_paths)
+    stats = CloneStats()
+    use_reflink = True
+    os.makedirs(dest_dir, exist_ok=True)
+
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(src_dir / rel_dir) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                dest = dest_dir / rel
+                if rel in CLONE_EXCLUDE:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    os.makedirs(dest, exist_ok=True)
+                    stack.append(rel)
+                elif entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), dest)
+                elif entry.is_file(follow_symlinks=False):
+                    if rel == primary_config_file:
+                        _clone_primary_config(Path(entry.path), dest)
+                        continue
+                    src = Path(entry.path)
+                    if use_reflink and not reflink_file(src, dest):
+                        use_reflink = False
+                        stats.mode = "hardlink"
+                    if not use_reflink:
+                        os.link(src, dest)
+                    st = entry.stat(follow_symlinks=False)
+                    if not use_reflink and not rel.startswith(prefixes):
+                        stats.shared_paths[rel] = [st.st_size, st.st_mtime_ns]
+                    stats.files += 1
+                    stats.bytes += st.st_size
+    return stats
+
+
+def _clone_primary_config(src: Path, dest: Path):
+    """
+    复制 .claude.json，但去掉所有认证相关字段
+    """
+    try:
+        with open(src, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return  # 无法解析时不复制，新环境从空白配置开始
+    if not isinstance(data, dict):
+        return
+    data = {k: v for k, v in data.items() if k not in CREDENTIAL_KEYS}
+    atomic_write_text(
+        dest,
+        json.dumps(data, indent=2, ensure_ascii=False),
+        mode=os.stat(src).st_mode & 0o7777,
+    )
+
+
+def split_written_shared(base_dir: Path, env_name: str) -> tuple[int, int, list[str]]:
+    """
+    检查环境中与其他环境共享 (硬链接) 的文件，把自克隆以来被写入过的拆分成独立副本。
+    调用时 env_name 是刚刚被使用的环境，写入来自它：它得到包含新内容的副本，
+    仍共享的 inode 截断回克隆时的长度并恢复 mtime，其他环境回到写入前的内容。
+    返回 (拆分的文件数, 复制的字节数, 无法恢复原内容的文件)。
+    """
+    shared = load_shared_paths(env_name)
+    if not shared:
+        return 0, 0, []
+    env_dir = base_dir / env_name
+    remaining: dict[str, Optional[list[int]]] = {}
+    split: list[str] = []
+    copied = 0
+    unrecoverable: list[str] = []
+    for rel, signature in shared.items():
+        path = env_dir / rel
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink <= 1:
+            continue  # 已被删除、替换 (rename 产生新的 inode) 或另一方已拆分
+        if signature is not None and [st.st_size, st.st_mtime_ns] == signature:
+            remaining[rel] = signature
+            continue
+
+        # 在替换之前打开共享的 inode，替换后它只属于其他环境
+        try:
+            fd: Optional[int] = os.open(path, os.O_RDWR)
+        except PermissionError:
+            fd = None  # 只读文件: 只拆分，不恢复
+        try:
+            tmp_path = path.with_name(f".{path.name}.cow-{os.getpid()}")
+            fast_copy_file(path, tmp_path)
+            os.replace(tmp_path, path)
+            if fd is not None and signature is not None and st.st_size >= signature[0]:
+                # 只追加的写入: 截断掉新增的部分即得到原来的内容
+                os.ftruncate(fd, signature[0])
+                os.utime(fd, ns=(st.st_atime_ns, signature[1]))
+            else:
+                unrecoverable.append(rel)
+        finally:
+            if fd is not None:
+                os.close(fd)
+        split.append(rel)
+        copied += st.st_size
+    save_shared_paths(env_name, remaining)
+    if split:
+        _drop_unshared(base_dir, env_name, split)
+    return len(split), copied, unrecoverable
+
+
+def _drop_unshared(base_dir: Path, env_name: str, rels: list[str]):
+    """
+    从其他环境的共享列表中移除已不再共享的文件 (拆分后只剩一个链接)
+    """
+    try:
+        names = os.listdir(SHARED_FILES_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        other = name[: -len(".json")]
+        if not name.endswith(".json") or other == env_name:
+            continue
+        shared = load_shared_paths(other)
+        changed = False
+        for rel in rels:
+            if rel not in shared:
+                continue
+            try:
+                if os.lstat(base_dir / other / rel).st_nlink > 1:
+                    continue
+            except FileNotFoundError:
+                pass
+            del shared[rel]
+            changed = True
+        if changed:
+            save_shared_paths(other, shared)
@@ -4,8 +4,15 @@
 
 import os
 import sys
+import json
+import fcntl
+import shutil
+import threading
+import time
 import yaml
+from contextlib import contextmanager
 from claude_env.models import AppConfig, EnvState, CONFIG_ROOT_DIR
+from claude_env.utils import atomic_write_text, stat_signature
 
 # --- 确保 PyYAML 已安装 ---
 try:
@@ -18,6 +25,63 @@ except ImportError:
 # --- 配置文件路径 ---
 CONFIG_PATH = CONFIG_ROOT_DIR / "config.yaml"
 ENV_STATE_PATH = CONFIG_ROOT_DIR / "env.yaml"
+# config.yaml 的 stat 签名及解析出的目录布局，供 status 的快速路径 (claude_env/status.py) 使用
+LAYOUT_CACHE_PATH = CONFIG_ROOT_DIR / ".layout.json"
+# 环境元数据索引 (认证类型/用户/endpoint/可用性)，按 .claude.json 的 stat 签名失效
+PROFILE_INDEX_PATH = CONFIG_ROOT_DIR / "index.json"
+# 增量同步清单目录，每个环境一个 <env>.json
+SYNC_MANIFEST_DIR = CONFIG_ROOT_DIR / ".sync"
+# 去重状态: 每个环境中文件的 stat 签名 -> 内容哈希
+DEDUP_STATE_PATH = CONFIG_ROOT_DIR / ".dedup.json"
+# 克隆后以硬链接共享、尚未拆分的文件列表，每个环境一个 <env>.json
+SHARED_FILES_DIR = CONFIG_ROOT_DIR / ".cow"
+# 已归档环境的元数据 (压缩包名、大小、归档时间)
+ARCHIVE_STATE_PATH = CONFIG_ROOT_DIR / ".archive.json"
+# 每个环境最近一次导入的 bundle ID (增量导入时校验基准)
+BUNDLE_STATE_PATH = CONFIG_ROOT_DIR / ".bundles.json"
+# init 迁移的日志目录 (跨文件系统复制时用于断点续传)
+MIGRATE_JOURNAL_DIR = CONFIG_ROOT_DIR / ".migrate"
+# du 的目录缓存: 目录路径 -> [mtime_ns, 直接包含的文件占用, 子目录列表, 多链接文件 [dev, ino, 占用]]
+DU_CACHE_PATH = CONFIG_ROOT_DIR / ".du.json"
+# prune 的增量水位: 每个环境、每个对话目录上次检查时的 [目录 mtime, 最旧文件 mtime, 文件数]
+PRUNE_STATE_PATH = CONFIG_ROOT_DIR / ".prune.json"
+# usage 的检查点: 每个对话记录文件已解析到的字节偏移及其按天/模型的 token 统计
+USAGE_STATE_PATH = CONFIG_ROOT_DIR / ".usage.json"
+# probe 的结果缓存: 每个环境 endpoint 的各阶段延迟及测量时间
+LATENCY_CACHE_PATH = CONFIG_ROOT_DIR / ".latency.json"
+# registry: sqlite 模式下的环境注册表
+REGISTRY_DB_PATH = CONFIG_ROOT_DIR / "registry.db"
+# 跨进程状态锁 (fcntl.flock)
+STATE_LOCK_PATH = CONFIG_ROOT_DIR / ".lock"
+
+# 同一进程内可重入：flock 按打开的文件描述计数，重复加锁会和自己死锁
+_state_lock_guard = threading.RLock()
+_state_lock_depth = 0
+_state_lock_fd: "int | None" = None
+
+
+@contextmanager
+def state_lock():
+    """
+    获取跨进程的排他锁 (advisory, fcntl.flock)，所有状态修改都应在锁内进行。
+    读取不加锁：所有状态文件都通过 atomic_write_text 原子替换。
+    """
+    global _state_lock_depth, _state_lock_fd
+    with _state_lock_guard:
+        if _state_lock_depth == 0:
+            os.makedirs(CONFIG_ROOT_DIR, exist_ok=True)
+            fd = os.open(STATE_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            _state_lock_fd = fd
+        _state_lock_depth += 1
+        try:
+            yield
+        finally:
+            _state_lock_depth -= 1
+            if _state_lock_depth == 0:
+                fcntl.flock(_state_lock_fd, fcntl.LOCK_UN)
+                os.close(_state_lock_fd)
+                _state_lock_fd = None
 
 
 def load_config() -> AppConfig:
@@ -28,18 +92,50 @@ def load_config() -> AppConfig:
     if not CONFIG_PATH.is_file():
         print(f"未找到配置文件，正在创建默认配置: {CONFIG_PATH}")
         config = AppConfig()  # 从模型创建默认实例
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            yaml.dump(config.model_dump(mode="json"), f)
+        with state_lock():
+            if not CONFIG_PATH.is_file():  # 可能已被并发的调用创建
+                atomic_write_text(
+                    CONFIG_PATH, yaml.dump(config.model_dump(mode="json"))
+                )
+        _save_layout_cache(config)
         return config
 
     try:
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
             config_data = yaml.safe_load(f)
         # 使用 Pydantic 模型进行验证
-        return AppConfig(**config_data)
+        config = AppConfig(**config_data)
     except Exception as e:
         print(f"加载 config.yaml 出错: {e}。将使用默认配置。")
         return AppConfig()
+    _save_layout_cache(config)
+    return config
+
+
+def _save_layout_cache(config: AppConfig):
+    """
+    记录 config.yaml 的 stat 签名和其中的 base_dir / 主配置文件。
+    status 的快速路径只在签名一致时使用这份布局，因此不需要 PyYAML / Pydantic；
+    内容未变化时不写入。
+    """
+    signature = stat_signature(CONFIG_PATH)
+    if signature is None or not config.managed_paths:
+        return
+    layout = {
+        "config": list(signature),
+        "base_dir": str(config.base_dir),
+        "primary": str(config.managed_paths[0]),
+    }
+    try:
+        with open(LAYOUT_CACHE_PATH, "r", encoding="utf-8") as f:
+            if json.load(f) == layout:
+                return
+    except (OSError, ValueError):
+        pass
+    try:
+        atomic_write_text(LAYOUT_CACHE_PATH, json.dumps(layout, ensure_ascii=False))
+    except OSError:
+        pass  # 只是缓存，status 会退回到完整路径
 
 
 def load_env_state() -> EnvState:
@@ -50,15 +146,26 @@ def load_env_state() -> EnvState:
     if not ENV_STATE_PATH.is_file():
         print(f"未找到环境状态文件，正在创建: {ENV_STATE_PATH}")
         state = EnvState()  # 默认实例
-        save_env_state(state)
-        return state
+        with state_lock():
+            if not ENV_STATE_PATH.is_file():  # 可能已被并发的调用创建
+                save_env_state(state)
+                return state
+        return load_env_state()
 
     try:
         with open(ENV_STATE_PATH, "r", encoding="utf-8") as f:
             state_data = yaml.safe_load(f)
         return EnvState(**state_data)
     except Exception as e:
-        print(f"加载 env.yaml 出错: {e}。将使用默认状态。")
+        # 备份损坏的文件，避免下一次保存时把它覆盖掉而丢失所有环境
+        backup_path = ENV_STATE_PATH.with_name(
+            f"{ENV_STATE_PATH.name}.corrupt-{int(time.time())}"
+        )
+        try:
+            shutil.copy2(ENV_STATE_PATH, backup_path)
+            print(f"加载 env.yaml 出错: {e}。已备份到 {backup_path}，将使用默认状态。")
+        except OSError:
+            print(f"加载 env.yaml 出错: {e}。将使用默认状态。")
         return EnvState()
 
 
@@ -66,7 +173,27 @@ def save_env_state(state: EnvState):
     """
     将 EnvState Pydantic 模型实例保存回 env.yaml
     """
-    os.makedirs(CONFIG_ROOT_DIR, exist_ok=True)
-    with open(ENV_STATE_PATH, "w", encoding="utf-8") as f:
-        # Pydantic 的 .model_dump() 确保了数据是可序列化的
-        yaml.dump(state.model_dump(), f, default_flow_style=False)
+    # Pydantic 的 .model_dump() 确保了数据是可序列化的
+    atomic_write_text(
+        ENV_STATE_PATH, yaml.dump(state.model_dump(), default_flow_style=False)
+    )
+
+
+def load_profile_index() -> dict:
+    """
+    加载 index.json。格式: {env_name: {"signature": [...], "profile": {...}}}
+    文件不存在或损坏时返回空索引（只是缓存，丢失后会重新解析）。
+    """
+    try:
+        with open(PROFILE_INDEX_PATH, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        return index if isinstance(index, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_profile_index(index: dict):
+    """
+    将元数据索引写回 index.json
+    """
+    atomic_write_text(PROFILE_INDEX_PATH, json.dumps(index, ensure_ascii=False))
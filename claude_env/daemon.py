@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# claude_env/daemon.py
+# 描述: 常驻守护进程，将 EnvironmentManager 及其解析结果保留在内存中，
+# 通过 Unix socket 为轻量客户端 (claude_env/client.py) 执行只读命令。
+
+import io
+import os
+import json
+import threading
+import socketserver
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Optional
+
+from rich.console import Console
+
+from claude_env.client import SOCKET_PATH, DAEMON_COMMANDS, send_request
+from claude_env.config import CONFIG_PATH, ENV_STATE_PATH, REGISTRY_DB_PATH
+from claude_env.manager import EnvironmentManager
+
+SHUTDOWN_COMMAND = "__shutdown__"
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class ManagerCache:
+    """
+    持有一个 EnvironmentManager 实例。
+    config.yaml、env.yaml / registry.db 或环境目录 (base_dir) 发生变化时重新创建；
+    单个环境的 .claude.json 变化由元数据索引的 stat 签名自动处理。
+    """
+
+    def __init__(self):
+        self._manager: Optional[EnvironmentManager] = None
+        self._signature = None
+
+    def _current_signature(self, base_dir: Optional[Path]):
+        return (
+            _mtime(CONFIG_PATH),
+            _mtime(ENV_STATE_PATH),
+            _mtime(REGISTRY_DB_PATH),
+            _mtime(REGISTRY_DB_PATH.with_name(REGISTRY_DB_PATH.name + "-wal")),
+            _mtime(base_dir) if base_dir else None,
+        )
+
+    def get(self) -> EnvironmentManager:
+        base_dir = self._manager.config.base_dir if self._manager else None
+        signature = self._current_signature(base_dir)
+        if self._manager is None or signature != self._signature:
+            with redirect_stdout(io.StringIO()):
+                self._manager = EnvironmentManager()
+            self._signature = self._current_signature(self._manager.config.base_dir)
+        return self._manager
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv = request.get("argv", [])
+        except ValueError:
+            return
+
+        if argv == [SHUTDOWN_COMMAND]:
+            self._reply(0, "")
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        if len(argv) != 1 or argv[0] not in DAEMON_COMMANDS:
+            self._reply(2, f"守护进程不支持该命令: {' '.join(argv)}\n")
+            return
+
+        buffer = io.StringIO()
+        code = 0
+        try:
+            manager = self.server.cache.get()
+            manager.console = Console(
+                file=buffer,
+                width=int(request.get("width", 80)),
+                force_terminal=bool(request.get("color")),
+            )
+            with redirect_stdout(buffer):
+                if argv[0] == "status":
+                    manager.status()
+                elif argv[0] == "list":
+                    manager.list_envs()
+        except Exception as e:
+            buffer.write(f"守护进程执行失败: {e}\n")
+            code = 1
+        self._reply(code, buffer.getvalue())
+
+    def _reply(self, code: int, output: str):
+        self.wfile.write(json.dumps({"code": code, "output": output}).encode())
+
+
+class _DaemonServer(socketserver.UnixStreamServer):
+    def __init__(self, path: str):
+        super().__init__(path, _RequestHandler)
+        self.cache = ManagerCache()
+
+
+def is_running() -> bool:
+    """
+    检查是否有守护进程在监听 socket
+    """
+    try:
+        send_request({"argv": ["status"], "width": 80}, timeout=1.0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def serve():
+    """
+    在前台运行守护进程，直到收到 stop 请求或 Ctrl+C
+    """
+    os.makedirs(os.path.dirname(SOCKET_PATH), exist_ok=True)
+    if os.path.exists(SOCKET_PATH):
+        # 残留的 socket 文件 (上次未正常退出)
+        os.unlink(SOCKET_PATH)
+
+    server = _DaemonServer(SOCKET_PATH)
+    os.chmod(SOCKET_PATH, 0o600)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(SOCKET_PATH):
+            os.unlink(SOCKET_PATH)
+
+
+def start_detached():
+    """
+    以后台进程方式启动守护进程 (double fork，脱离终端)
+    """
+    if os.fork() > 0:
+        return
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        serve()
+    finally:
+        os._exit(0)
+
+
+def stop() -> bool:
+    """
+    请求正在运行的守护进程退出，返回是否成功发送
+    """
+    try:
+        send_request({"argv": [SHUTDOWN_COMMAND]}, timeout=2.0)
+        return True
+    except (OSError, ValueError):
+        return False
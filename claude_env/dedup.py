@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# claude_env/dedup.py
+# 描述: 跨环境的内容寻址去重存储
+# 对象保存在 base_dir/.objects/<hash[:2]>/<hash> (环境文件的独立副本)，
+# 各环境中内容相同的文件替换为指向同一对象的 reflink (写时复制) 或硬链接。
+# 增量: DEDUP_STATE_PATH 记录 {env: {relpath: [size, mtime_ns, inode, hash]}}，
+# stat 签名未变化的文件不会重新计算哈希。
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from claude_env.config import DEDUP_STATE_PATH
+from claude_env.models import DedupStats
+from claude_env.utils import atomic_write_text, fast_copy_file, reflink_file
+
+OBJECTS_DIR_NAME = ".objects"
+_HASH_CHUNK = 1024 * 1024
+
+
+def load_dedup_state() -> dict:
+    try:
+        with open(DEDUP_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_dedup_state(state: dict):
+    atomic_write_text(DEDUP_STATE_PATH, json.dumps(state, separators=(",", ":")))
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ObjectStore:
+    """
+    内容寻址的对象目录
+    """
+
+    def __init__(self, base_dir: Path):
+        self.objects_dir = base_dir / OBJECTS_DIR_NAME
+        self._reflink: Optional[bool] = None
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def supports_reflink(self) -> bool:
+        """
+        检测对象目录所在文件系统是否支持 reflink (只检测一次)
+        """
+        if self._reflink is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            probe = self.objects_dir / f".probe-{os.getpid()}"
+            clone = self.objects_dir / f".probe-{os.getpid()}.clone"
+            try:
+                probe.write_bytes(b"claude_env")
+                self._reflink = reflink_file(probe, clone)
+            finally:
+                probe.unlink(missing_ok=True)
+                clone.unlink(missing_ok=True)
+        return self._reflink
+
+    def store(self, path: Path, digest: str) -> bool:
+        """
+        把 path 的内容复制为对象 (支持 reflink 时不占用额外空间)。
+        对象总是独立的 inode，不会与环境中仍可能被原地写入的文件共用。
+        复制后重新计算哈希，path 在计算哈希之后被修改时不保存对象并返回 False。
+        """
+        obj = self.object_path(digest)
+        os.makedirs(obj.parent, exist_ok=True)
+        tmp_path = obj.with_name(f".{digest}.tmp-{os.getpid()}")
+        try:
+            fast_copy_file(path, tmp_path)
+            if hash_file(tmp_path) != digest:
+                return False
+            os.replace(tmp_path, obj)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return True
+
+    def verify(self, digest: str) -> bool:
+        """
+        硬链接模式下，对象与已链接的环境文件是同一个 inode，
+        环境中的原地写入会改变对象内容。链接新的文件之前重新计算哈希，
+        不一致时删除对象 (已链接的环境文件保留各自的数据) 并返回 False。
+        """
+        obj = self.object_path(digest)
+        if self.supports_reflink() or obj.stat().st_nlink == 1:
+            return True
+        if hash_file(obj) == digest:
+            return True
+        obj.unlink()
+        return False
+
+    def link_into(self, digest: str, path: Path):
+        """
+        用对象替换 path (先在同目录创建链接，再 rename 覆盖，过程是原子的)
+        """
+        obj = self.object_path(digest)
+        tmp_path = path.with_name(f".{path.name}.dedup-{os.getpid()}")
+        tmp_path.unlink(missing_ok=True)
+        if not (self.supports_reflink() and reflink_file(obj, tmp_path)):
+            os.link(obj, tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+
+def _unchanged(path: Path, st: os.stat_result) -> bool:
+    """
+    计算哈希之后文件没有被修改 (替换前再检查一次，避免覆盖刚写入的内容)
+    """
+    try:
+        now = path.stat()
+    except FileNotFoundError:
+        return False
+    return (now.st_ino, now.st_size, now.st_mtime_ns) == (
+        st.st_ino,
+        st.st_size,
+        st.st_mtime_ns,
+    )
+
+
+def dedup_env(
+    store: ObjectStore, env_dir: Path, dedup_paths: list[str], entries: dict
+) -> DedupStats:
+    """
+    对一个环境做增量去重。entries 为该环境上次的状态，会被原地更新。
+    """
+    stats = DedupStats()
+    seen: set[str] = set()
+    for rel_root in dedup_paths:
+        stack = [env_dir / rel_root]
+        while stack:
+            directory = stack.pop()
+            try:
+                it = os.scandir(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_size == 0:
+                        continue
+
+                    stats.files_scanned += 1
+                    path = Path(entry.path)
+                    rel = str(path.relative_to(env_dir))
+                    seen.add(rel)
+                    signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+                    previous = entries.get(rel)
+                    if previous and previous[:3] == signature:
+                        continue
+
+                    digest = hash_file(path)
+                    stats.files_hashed += 1
+                    obj = store.object_path(digest)
+                    try:
+                        obj_st = obj.stat()
+                    except FileNotFoundError:
+                        obj_st = None
+
+                    if obj_st is not None and not store.verify(digest):
+                        obj_st = None
+                    if obj_st is None:
+                        if not store.store(path, digest):
+                            continue  # 文件正在被写入，下次再处理
+                        if not store.supports_reflink() and _unchanged(path, st):
+                            # 硬链接模式: 环境文件也链接到对象，不多占一份空间
+                            store.link_into(digest, path)
+                    elif obj_st.st_ino != st.st_ino and _unchanged(path, st):
+                        store.link_into(digest, path)
+                        stats.files_linked += 1
+                        stats.bytes_saved += st.st_size
+
+                    st = path.stat()
+                    entries[rel] = [st.st_size, st.st_mtime_ns, st.st_ino, digest]
+
+    for rel in list(entries):
+        if rel not in seen:
+            del entries[rel]
+    return stats
+
+
+def collect_garbage(store: ObjectStore, state: dict, live_envs: list[str]) -> DedupStats:
+    """
+    删除不再被任何环境引用的对象。state 中已删除环境的条目会被移除。
+    """
+    stats = DedupStats()
+    for env_name in list(state):
+        if env_name not in live_envs:
+            del state[env_name]
+    referenced = {
+        entry[3] for entries in state.values() for entry in entries.values()
+    }
+
+    try:
+        buckets = list(os.scandir(store.objects_dir))
+    except FileNotFoundError:
+        return stats
+    for bucket in buckets:
+        if not bucket.is_dir(follow_symlinks=False):
+            continue
+        with os.scandir(bucket.path) as it:
+            for entry in it:
+                if entry.name in referenced:
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                os.unlink(entry.path)
+                stats.objects_removed += 1
+                # 硬链接模式下 nlink > 1 说明仍有环境文件共享这些数据块
+                if st.st_nlink == 1:
+                    stats.bytes_reclaimed += st.st_size
+    return stats
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# claude_env/du.py
+# 描述: 环境磁盘占用统计 (claude_env du / list --size)
+# 用线程池并发 scandir 各个目录；每个目录缓存 (mtime -> 直接包含的文件占用, 子目录列表, 硬链接)，
+# 目录 mtime 未变时只需一次 lstat，不再列目录、不再 stat 其中的文件。
+# 注意: 原地追加写入 (如对话记录 .jsonl) 不会改变所在目录的 mtime，
+# 这类增长要等目录本身变化或使用 --refresh 才会反映出来。
+
+import os
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from claude_env.config import DU_CACHE_PATH
+from claude_env.utils import atomic_write_text
+
+
+def load_du_cache() -> dict:
+    try:
+        with open(DU_CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_du_cache(cache: dict):
+    atomic_write_text(DU_CACHE_PATH, json.dumps(cache, separators=(",", ":")))
+
+
+def _scan_dir(path: str) -> tuple[list[str], int, list[list[int]]]:
+    """
+    列出单个目录，返回 (子目录名列表, 直接包含的文件占用字节, 多链接文件)。
+    st_nlink > 1 的文件 (克隆、去重、快照产生的硬链接) 不计入占用，
+    而是以 [st_dev, st_ino, 占用字节] 返回，由 scan_sizes 按 inode 只计一次。
+    """
+    own = 0
+    subdirs = []
+    links = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    # 按实际占用的块计算，与 du 一致；符号链接不跟随
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink > 1 and not entry.is_symlink():
+                        links.append([st.st_dev, st.st_ino, st.st_blocks * 512])
+                    else:
+                        own += st.st_blocks * 512
+                except OSError:
+                    continue
+    except OSError:
+        return [], 0, []
+    return subdirs, own, links
+
+
+def scan_sizes(
+    roots: list[Path], cache: dict, workers: int = 8
+) -> tuple[dict[str, int], dict[str, list], bool]:
+    """
+    并发扫描多个目录树。
+    主线程对每个目录做一次 lstat: mtime 与缓存一致时直接使用缓存并继续检查子目录，
+    否则把 scandir 交给线程池。
+    硬链接与 du 一样只计一次: 按 roots 的顺序、目录路径排序后，计入第一个包含它的目录。
+    返回 ({目录绝对路径: 直接包含的文件占用}, 本次访问到的目录的缓存, 缓存是否有变化)。
+    """
+    own_sizes: dict[str, int] = {}
+    links_by_dir: dict[str, list] = {}
+    new_cache: dict[str, list] = {}
+    changed = False
+    stack = [str(root) for root in roots]
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="claude_env_du") as pool:
+        while stack or pending:
+            while stack:
+                path = stack.pop()
+                try:
+                    mtime_ns = os.lstat(path).st_mtime_ns
+                except OSError:
+                    changed = True
+                    continue
+                cached = cache.get(path)
+                # 缓存条目: [mtime_ns, 占用, 子目录列表, 多链接文件]
+                if cached is not None and len(cached) == 4 and cached[0] == mtime_ns:
+                    own_sizes[path] = cached[1]
+                    if cached[3]:
+                        links_by_dir[path] = cached[3]
+                    new_cache[path] = cached
+                    stack.extend(os.path.join(path, name) for name in cached[2])
+                else:
+                    pending[pool.submit(_scan_dir, path)] = (path, mtime_ns)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, mtime_ns = pending.pop(future)
+                subdirs, own, links = future.result()
+                own_sizes[path] = own
+                if links:
+                    links_by_dir[path] = links
+                new_cache[path] = [mtime_ns, own, subdirs, links]
+                changed = True
+                stack.extend(os.path.join(path, name) for name in subdirs)
+
+    seen: set[tuple[int, int]] = set()
+    for root in map(str, roots):
+        prefix = root + os.sep
+        for path in sorted(p for p in links_by_dir if p == root or p.startswith(prefix)):
+            for dev, ino, size in links_by_dir[path]:
+                if (dev, ino) not in seen:
+                    seen.add((dev, ino))
+                    own_sizes[path] += size
+    return own_sizes, new_cache, changed
+
+
+def breakdown(root: Path, own_sizes: dict[str, int]) -> dict[str, int]:
+    """
+    按顶层子目录汇总一个环境的占用。.claude 下再细分一层 (projects、todos、shell-snapshots 等)。
+    直接位于根目录或 .claude 中的文件计入 "." / ".claude"。
+    """
+    result: dict[str, int] = {}
+    prefix = str(root) + os.sep
+    for path, size in own_sizes.items():
+        if path == str(root):
+            key = "."
+        elif path.startswith(prefix):
+            parts = path[len(prefix):].split(os.sep)
+            key = os.path.join(*parts[:2]) if parts[0] == ".claude" else parts[0]
+        else:
+            continue
+        result[key] = result.get(key, 0) + size
+    return result
+
+
+def format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} B" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# claude_env/latency.py
+# 描述: 并发测量各环境 apiEndpoint 的网络延迟 (claude_env probe / switch --fastest)
+# 每个 endpoint 用新连接采样若干次，分别记录 DNS、TCP 连接、TLS 握手和首字节时间 (TTFB)，
+# 所有 endpoint 在同一个事件循环中同时测量。结果缓存在 .latency.json，TTL 内重复调用不再发起请求。
+
+import ssl
+import json
+import socket
+import time
+import asyncio
+import statistics
+from typing import Optional
+from urllib.parse import urlsplit
+
+from claude_env.config import LATENCY_CACHE_PATH
+from claude_env.proxy import DEFAULT_ENDPOINT
+from claude_env.utils import atomic_write_text
+
+PHASES = ("dns", "connect", "tls", "ttfb")
+
+
+def load_latency_cache() -> dict:
+    """
+    格式: {env: {"endpoint": ..., "measured_at": 时间戳, "dns"/"connect"/"tls"/"ttfb"/"total": 毫秒,
+                 "samples": 成功的采样数, "error": 全部失败时的错误信息}}
+    """
+    try:
+        with open(LATENCY_CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_latency_cache(cache: dict):
+    atomic_write_text(LATENCY_CACHE_PATH, json.dumps(cache, indent=2, ensure_ascii=False))
+
+
+async def _sample(
+    endpoint: str, timeout: float, ssl_context: Optional[ssl.SSLContext]
+) -> dict[str, float]:
+    """
+    一次采样: 返回各阶段耗时 (秒)。HTTP endpoint 的 tls 为 0
+    """
+    url = urlsplit(endpoint)
+    tls = url.scheme == "https"
+    host = url.hostname
+    port = url.port or (443 if tls else 80)
+    loop = asyncio.get_running_loop()
+
+    async def measure() -> dict[str, float]:
+        start = time.perf_counter()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        address = infos[0][4]
+        reader, writer = await asyncio.open_connection(address[0], address[1])
+        connected = time.perf_counter()
+        try:
+            if tls:
+                await writer.start_tls(
+                    ssl_context or ssl.create_default_context(), server_hostname=host
+                )
+            handshaken = time.perf_counter()
+            # 不带认证的请求: 服务端通常直接返回 401/404，测到的是网络往返加最小的处理时间
+            writer.write(
+                f"HEAD {url.path.rstrip('/')}/ HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                f"User-Agent: claude_env-probe\r\nConnection: close\r\n\r\n".encode("latin-1")
+            )
+            await writer.drain()
+            if not await reader.read(1):
+                raise ConnectionError("连接被关闭，未收到响应")
+            first_byte = time.perf_counter()
+        finally:
+            writer.close()
+        return {
+            "dns": resolved - start,
+            "connect": connected - resolved,
+            "tls": handshaken - connected,
+            "ttfb": first_byte - handshaken,
+        }
+
+    return await asyncio.wait_for(measure(), timeout)
+
+
+async def probe_endpoint(
+    endpoint: str,
+    samples: int,
+    timeout: float,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> dict:
+    """
+    对一个 endpoint 依次采样 samples 次，返回各阶段的中位数 (毫秒)
+    """
+    results = []
+    error = None
+    for _ in range(samples):
+        try:
+            results.append(await _sample(endpoint, timeout, ssl_context))
+        except asyncio.TimeoutError:
+            error = f"超时 (> {timeout:g}s)"
+        except (OSError, ValueError) as e:
+            error = str(e) or type(e).__name__
+    entry: dict = {"endpoint": endpoint, "measured_at": time.time(), "samples": len(results)}
+    if not results:
+        entry["error"] = error
+        return entry
+    for phase in PHASES:
+        entry[phase] = round(statistics.median(r[phase] for r in results) * 1000, 2)
+    entry["total"] = round(
+        statistics.median(sum(r.values()) for r in results) * 1000, 2
+    )
+    return entry
+
+
+async def probe_all(
+    endpoints: dict[str, str],
+    samples: int,
+    timeout: float,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> dict[str, dict]:
+    """
+    同时测量所有 endpoint: {env: endpoint} -> {env: 结果}
+    """
+    envs = list(endpoints)
+    results = await asyncio.gather(
+        *(probe_endpoint(endpoints[env], samples, timeout, ssl_context) for env in envs)
+    )
+    return dict(zip(envs, results))
+
+
+def measure(
+    endpoints: dict[str, Optional[str]],
+    cache: dict,
+    samples: int,
+    timeout: float,
+    ttl: float,
+    refresh: bool = False,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> tuple[dict[str, dict], dict[str, dict]]:
+    """
+    返回 ({env: 结果}, {env: 本次新测量的结果})。
+    cache 中 endpoint 未变且未过期 (ttl 秒) 的结果直接复用，其余的并发测量；
+    cache 本身不修改，由调用方在锁内合并新结果
+    """
+    now = time.time()
+    endpoints = {env: endpoint or DEFAULT_ENDPOINT for env, endpoint in endpoints.items()}
+    stale = {
+        env: endpoint
+        for env, endpoint in endpoints.items()
+        if refresh
+        or env not in cache
+        or cache[env].get("endpoint") != endpoint
+        or now - cache[env].get("measured_at", 0) > ttl
+    }
+    fresh = asyncio.run(probe_all(stale, samples, timeout, ssl_context)) if stale else {}
+    return {env: fresh.get(env) or cache[env] for env in endpoints}, fresh
+
+
+def rank(results: dict[str, dict]) -> list[tuple[str, dict]]:
+    """
+    按总耗时从快到慢排序，失败的排在最后
+    """
+    return sorted(
+        results.items(),
+        key=lambda item: (item[1].get("total") is None, item[1].get("total") or 0.0),
+    )
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# claude_env/layers.py
+# 描述: 分层环境。shared_paths 中的路径 (如 .claude/commands) 只在共享层
+# base_dir/.base 中保存一份，各环境目录中对应位置是指向共享层的相对符号链接。
+# 切换环境时只替换账号相关的部分，共享层中新增的命令对所有环境立即可见。
+
+import os
+import time
+import filecmp
+from pathlib import Path
+
+# 共享层目录 (以 "." 开头，不会与环境名称冲突)
+SHARED_LAYER_NAME = ".base"
+# 合并时与共享层内容冲突的文件保存在这里，按环境区分
+LAYER_CONFLICTS_NAME = ".base-conflicts"
+
+
+def _layer_link_target(layer_path: Path, env_path: Path) -> str:
+    # 相对链接: base_dir 整体移动或经由 current 指针访问时仍然有效
+    return os.path.relpath(layer_path, env_path.parent)
+
+
+def _same_entry(src: Path, layer_entry: Path) -> bool:
+    """
+    两个条目是否相同: 指向同一目标的符号链接，或内容相同的普通文件
+    """
+    if src.is_symlink() or layer_entry.is_symlink():
+        return (
+            src.is_symlink()
+            and layer_entry.is_symlink()
+            and os.readlink(src) == os.readlink(layer_entry)
+        )
+    return (
+        src.is_file()
+        and layer_entry.is_file()
+        and filecmp.cmp(src, layer_entry, shallow=False)
+    )
+
+
+def _merge_into_layer(
+    src: Path, layer: Path, conflict_dir: Path, rel_dir: str = ""
+) -> tuple[int, int]:
+    """
+    把环境中已有的目录合并进共享层，返回 (移入的条目数, 冲突的条目数)。
+    共享层中没有的条目 (文件、符号链接、包括空目录在内的整个子目录) 直接移入；
+    两边都是目录时递归合并；共享层中已有且不同的条目以共享层为准，环境中的版本移到 conflict_dir。
+    合并完成后用 rmdir 删除 src: 如果还有未处理的内容，抛出 OSError 而不是丢弃它。
+    """
+    moved = conflicts = 0
+    with os.scandir(src) as it:
+        entries = list(it)
+    for entry in entries:
+        rel = os.path.join(rel_dir, entry.name)
+        src_entry = Path(entry.path)
+        layer_entry = layer / entry.name
+        if not os.path.lexists(layer_entry):
+            os.makedirs(layer, exist_ok=True)
+            os.replace(src_entry, layer_entry)
+            moved += 1
+        elif (
+            entry.is_dir(follow_symlinks=False)
+            and layer_entry.is_dir()
+            and not layer_entry.is_symlink()
+        ):
+            sub_moved, sub_conflicts = _merge_into_layer(
+                src_entry, layer_entry, conflict_dir, rel
+            )
+            moved += sub_moved
+            conflicts += sub_conflicts
+        elif _same_entry(src_entry, layer_entry):
+            os.unlink(src_entry)
+        else:
+            backup = conflict_dir / rel
+            if os.path.lexists(backup):
+                # 之前合并留下的冲突副本 (目录不能被 os.replace 覆盖)
+                backup = backup.with_name(f"{backup.name}.{time.time_ns()}")
+            os.makedirs(backup.parent, exist_ok=True)
+            os.replace(src_entry, backup)
+            conflicts += 1
+    os.rmdir(src)
+    return moved, conflicts
+
+
+def apply_shared_layer(
+    base_dir: Path, env_name: str, shared_paths: list[str]
+) -> list[str]:
+    """
+    确保环境中的每个 shared path 都是指向共享层的链接。
+    已经正确链接的路径只需一次 lstat；首次启用时把环境中的内容合并进共享层。
+    返回描述所做改动的消息列表。
+    """
+    messages = []
+    env_dir = base_dir / env_name
+    layer_root = base_dir / SHARED_LAYER_NAME
+    for rel_path_str in shared_paths:
+        env_path = env_dir / rel_path_str
+        layer_path = layer_root / rel_path_str
+        target = _layer_link_target(layer_path, env_path)
+
+        if env_path.is_symlink():
+            if os.readlink(env_path) == target:
+                continue
+            env_path.unlink()
+        elif env_path.is_dir():
+            if layer_path.exists():
+                moved, conflicts = _merge_into_layer(
+                    env_path,
+                    layer_path,
+                    base_dir / LAYER_CONFLICTS_NAME / env_name / rel_path_str,
+                )
+                message = f"{rel_path_str}: 合并 {moved} 项到共享层"
+                if conflicts:
+                    message += (
+                        f"，{conflicts} 个冲突项已移到 {LAYER_CONFLICTS_NAME}/{env_name}"
+                    )
+                messages.append(message)
+            else:
+                os.makedirs(layer_path.parent, exist_ok=True)
+                os.replace(env_path, layer_path)
+                messages.append(f"{rel_path_str}: 已移入共享层")
+        elif env_path.exists():
+            if layer_path.exists():
+                backup = base_dir / LAYER_CONFLICTS_NAME / env_name / rel_path_str
+                os.makedirs(backup.parent, exist_ok=True)
+                os.replace(env_path, backup)
+                messages.append(
+                    f"{rel_path_str}: 以共享层为准，"
+                    f"原文件已移到 {LAYER_CONFLICTS_NAME}/{env_name}"
+                )
+            else:
+                os.makedirs(layer_path.parent, exist_ok=True)
+                os.replace(env_path, layer_path)
+                messages.append(f"{rel_path_str}: 已移入共享层")
+
+        if not layer_path.exists():
+            # 共享层中还没有该路径: 按目录处理 (有扩展名的视为文件，留给程序首次写入)
+            if Path(rel_path_str).suffix:
+                os.makedirs(layer_path.parent, exist_ok=True)
+            else:
+                os.makedirs(layer_path, exist_ok=True)
+        os.makedirs(env_path.parent, exist_ok=True)
+        os.symlink(target, env_path)
+    return messages
@@ -3,26 +3,44 @@
 # 描述: 包含所有核心业务逻辑，封装在 EnvironmentManager 类中
 # [已重构] 使用符号链接 (Symlink) 架构，移除了复制/删除逻辑。
 # [已重构] [v4] 逻辑现在由 config.yaml 中的 'managed_paths' 列表驱动。
+# 注意：只在个别命令中用到的模块 (rich.table、sync、watch 等) 在方法内按需导入，
+# 以减少 status 等高频命令的启动时间。
 
 import os
+import sys
 import json
+import time
+import signal
+import subprocess
+import threading
 from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
 from typing import Optional
 from pathlib import Path
-from claude_env.models import AppConfig, EnvState
-from claude_env.config import load_config, load_env_state, save_env_state
+from claude_env.models import (
+    AppConfig,
+    ArchiveStats,
+    PruneStats,
+    DedupStats,
+    EnvProfile,
+    CURRENT_POINTER_NAME,
+)
+from claude_env.config import (
+    load_config,
+    state_lock,
+    load_profile_index,
+    save_profile_index,
+)
+from claude_env.registry import open_registry
 from claude_env.utils import (
     get_current_email,
-    get_auth_type,
-    get_api_endpoint,
-    is_auth_valid,
+    load_env_profile,
+    stat_signature,
     get_symlink_target_env,
+    is_reserved_env_name,
+    atomic_replace_symlink,
+    atomic_write_text,
     safe_create_symlink,
     safe_remove_symlink,
-    safe_move_file,
-    safe_move_tree,
 )
 
 
@@ -33,7 +51,8 @@ class EnvironmentManager:
 
     def __init__(self):
         self.config: AppConfig = load_config()
-        self.state: EnvState = load_env_state()
+        # 环境注册表 (env.yaml 或 registry.db，取决于 config.yaml 的 'registry')
+        self.registry = open_registry(self.config)
         self.console = Console()
 
         # [新] 定义一个“主”配置文件，用于检查 email 和状态
@@ -46,6 +65,26 @@ class EnvironmentManager:
         self.primary_config_file = self.config.managed_paths[0]
         self.primary_config_path_home = Path.home() / self.primary_config_file
 
+        # 元数据索引 (index.json)，按需加载
+        self._profile_index: Optional[dict] = None
+        self._profile_index_dirty = False
+        self._profile_index_lock = threading.Lock()
+
+        self._reap_trash_lazily()
+
+    def _reap_trash_lazily(self):
+        """
+        回收站中有过期条目 (例如 remove 之后启动的回收进程被中断) 时，在后台启动回收进程
+        """
+        from claude_env.trash import TRASH_DIR_NAME
+
+        if not (self.config.base_dir / TRASH_DIR_NAME).is_dir():
+            return
+        from claude_env.trash import expired_entries, spawn_reaper
+
+        if expired_entries(self.config.base_dir, self.config.trash_undo_window):
+            spawn_reaper(self.config.base_dir, self.config.trash_undo_window)
+
     def _get_active_env(self) -> Optional[str]:
         """
         [新] 检查符号链接以确定哪个环境是激活的。
@@ -56,12 +95,144 @@ class EnvironmentManager:
             self.primary_config_path_home, self.config.base_dir
         )
 
-    def _save_current_env(self, env_name: str):
+    def _get_env_profile(self, env_name: str) -> EnvProfile:
+        """
+        获取环境的 EnvProfile。
+        先查持久化索引，stat 签名未变化时无需读取 .claude.json；
+        否则重新解析并更新索引（由 _flush_profile_index 写回）。
+        可在多个线程中并发调用。
+        """
+        with self._profile_index_lock:
+            if self._profile_index is None:
+                self._profile_index = load_profile_index()
+            index = self._profile_index
+
+        config_path = self.config.base_dir / env_name / self.primary_config_file
+        signature = stat_signature(config_path)
+        entry = index.get(env_name)
+        if (
+            signature is not None
+            and isinstance(entry, dict)
+            and entry.get("signature") == list(signature)
+        ):
+            try:
+                return EnvProfile.model_validate(entry["profile"])
+            except Exception:
+                pass  # 索引条目损坏，重新解析
+
+        if signature is None and isinstance(entry, dict) and "profile" in entry:
+            # 已归档的环境没有展开的目录，直接使用归档前缓存的元数据
+            if not (self.config.base_dir / env_name).exists():
+                try:
+                    return EnvProfile.model_validate(entry["profile"])
+                except Exception:
+                    pass
+
+        profile = load_env_profile(config_path)
+        with self._profile_index_lock:
+            if signature is None:
+                if (self.config.base_dir / env_name).exists():
+                    index.pop(env_name, None)
+            else:
+                index[env_name] = {
+                    "signature": list(signature),
+                    "profile": profile.model_dump(),
+                }
+            self._profile_index_dirty = True
+        return profile
+
+    def _probe_env_profiles(self, envs: list[str]) -> dict[str, Optional[EnvProfile]]:
+        """
+        使用最多 probe_workers 个守护线程并发探测多个环境。
+        出错的环境返回空的 EnvProfile；某个环境从开始探测起超过 probe_timeout 秒仍未完成时
+        返回 None，并启动一个新线程接替它继续处理剩下的环境。
+        卡住的线程 (例如挂起的 NFS) 是守护线程，不会阻塞其他环境的结果，也不会阻止进程退出。
+        """
+        import queue
+
+        pending: queue.SimpleQueue = queue.SimpleQueue()
+        for env in envs:
+            pending.put(env)
+        results: dict[str, EnvProfile] = {}
+        started: dict[str, float] = {}
+        timed_out: set[str] = set()
+        cond = threading.Condition()
+
+        def worker():
+            while True:
+                try:
+                    env = pending.get_nowait()
+                except queue.Empty:
+                    return
+                with cond:
+                    started[env] = time.monotonic()
+                    cond.notify_all()
+                try:
+                    profile = self._get_env_profile(env)
+                except Exception as e:
+                    print(f"  [警告] 探测环境 {env} 失败: {e}")
+                    profile = EnvProfile()
+                with cond:
+                    if env in timed_out:
+                        return  # 已有接替的线程
+                    results[env] = profile
+                    cond.notify_all()
+
+        def spawn():
+            threading.Thread(target=worker, name="claude_env_probe", daemon=True).start()
+
+        with cond:
+            for _ in range(min(self.config.probe_workers, len(envs))):
+                spawn()
+            while len(results) + len(timed_out) < len(envs):
+                now = time.monotonic()
+                deadline = None
+                for env, start in started.items():
+                    if env in results or env in timed_out:
+                        continue
+                    if now - start >= self.config.probe_timeout:
+                        timed_out.add(env)
+                        spawn()
+                    else:
+                        end = start + self.config.probe_timeout
+                        deadline = end if deadline is None else min(deadline, end)
+                if len(results) + len(timed_out) < len(envs):
+                    cond.wait(None if deadline is None else deadline - now)
+        return {env: results.get(env) for env in envs}
+
+    def _drop_profile_index(self, env_name: str):
+        """
+        从索引中移除一个环境的条目
+        """
+        with self._profile_index_lock:
+            if self._profile_index is None:
+                self._profile_index = load_profile_index()
+            if self._profile_index.pop(env_name, None) is not None:
+                self._profile_index_dirty = True
+
+    def _flush_profile_index(self):
         """
-        保存当前环境的修改（如果 symlink 被覆盖为真实文件）
+        如果索引有变化，写回 index.json
         """
+        with self._profile_index_lock:
+            if self._profile_index is None or not self._profile_index_dirty:
+                return
+            # 复制一份再写，超时的探测线程可能仍在更新索引
+            snapshot = dict(self._profile_index)
+            self._profile_index_dirty = False
+        try:
+            save_profile_index(snapshot)
+        except OSError as e:
+            print(f"  [警告] 保存元数据索引失败: {e}")
+
+    def _save_current_env(self, env_name: str, home_dir: Optional[Path] = None):
+        """
+        保存当前环境的修改（如果 symlink 被覆盖为真实文件），并拆分被写入的硬链接共享文件。
+        home_dir 默认为真实的 $HOME；exec 结束时传入私有的 HOME 覆盖层。
+        """
+        home_dir = home_dir or Path.home()
         for rel_path_str in self.config.managed_paths:
-            home_path = Path.home() / rel_path_str
+            home_path = home_dir / rel_path_str
             env_path = self.config.base_dir / env_name / rel_path_str
 
             # 如果 home_path 是真实文件/目录（不是 symlink），需要保存回环境
@@ -75,42 +246,66 @@ class EnvironmentManager:
                         shutil.copy2(home_path, env_path)
                         print(f"  [自动保存] {home_path} -> {env_path}")
                     elif home_path.is_dir():
-                        # 目录：rsync 同步（保留新内容）
-                        import subprocess
+                        # 目录：内置增量同步（只复制新增/变化的文件，保留新内容）
+                        from claude_env.sync import sync_env_path
 
                         os.makedirs(env_path.parent, exist_ok=True)
-                        subprocess.run(
-                            ["rsync", "-a", f"{home_path}/", f"{env_path}/"],
-                            check=True,
-                            capture_output=True,
+                        stats = sync_env_path(
+                            env_name, rel_path_str, home_path, env_path
+                        )
+                        print(
+                            f"  [自动保存] {home_path}/ -> {env_path}/ "
+                            f"({stats.files_copied}/{stats.files_scanned} 个文件, "
+                            f"{stats.bytes_copied} 字节)"
                         )
-                        print(f"  [自动保存] {home_path}/ -> {env_path}/")
                 except Exception as e:
                     print(f"  [警告] 保存 {home_path} 失败: {e}")
 
+        # 环境刚被使用过: 拆分其中被写入的硬链接共享文件
+        try:
+            self._split_written_shared(env_name)
+        except OSError as e:
+            print(f"  [警告] 拆分 {env_name} 的共享文件失败: {e}")
+
     def _activate_env(self, env_name: str) -> bool:
         """
-        [新] 核心切换逻辑：激活一个环境
+        [新] 核心切换逻辑：激活一个环境 (在跨进程锁内执行)
+        """
+        with state_lock():
+            return self._do_activate_env(env_name)
+
+    def _do_activate_env(self, env_name: str) -> bool:
+        """
         1. 保存当前环境（如果有真实文件被创建）
         2. 删除旧链接
         3. 创建新链接
         """
         env_path = self.config.base_dir / env_name
-        if not env_path.is_dir():
+        if not self._ensure_expanded(env_name):
             self.console.print(
                 f"[bold red]错误[/bold red]: 环境目录 {env_path} 未找到。"
             )
             return False
 
+        self._apply_shared_layer(env_name)
+
         # [新增] 保存当前环境的修改
         current_env = self._get_active_env()
         if not current_env:
             # symlink 可能被覆盖，使用上次记录的环境
-            current_env = self.state.last_active_env
+            current_env = self.registry.last_active_env
 
         if current_env and current_env != env_name:
+            self._auto_snapshot(current_env, "switch")
             self._save_current_env(current_env)
 
+        if self.config.switch_mode == "pointer":
+            if not self._activate_env_pointer(env_name):
+                return False
+            self.registry.set_last_active_env(env_name)
+            self._dedup_after_switch(current_env, env_name)
+            return True
+
         # [修改] 遍历 config.yaml 中定义的所有 'managed_paths'
 
         self.console.print("正在清理工作区 (移除旧链接)...")
@@ -134,11 +329,345 @@ class EnvironmentManager:
             safe_create_symlink(target_path, link_path)
 
         # [新增] 记录当前激活的环境
-        self.state.last_active_env = env_name
-        save_env_state(self.state)
+        self.registry.set_last_active_env(env_name)
+
+        self._dedup_after_switch(current_env, env_name)
+        return True
+
+    def _activate_env_pointer(self, env_name: str) -> bool:
+        """
+        pointer 模式的切换逻辑：
+        1. 确保新环境的目标路径存在
+        2. 用 rename(2) 原子替换 base_dir/current 指针 (与 managed_paths 数量无关)
+        3. 仅在 home 链接缺失或指向不对时修复它们 (首次启用或被覆盖后)
+        """
+        env_path = self.config.base_dir / env_name
+        pointer_path = self.config.base_dir / CURRENT_POINTER_NAME
+
+        for rel_path_str in self.config.managed_paths:
+            target_path = env_path / rel_path_str
+            os.makedirs(target_path.parent, exist_ok=True)
+            if rel_path_str.endswith("/"):  # 简单的启发式
+                os.makedirs(target_path, exist_ok=True)
+
+        if pointer_path.exists() and not pointer_path.is_symlink():
+            self.console.print(
+                f"[bold red]错误[/bold red]: {pointer_path} 不是符号链接，无法切换。"
+            )
+            return False
+
+        self.console.print(f"正在将指针切换到 [bold]{env_name}[/bold] ...")
+        try:
+            # 使用相对路径，base_dir 整体移动后指针仍然有效
+            atomic_replace_symlink(Path(env_name), pointer_path)
+            print(f"  [切换指针] {pointer_path} -> {env_name}")
+        except OSError as e:
+            self.console.print(f"[bold red]切换指针失败[/bold red]: {e}")
+            return False
+
+        for rel_path_str in self.config.managed_paths:
+            link_path = Path.home() / rel_path_str
+            target_path = pointer_path / rel_path_str
+            if link_path.is_symlink() and os.readlink(link_path) == str(target_path):
+                continue
+            if link_path.is_symlink() or link_path.is_file():
+                atomic_replace_symlink(target_path, link_path)
+                print(f"  [创建链接] {link_path} -> {target_path}")
+            else:
+                safe_create_symlink(target_path, link_path)
+
+        return True
+
+    def _dedup_after_switch(self, previous_env: Optional[str], env_name: str):
+        """
+        dedup_on_switch 开启时，对刚离开的环境做一次增量去重
+        """
+        if not self.config.dedup_on_switch or not previous_env:
+            return
+        if previous_env == env_name or previous_env not in self.registry:
+            return
+        try:
+            stats = self._run_dedup([previous_env])
+            if stats.files_linked:
+                print(
+                    f"  [去重] {previous_env}: 共享 {stats.files_linked} 个文件, "
+                    f"节省 {stats.bytes_saved} 字节"
+                )
+        except OSError as e:
+            print(f"  [警告] 去重 {previous_env} 失败: {e}")
+
+    def _run_dedup(self, env_names: list[str]) -> DedupStats:
+        """
+        对指定环境运行增量去重，返回汇总统计
+        """
+        from claude_env.dedup import (
+            ObjectStore,
+            dedup_env,
+            load_dedup_state,
+            save_dedup_state,
+        )
+
+        total = DedupStats()
+        with state_lock():
+            store = ObjectStore(self.config.base_dir)
+            state = load_dedup_state()
+            for env in env_names:
+                if not (self.config.base_dir / env).is_dir():
+                    continue  # 已归档，保留上次的状态
+                entries = state.setdefault(env, {})
+                stats = dedup_env(
+                    store,
+                    self.config.base_dir / env,
+                    self.config.dedup_paths,
+                    entries,
+                )
+                total.files_scanned += stats.files_scanned
+                total.files_hashed += stats.files_hashed
+                total.files_linked += stats.files_linked
+                total.bytes_saved += stats.bytes_saved
+            save_dedup_state(state)
+        return total
+
+    def _split_written_shared(self, env_name: str):
+        """
+        拆分环境中自克隆以来被写入过的硬链接共享文件 (写入时复制)，
+        其他环境中的这些文件恢复为写入前的内容
+        """
+        from claude_env.clone import split_written_shared
+
+        count, copied, unrecoverable = split_written_shared(self.config.base_dir, env_name)
+        if count:
+            print(f"  [拆分共享] {env_name}: {count} 个被写入的文件 ({copied} 字节)")
+        for rel in unrecoverable:
+            print(
+                f"  [警告] {env_name}/{rel} 被原地改写，与之共享的环境无法恢复原内容"
+            )
+
+    def _apply_shared_layer(self, env_name: str):
+        """
+        把环境中的 shared_paths 链接到共享层 (未启用分层时什么也不做)
+        """
+        if not self.config.shared_paths:
+            return
+        from claude_env.layers import apply_shared_layer
+
+        for message in apply_shared_layer(
+            self.config.base_dir, env_name, self.config.shared_paths
+        ):
+            print(f"  [共享层] {env_name}: {message}")
+
+    def _ensure_expanded(self, env_name: str, console: Optional[Console] = None) -> bool:
+        """
+        确保环境目录已展开；已归档的环境在这里流式解压 (带进度显示)。
+        console 默认为 self.console；stdout 被用作数据输出时 (export -) 传入 stderr 的 Console
+        """
+        if (self.config.base_dir / env_name).is_dir():
+            return True
+        from claude_env.archive import (
+            archive_path,
+            load_archive_state,
+            rehydrate_env,
+            save_archive_state,
+        )
+
+        with state_lock():
+            state = load_archive_state()
+            entry = state.get(env_name)
+            if entry is None:
+                return (self.config.base_dir / env_name).is_dir()
+            if not (self.config.base_dir / env_name).is_dir():
+                from rich.progress import (
+                    BarColumn,
+                    DownloadColumn,
+                    Progress,
+                    TextColumn,
+                    TransferSpeedColumn,
+                )
+
+                total = archive_path(self.config.base_dir, entry["file"]).stat().st_size
+                with Progress(
+                    TextColumn(f"正在解压 [bold]{env_name}[/bold]"),
+                    BarColumn(),
+                    DownloadColumn(),
+                    TransferSpeedColumn(),
+                    console=console or self.console,
+                    transient=True,
+                ) as progress:
+                    task = progress.add_task("rehydrate", total=total)
+                    rehydrate_env(
+                        self.config.base_dir,
+                        env_name,
+                        entry,
+                        on_progress=lambda n: progress.advance(task, n),
+                    )
+                print(
+                    f"  [解压] {env_name}: 已从归档恢复",
+                    file=console.file if console else sys.stdout,
+                )
+            del state[env_name]
+            save_archive_state(state)
+        return True
+
+    def _take_snapshot(self, env_name: str, reason: str) -> str:
+        """
+        在锁内为环境创建快照并按保留策略清理旧快照，返回快照 ID
+        """
+        from claude_env.snapshot import prune_snapshots, take_snapshot
+
+        with state_lock():
+            snapshot_id = take_snapshot(
+                self.config.base_dir,
+                env_name,
+                reason,
+                self.config.snapshot_exclude,
+                self.config.dedup_paths,
+            )
+            prune_snapshots(
+                self.config.base_dir,
+                env_name,
+                self.config.snapshot_keep,
+                self.config.snapshot_max_age_days,
+            )
+        return snapshot_id
+
+    def _auto_snapshot(self, env_name: str, reason: str):
+        """
+        switch / set-api 之前的自动快照，失败时只给出警告，不阻止后续操作。
+        不支持 reflink 时快照是整个环境的完整副本，为避免每次切换都复制一遍，跳过自动快照。
+        """
+        if not self.config.auto_snapshot or not (self.config.base_dir / env_name).is_dir():
+            return
+        from claude_env.snapshot import reflink_supported
+
+        if not reflink_supported(self.config.base_dir):
+            print("  [快照] 文件系统不支持 reflink，跳过自动快照 (可手动运行 claude_env snapshot)")
+            return
+        try:
+            snapshot_id = self._take_snapshot(env_name, reason)
+            print(f"  [快照] {env_name}: {snapshot_id}")
+        except OSError as e:
+            print(f"  [警告] 为 {env_name} 创建快照失败: {e}")
+
+    def _migrate_path(self, src_path: Path, dest_path: Path) -> bool:
+        """
+        迁移一个 managed path (rename 或带进度的并发复制)，返回是否成功
+        """
+        from rich.progress import (
+            BarColumn,
+            DownloadColumn,
+            Progress,
+            TextColumn,
+            TimeRemainingColumn,
+            TransferSpeedColumn,
+        )
+        from claude_env.migrate import migrate_path
+
+        with Progress(
+            TextColumn(f"正在迁移 [bold]{src_path.name}[/bold]"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            console=self.console,
+            transient=True,
+        ) as progress:
+            task = progress.add_task("migrate", total=None)
+            try:
+                stats = migrate_path(
+                    src_path,
+                    dest_path,
+                    workers=self.config.migrate_workers,
+                    on_start=lambda total: progress.update(task, total=total),
+                    on_progress=lambda n: progress.advance(task, n),
+                )
+            except OSError as e:
+                self.console.print(f"[bold red]迁移 {src_path} 失败[/bold red]: {e}")
+                return False
 
+        if stats.renamed:
+            print(f"  [移动] {src_path} -> {dest_path}")
+        else:
+            resumed = f", 续传跳过 {stats.files_resumed} 个" if stats.files_resumed else ""
+            print(
+                f"  [复制] {src_path} -> {dest_path}: {stats.files_copied} 个文件 "
+                f"({stats.bytes_copied / 1024 / 1024:.1f} MB, 已校验){resumed}"
+            )
         return True
 
+    def _scan_env_sizes(
+        self, roots: list[Path], refresh: bool = False
+    ) -> dict[str, int]:
+        """
+        扫描目录占用 (使用并更新 du 缓存)，返回 {目录绝对路径: 直接包含的文件占用}
+        """
+        from claude_env.du import load_du_cache, save_du_cache, scan_sizes
+
+        cache = {} if refresh else load_du_cache()
+        own_sizes, scanned, changed = scan_sizes(roots, cache, self.config.probe_workers)
+        if not changed:
+            return own_sizes
+        # 只替换本次扫描的子树，其他目录的缓存保留
+        root_paths = {str(root) for root in roots}
+        prefixes = tuple(path + os.sep for path in root_paths)
+        merged = {
+            path: entry
+            for path, entry in cache.items()
+            if path not in root_paths and not path.startswith(prefixes)
+        }
+        merged.update(scanned)
+        try:
+            save_du_cache(merged)
+        except OSError as e:
+            print(f"  [警告] 保存 du 缓存失败: {e}")
+        return own_sizes
+
+    def _link_target(self, env_name: str, rel_path_str: str) -> Path:
+        """
+        返回 home 下的链接在当前切换模式中应指向的目标
+        """
+        if self.config.switch_mode == "pointer":
+            return self.config.base_dir / CURRENT_POINTER_NAME / rel_path_str
+        return self.config.base_dir / env_name / rel_path_str
+
+    def _recapture_clobbered(self) -> list[str]:
+        """
+        将被替换成真实文件/目录的 managed paths 收回到激活环境中，并恢复链接。
+        返回被修复的路径列表。
+        """
+        with state_lock():
+            # 其他进程可能已经切换了环境，每次都重新读取状态
+            self.registry.reload()
+            env_name = self.registry.last_active_env
+            if not env_name or env_name not in self.registry:
+                return []
+
+            clobbered = [
+                rel_path_str
+                for rel_path_str in self.config.managed_paths
+                if (Path.home() / rel_path_str).exists()
+                and not (Path.home() / rel_path_str).is_symlink()
+            ]
+            if not clobbered:
+                return []
+
+            before = {rel: stat_signature(Path.home() / rel) for rel in clobbered}
+            self._save_current_env(env_name)
+
+            repaired = []
+            for rel_path_str in clobbered:
+                link_path = Path.home() / rel_path_str
+                # 复制期间文件又被写入：留到下一轮，避免丢失这次写入
+                if stat_signature(link_path) != before[rel_path_str]:
+                    continue
+                target_path = self._link_target(env_name, rel_path_str)
+                if link_path.is_dir():
+                    safe_create_symlink(target_path, link_path)
+                else:
+                    atomic_replace_symlink(target_path, link_path)
+                    print(f"  [恢复链接] {link_path} -> {target_path}")
+                repaired.append(rel_path_str)
+            return repaired
+
     # --- 公共命令 ---
 
     def init_manager(self):
@@ -146,39 +675,53 @@ class EnvironmentManager:
         初始化管理器。
         如果检测到现有的 .claude.json，将其“吸收”为第一个环境。
         """
-        if self.state.environments:
+        if len(self.registry):
             # 已经初始化过了
             return
 
+        from claude_env.migrate import clear_pending, load_pending, save_pending
+
         self.console.print("ClaudeEnv 首次运行：正在初始化...")
 
         # [修改] 检查主配置文件
         primary_link = self.primary_config_path_home
+        pending = load_pending()
+
+        if pending or (primary_link.is_file() and not primary_link.is_symlink()):
+            if pending:
+                # 上次迁移被中断 (主配置文件可能已经移走)，继续迁移到同一个环境
+                env_name = pending["env"]
+                self.console.print(
+                    f"检测到未完成的迁移，继续迁移到环境: '[bold]{env_name}[/bold]'"
+                )
+            else:
+                self.console.print("检测到现有的 Claude 配置。")
+                email = get_current_email(primary_link)
+                env_name = email if email else "default"
 
-        if primary_link.is_file() and not primary_link.is_symlink():
-            self.console.print("检测到现有的 Claude 配置。")
-            email = get_current_email(primary_link)
-            env_name = email if email else "default"
-
-            self.console.print(
-                f"正在将现有配置“吸收”为新环境: '[bold]{env_name}[/bold]'"
-            )
+                self.console.print(
+                    f"正在将现有配置“吸收”为新环境: '[bold]{env_name}[/bold]'"
+                )
+                save_pending(env_name)
             env_path = self.config.base_dir / env_name
             os.makedirs(env_path, exist_ok=True)
 
-            # [修改] 遍历所有 managed_paths 并移动它们
+            # [修改] 遍历所有 managed_paths 并迁移它们
             for rel_path_str in self.config.managed_paths:
                 src_path = Path.home() / rel_path_str
                 dest_path = env_path / rel_path_str
 
-                if src_path.is_file() and not src_path.is_symlink():
-                    safe_move_file(src_path, dest_path)
-                elif src_path.is_dir() and not src_path.is_symlink():
-                    safe_move_tree(src_path, dest_path)
+                if src_path.is_symlink() or not src_path.exists():
+                    continue
+                if not self._migrate_path(src_path, dest_path):
+                    self.console.print(
+                        "[bold red]迁移未完成[/bold red]，源文件保持不变。重新运行 'init' 可继续。"
+                    )
+                    return
 
-            # 1. 更新 state 对象
-            self.state.environments.append(env_name)
-            save_env_state(self.state)
+            # 1. 更新注册表
+            self.registry.add(env_name)
+            clear_pending()
 
             # 2. 激活这个新环境 (创建符号链接)
             self._activate_env(env_name)
@@ -188,17 +731,35 @@ class EnvironmentManager:
             self.console.print("未检测到现有配置。初始化完成。")
             self.console.print("请运行 'add <name>' 来创建你的第一个环境。")
 
-    def add(self, env_name: str):
+    def add(self, env_name: str, from_env: Optional[str] = None):
         """
-        添加一个新环境。
+        添加一个新环境。指定 from_env 时克隆该环境 (不含登录凭据)。
         """
-        if env_name in self.state.environments:
+        if is_reserved_env_name(env_name):
+            self.console.print(
+                f"[bold red]错误[/bold red]: '{env_name}' 是保留名称，不能用作环境名称。"
+            )
+            return
+
+        if env_name in self.registry:
             self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 已存在。")
             self.console.print(
                 "如果你想切换，请使用: python claude_env.py switch <name>"
             )
             return
 
+        if from_env is not None:
+            if not self._clone_env(from_env, env_name):
+                return
+            self.switch(env_name)
+            self.console.print(
+                f"[green]成功从 '[bold]{from_env}[/bold]' 克隆新环境 '[bold]{env_name}[/bold]'。[/green]"
+            )
+            self.console.print(
+                "[yellow]登录凭据未被复制，请运行 'claude' 登录，或使用 set-api 配置 API Key。[/yellow]"
+            )
+            return
+
         self.console.print(f"正在添加新环境: [bold]{env_name}[/bold] ...")
 
         env_path = self.config.base_dir / env_name
@@ -216,9 +777,12 @@ class EnvironmentManager:
             if not Path(rel_path_str).suffix or rel_path_str == ".claude":
                 os.makedirs(target_path, exist_ok=True)
 
-        # 2. 更新状态文件
-        self.state.environments.append(env_name)
-        save_env_state(self.state)
+        # 2. 更新状态文件 (并发的 add 可能已抢先创建同名环境)
+        try:
+            self.registry.add(env_name)
+        except ValueError as e:
+            self.console.print(f"[bold red]错误[/bold red]: {e}。")
+            return
 
         # 3. 立即切换到这个新环境
         self.switch(env_name)
@@ -238,11 +802,68 @@ class EnvironmentManager:
             "[dim]提示: 配置完成后，运行 'python claude_env.py status' 查看状态[/dim]"
         )
 
+    def _clone_env(self, from_env: str, env_name: str) -> bool:
+        """
+        在锁内把 from_env 克隆为 env_name 并注册。reflink 优先，否则退回到硬链接。
+        """
+        import shutil
+        from claude_env.clone import clone_env_dir, load_shared_paths, save_shared_paths
+
+        if from_env not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{from_env}' 不存在。")
+            return False
+
+        src_path = self.config.base_dir / from_env
+        env_path = self.config.base_dir / env_name
+        self.console.print(
+            f"正在从 [bold]{from_env}[/bold] 克隆新环境: [bold]{env_name}[/bold] ..."
+        )
+        with state_lock():
+            # 克隆当前环境前先把 home 中被替换成实体文件的路径收回
+            if from_env == self._get_active_env():
+                self._save_current_env(from_env)
+            if env_path.exists():
+                self.console.print(f"[bold red]错误[/bold red]: {env_path} 已存在。")
+                return False
+            if not self._ensure_expanded(from_env):
+                self.console.print(f"[bold red]错误[/bold red]: {src_path} 未找到。")
+                return False
+            start = time.perf_counter()
+            try:
+                stats = clone_env_dir(
+                    src_path,
+                    env_path,
+                    self.primary_config_file,
+                    self.config.dedup_paths,
+                )
+                self.registry.add(env_name)
+            except (OSError, ValueError) as e:
+                shutil.rmtree(env_path, ignore_errors=True)
+                self.console.print(f"[bold red]克隆失败[/bold red]: {e}")
+                return False
+            if stats.shared_paths:
+                # 双方都记录共享的文件，哪一方被写入就在保存该环境时拆分
+                save_shared_paths(env_name, stats.shared_paths)
+                save_shared_paths(
+                    from_env, {**load_shared_paths(from_env), **stats.shared_paths}
+                )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"  [克隆] {stats.files} 个文件 ({stats.bytes} 字节), "
+            f"方式: {stats.mode}, 耗时 {elapsed_ms:.1f} ms"
+        )
+        if stats.shared_paths:
+            print(
+                f"  [克隆] {len(stats.shared_paths)} 个文件以硬链接共享，"
+                "被写入的文件在保存环境时才复制为独立副本"
+            )
+        return True
+
     def switch(self, env_name: str):
         """
         切换到已存在的环境
         """
-        if env_name not in self.state.environments:
+        if env_name not in self.registry:
             self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
             self.console.print(
                 "请先使用 'add' 命令创建: python claude_env.py add <name>"
@@ -270,7 +891,13 @@ class EnvironmentManager:
             self.console.print("[bold red]错误[/bold red]: 没有激活的环境可以重命名。")
             return
 
-        if new_name in self.state.environments:
+        if is_reserved_env_name(new_name):
+            self.console.print(
+                f"[bold red]错误[/bold red]: '{new_name}' 是保留名称，不能用作环境名称。"
+            )
+            return
+
+        if new_name in self.registry:
             self.console.print(
                 f"[bold red]错误[/bold red]: 环境名称 '{new_name}' 已存在。"
             )
@@ -284,38 +911,60 @@ class EnvironmentManager:
         old_path = self.config.base_dir / old_name
         new_path = self.config.base_dir / new_name
 
-        try:
-            # 1. 重命名备份目录
-            old_path.rename(new_path)
+        with state_lock():
+            try:
+                # 1. 重命名备份目录
+                old_path.rename(new_path)
 
-            # 2. 更新 state 对象
-            self.state.environments.remove(old_name)
-            self.state.environments.append(new_name)
-            save_env_state(self.state)
+                # 2. 更新注册表
+                self.registry.rename(old_name, new_name)
+                self._drop_profile_index(old_name)
+                self._flush_profile_index()
+                from claude_env.sync import rename_manifest
 
-            # 3. 重新激活 (更新符号链接以指向新路径)
-            self._activate_env(new_name)
+                rename_manifest(old_name, new_name)
+                from claude_env.clone import rename_shared_paths
 
-            self.console.print("[green]重命名成功！[/green]")
+                rename_shared_paths(old_name, new_name)
+                from claude_env.snapshot import env_snapshot_dir
 
-        except Exception as e:
-            self.console.print(f"[bold red]重命名失败[/bold red]: {e}")
-            # 尝试恢复
-            if new_path.is_dir() and not old_path.is_dir():
-                new_path.rename(old_path)
-            self.console.print("操作已回滚。")
+                old_snapshots = env_snapshot_dir(self.config.base_dir, old_name)
+                if old_snapshots.is_dir():
+                    old_snapshots.rename(env_snapshot_dir(self.config.base_dir, new_name))
+                from claude_env.usage import load_usage_state, save_usage_state
+
+                usage_state = load_usage_state()
+                if old_name in usage_state:
+                    usage_state[new_name] = usage_state.pop(old_name)
+                    save_usage_state(usage_state)
+
+                # 3. 重新激活 (更新符号链接以指向新路径)
+                self._activate_env(new_name)
+
+                self.console.print("[green]重命名成功！[/green]")
+
+            except Exception as e:
+                self.console.print(f"[bold red]重命名失败[/bold red]: {e}")
+                # 尝试恢复
+                if new_path.is_dir() and not old_path.is_dir():
+                    new_path.rename(old_path)
+                self.console.print("操作已回滚。")
 
-    def list_envs(self):
+    def list_envs(self, show_size: bool = False):
         """
         列出所有已保存的环境 (包含 email)，并使用表格显示。
+        show_size 为 True 时增加一列磁盘占用 (使用 du 的目录缓存)。
         """
-        if not self.state.environments:
+        env_names = self.registry.names()
+        if not env_names:
             self.console.print("未找到任何环境。")
             self.console.print(
                 "请运行 'init' 来自动检测当前配置，或 'add' 来创建新环境。"
             )
             return
 
+        from rich.table import Table
+
         self.console.print()  # 添加一个空行
 
         table = Table(
@@ -331,17 +980,48 @@ class EnvironmentManager:
         table.add_column("用户信息", style="yellow")
         table.add_column("Endpoint", style="green")
         table.add_column("路径", style="dim")
+        if show_size:
+            from claude_env.du import breakdown, format_size
+
+            table.add_column("大小", style="yellow", justify="right")
+            own_sizes = self._scan_env_sizes(
+                [self.config.base_dir / env for env in env_names]
+            )
+            sizes = {
+                env: sum(breakdown(self.config.base_dir / env, own_sizes).values())
+                for env in env_names
+            }
 
         active_env = self._get_active_env()
 
-        for env in self.state.environments:
-            config_path = self.config.base_dir / env / self.primary_config_file
+        from claude_env.archive import ARCHIVE_DIR_NAME, load_archive_state
+
+        archived = load_archive_state()
+
+        # 并发探测所有环境 (优先使用元数据索引)，再按 env.yaml 中的顺序输出
+        profiles = self._probe_env_profiles(env_names)
+
+        for env in env_names:
+            profile = profiles[env]
+            if profile is None:
+                table.add_row(
+                    "[red]✗ 超时[/red]",
+                    env,
+                    "[dim]-[/dim]",
+                    "[dim]-[/dim]",
+                    "[dim]-[/dim]",
+                    f"~/.claude_env/{env}",
+                    *(["[dim]-[/dim]"] if show_size else []),
+                )
+                continue
 
             # 1. 状态（激活 + 可用性）
             is_active = env == active_env
-            is_valid = is_auth_valid(config_path)
+            is_valid = profile.is_valid
 
-            if is_active and is_valid:
+            if env in archived and not (self.config.base_dir / env).is_dir():
+                status_marker = "[blue]📦 归档[/blue]"
+            elif is_active and is_valid:
                 status_marker = "[green]✓ 激活[/green]"
             elif is_active and not is_valid:
                 status_marker = "[yellow]⚠ 激活[/yellow]"
@@ -354,7 +1034,7 @@ class EnvironmentManager:
             env_name = env
 
             # 3. 认证类型
-            auth_type = get_auth_type(config_path)
+            auth_type = profile.auth_type
             auth_display = (
                 "OAuth"
                 if auth_type == "OAuth"
@@ -364,7 +1044,7 @@ class EnvironmentManager:
             )
 
             # 4. 用户信息（邮箱或 userID）
-            email = get_current_email(config_path)
+            email = profile.email
             if email:
                 user_display = email
             else:
@@ -373,7 +1053,7 @@ class EnvironmentManager:
                 )
 
             # 5. Endpoint（镜像 URL）
-            endpoint = get_api_endpoint(config_path)
+            endpoint = profile.endpoint
             if endpoint:
                 endpoint_display = endpoint
             elif auth_type == "API Key":
@@ -383,15 +1063,26 @@ class EnvironmentManager:
 
             # 6. 路径
             location_display = f"~/.claude_env/{env}"
+            if env in archived and not (self.config.base_dir / env).is_dir():
+                location_display = f"~/.claude_env/{ARCHIVE_DIR_NAME}/{archived[env]['file']}"
 
-            table.add_row(
+            row = [
                 status_marker,
                 env_name,
                 auth_display,
                 user_display,
                 endpoint_display,
                 location_display,
-            )
+            ]
+            if show_size:
+                row.append(format_size(sizes[env]) if sizes[env] else "[dim]-[/dim]")
+            table.add_row(*row)
+
+        # 记录认证类型到注册表 (sqlite 模式下用于元数据查询，yaml 模式下忽略)
+        self.registry.update_auth_types(
+            {env: p.auth_type for env, p in profiles.items() if p is not None}
+        )
+        self._flush_profile_index()
 
         self.console.print(table)
         self.console.print()
@@ -400,48 +1091,26 @@ class EnvironmentManager:
         """
         显示一个面板，包含当前工具状态和实际登录状态。
         """
+        from rich.panel import Panel
+        from claude_env.status import PANEL_TITLE, status_fields
+
         # 1. 工具认为的激活环境 (通过读取 symlink)
         tool_env = self._get_active_env()
 
-        # 2. 获取认证类型
-        auth_type = get_auth_type(self.primary_config_path_home)
-
-        # 3. 根据认证类型显示不同信息
-        if auth_type == "OAuth":
-            real_email = get_current_email(self.primary_config_path_home)
-            if real_email:
-                user_info = f"[green]{real_email}[/green]"
-                auth_status = "[green]✓ 已登录[/green]"
-            else:
-                user_info = "[red]未登录[/red]"
-                auth_status = "[red]✗ 未登录[/red]"
-            auth_info = (
-                f"[bold]认证类型:[/bold] [magenta]OAuth 订阅[/magenta]\n"
-                f"[bold]用户信息:[/bold] {user_info}\n"
-                f"[bold]状态:[/bold] {auth_status}"
-            )
-        elif auth_type == "API Key":
-            endpoint = get_api_endpoint(self.primary_config_path_home)
-            if endpoint:
-                endpoint_info = f"[green]{endpoint}[/green]"
-                auth_status = "[green]✓ 已配置[/green]"
-            else:
-                endpoint_info = "[red]未配置[/red]"
-                auth_status = "[red]✗ 未配置[/red]"
-            auth_info = (
-                f"[bold]认证类型:[/bold] [magenta]API Key 镜像[/magenta]\n"
-                f"[bold]Endpoint:[/bold] {endpoint_info}\n"
-                f"[bold]状态:[/bold] {auth_status}"
-            )
+        # 2. 获取认证类型 (链接有效时走索引，否则直接读取 home 下的文件)
+        if tool_env:
+            profile = self._get_env_profile(tool_env)
+            self._flush_profile_index()
         else:
-            auth_info = (
-                "[bold]认证类型:[/bold] [yellow]未知[/yellow]\n"
-                "[bold]状态:[/bold] [red]✗ 未配置[/red]"
+            profile = load_env_profile(self.primary_config_path_home)
+        auth_type = profile.auth_type
+
+        # 3. 根据认证类型显示不同信息 (与 status.py 的快速路径共用)
+        status_message = "\n".join(
+            f"[bold]{label}:[/bold] [{color}]{value}[/{color}]"
+            for label, value, color in status_fields(
+                tool_env, auth_type, profile.email, profile.endpoint
             )
-
-        status_message = (
-            f"[bold]激活环境:[/bold] [cyan]{tool_env if tool_env else '无 (已断开链接)'}[/cyan]\n"
-            + auth_info
         )
 
         # 4. 交叉验证
@@ -457,7 +1126,7 @@ class EnvironmentManager:
         self.console.print(
             Panel(
                 status_message + warning,
-                title="Claude-Env 状态面板",
+                title=PANEL_TITLE,
                 border_style="blue",
                 padding=(1, 2),
             )
@@ -495,28 +1164,30 @@ class EnvironmentManager:
 
         config_path = self.config.base_dir / active_env / self.primary_config_file
 
-        # 读取现有配置或创建新配置
+        # 读取现有配置或创建新配置 (读-改-写在跨进程锁内完成)
         try:
-            if config_path.is_file():
-                with open(config_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                data = {}
-
-            # 设置 API Key 和 Endpoint
-            data["apiKey"] = api_key
-            data["apiEndpoint"] = endpoint
-
-            # 确保有基本字段（兼容 Claude Code）
-            if "installMethod" not in data:
-                data["installMethod"] = "unknown"
-            if "autoUpdates" not in data:
-                data["autoUpdates"] = True
-
-            # 保存回文件
-            os.makedirs(config_path.parent, exist_ok=True)
-            with open(config_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with state_lock():
+                self._auto_snapshot(active_env, "set-api")
+                if config_path.is_file():
+                    with open(config_path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                else:
+                    data = {}
+
+                # 设置 API Key 和 Endpoint
+                data["apiKey"] = api_key
+                data["apiEndpoint"] = endpoint
+
+                # 确保有基本字段（兼容 Claude Code）
+                if "installMethod" not in data:
+                    data["installMethod"] = "unknown"
+                if "autoUpdates" not in data:
+                    data["autoUpdates"] = True
+
+                # 原子地保存回文件 (Claude Code 可能正在读取)
+                atomic_write_text(
+                    config_path, json.dumps(data, indent=2, ensure_ascii=False)
+                )
 
             self.console.print(
                 f"[green]✓ 成功配置 API Key 到环境 '[bold]{active_env}[/bold]'[/green]"
@@ -546,7 +1217,7 @@ class EnvironmentManager:
         删除指定的环境（交互式确认）
         """
         # 1. 检查环境是否存在
-        if env_name not in self.state.environments:
+        if env_name not in self.registry:
             self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
             return
 
@@ -561,7 +1232,6 @@ class EnvironmentManager:
 
         # 3. 显示要删除的信息
         env_path = self.config.base_dir / env_name
-        config_path = self.config.base_dir / env_name / self.primary_config_file
 
         self.console.print()
         self.console.print("[bold red]⚠ 警告: 即将删除环境[/bold red]")
@@ -570,17 +1240,26 @@ class EnvironmentManager:
         self.console.print(f"  [bold]路径:[/bold] {env_path}")
 
         # 显示环境信息
-        auth_type = get_auth_type(config_path)
-        email = get_current_email(config_path)
-        endpoint = get_api_endpoint(config_path)
+        profile = self._get_env_profile(env_name)
+        auth_type = profile.auth_type
+        email = profile.email
+        endpoint = profile.endpoint
 
         if auth_type == "OAuth" and email:
             self.console.print(f"  [bold]用户:[/bold] {email}")
         elif auth_type == "API Key" and endpoint:
             self.console.print(f"  [bold]Endpoint:[/bold] {endpoint}")
 
+        from claude_env.trash import format_window
+
+        window = self.config.trash_undo_window
         self.console.print()
-        self.console.print("[bold red]此操作不可恢复！[/bold red]")
+        if window:
+            self.console.print(
+                f"[bold red]{format_window(window)}后将无法恢复！[/bold red]"
+            )
+        else:
+            self.console.print("[bold red]删除后无法恢复！[/bold red]")
         self.console.print()
 
         # 4. 交互式确认
@@ -599,30 +1278,994 @@ class EnvironmentManager:
         # 5. 执行删除
         self.console.print()
         try:
-            import shutil
-
-            # 删除环境目录
-            if env_path.exists():
-                shutil.rmtree(env_path)
-                self.console.print(f"[green]✓ 已删除目录:[/green] {env_path}")
-
-            # 从状态列表中移除
-            self.state.environments.remove(env_name)
-            save_env_state(self.state)
+            from claude_env.archive import (
+                archive_path,
+                load_archive_state,
+                save_archive_state,
+            )
+            from claude_env.clone import save_shared_paths
+            from claude_env.snapshot import env_snapshot_dir
+            from claude_env.sync import drop_manifest
+            from claude_env.trash import move_to_trash, spawn_reaper
+
+            with state_lock():
+                # 环境目录、快照和归档整体移入回收站 (rename，与目录大小无关)
+                archives = load_archive_state()
+                archive_entry = archives.pop(env_name, None)
+                extras = {
+                    "snapshots": env_snapshot_dir(self.config.base_dir, env_name)
+                }
+                if archive_entry is not None:
+                    extras["archive"] = archive_path(
+                        self.config.base_dir, archive_entry["file"]
+                    )
+                move_to_trash(
+                    self.config.base_dir, env_name, extras, {"archive": archive_entry}
+                )
+                if archive_entry is not None:
+                    save_archive_state(archives)
+                self.console.print(f"[green]✓ 已移入回收站:[/green] {env_path}")
+
+                # 从状态列表中移除
+                self.registry.remove(env_name)
+                self._drop_profile_index(env_name)
+                self._flush_profile_index()
+                drop_manifest(env_name)
+                save_shared_paths(env_name, {})
             self.console.print(f"[green]✓ 已从环境列表中移除:[/green] {env_name}")
 
+            # 撤销窗口过后由后台低优先级进程删除
+            spawn_reaper(self.config.base_dir, window, delay=window + 1)
+
             self.console.print()
             self.console.print(f"[green]成功删除环境 '[bold]{env_name}[/bold]'！[/green]")
+            if window:
+                self.console.print(
+                    f"[dim]{format_window(window)}内可使用 "
+                    f"'claude_env undo-remove {env_name}' 撤销[/dim]"
+                )
 
         except Exception as e:
             self.console.print(f"[bold red]删除失败[/bold red]: {e}")
 
+    def du(self, env_name: Optional[str] = None, refresh: bool = False):
+        """
+        显示各环境的磁盘占用及顶层子目录明细
+        """
+        from rich.table import Table
+        from claude_env.du import breakdown, format_size
+
+        if env_name and env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+        env_names = [env_name] if env_name else self.registry.names()
+        # 共享数据 (共享层、去重对象、快照、归档、回收站) 单独列出
+        extra_dirs = [".base", ".objects", ".snapshots", ".archive", ".trash"]
+        roots = [self.config.base_dir / env for env in env_names]
+        if not env_name:
+            roots += [self.config.base_dir / name for name in extra_dirs]
+
+        start = time.perf_counter()
+        own_sizes = self._scan_env_sizes(roots, refresh=refresh)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        table = Table(
+            title="[bold]磁盘占用[/bold]",
+            show_header=True,
+            header_style="bold magenta",
+            border_style="dim",
+        )
+        table.add_column("环境", style="bold cyan")
+        table.add_column("大小", style="yellow", justify="right")
+        table.add_column("主要子目录", style="dim")
+
+        grand_total = 0
+        for root in roots:
+            parts = breakdown(root, own_sizes)
+            total = sum(parts.values())
+            name = root.name
+            if name in extra_dirs:
+                if not total:
+                    continue
+                name = f"[dim]{name}[/dim]"
+            elif not root.is_dir():
+                table.add_row(name, "[dim]已归档[/dim]", "")
+                continue
+            else:
+                self.registry.update_size(root.name, total)
+            grand_total += total
+            top = [
+                f"{key} {format_size(size)}"
+                for key, size in sorted(parts.items(), key=lambda item: item[1], reverse=True)
+                if size
+            ]
+            # 单个环境时列出全部子目录，否则只列出最大的 3 个 (对象存储的分桶没有意义)
+            detail = "\n".join(top) if env_name else ", ".join(top[:3])
+            if root.name == ".objects":
+                detail = ""
+            table.add_row(name, format_size(total), detail)
+
+        self.console.print()
+        self.console.print(table)
+        self.console.print(
+            f"合计 [bold]{format_size(grand_total)}[/bold] [dim](扫描耗时 {elapsed_ms:.0f} ms)[/dim]"
+        )
+        self.console.print()
+
+    def prune(
+        self,
+        env_name: Optional[str] = None,
+        older_than_days: Optional[int] = None,
+        keep: Optional[int] = None,
+        max_size_mb: Optional[int] = None,
+        dry_run: bool = False,
+    ):
+        """
+        按年龄 / 数量 / 总量策略清理一个或所有环境的对话记录 (.claude/projects/**/*.jsonl)
+        """
+        from claude_env.du import format_size
+        from claude_env.prune import load_prune_state, prune_env, save_prune_state
+
+        if older_than_days is None:
+            older_than_days = self.config.prune_older_than_days
+        if keep is None:
+            keep = self.config.prune_keep_per_project
+        if max_size_mb is None:
+            max_size_mb = self.config.prune_max_size_mb
+        if older_than_days is None and keep is None and max_size_mb is None:
+            self.console.print(
+                "[bold red]错误[/bold red]: 请指定至少一个策略 "
+                "(--older-than / --keep / --max-size)，或在 config.yaml 中配置 prune_* 默认值。"
+            )
+            return
+        if env_name and env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+        env_names = [env_name] if env_name else self.registry.names()
+
+        total = PruneStats()
+        with state_lock():
+            state = load_prune_state()
+            for env in env_names:
+                env_dir = self.config.base_dir / env
+                if not env_dir.is_dir():
+                    continue  # 已归档
+                stats = prune_env(
+                    env_dir,
+                    state.setdefault(env, {}),
+                    older_than_days=older_than_days,
+                    keep=keep,
+                    max_size_mb=max_size_mb,
+                    dry_run=dry_run,
+                )
+                if stats.files_removed:
+                    print(
+                        f"  [清理] {env}: {stats.files_removed} 个对话记录, "
+                        f"{format_size(stats.bytes_reclaimed)}"
+                    )
+                for field in PruneStats.model_fields:
+                    setattr(total, field, getattr(total, field) + getattr(stats, field))
+            for env in list(state):
+                if env not in self.registry:
+                    del state[env]
+            if not dry_run:
+                save_prune_state(state)
+
+        action = "[yellow](dry-run)[/yellow] 将删除" if dry_run else "[green]✓ 已删除[/green]"
+        self.console.print(
+            f"{action} {total.files_removed} 个对话记录, "
+            f"{'可' if dry_run else '已'}回收 [bold]{format_size(total.bytes_reclaimed)}[/bold] "
+            f"[dim](检查 {total.dirs_scanned} 个目录, 按水位跳过 {total.dirs_skipped} 个)[/dim]"
+        )
+
+    def usage(self, env_name: Optional[str] = None, days: Optional[int] = None):
+        """
+        按天 / 模型统计一个或所有环境的 token 用量 (来自本地对话记录，增量解析)
+        """
+        from datetime import date, timedelta
+        from rich.table import Table
+        from claude_env.du import format_size
+        from claude_env.usage import (
+            aggregate,
+            load_usage_state,
+            merge_updates,
+            refresh_env,
+            save_usage_state,
+        )
+
+        if env_name and env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+        env_names = [env_name] if env_name else self.registry.names()
+        # 对话记录按本地日期分组 (usage.local_day)，起始日期同样使用本地日期
+        since = (date.today() - timedelta(days=days - 1)).isoformat() if days else None
+
+        start = time.perf_counter()
+        files_parsed = bytes_parsed = 0
+        # 解析在锁外进行 (首次解析可能需要较长时间)，只在合并、保存 .usage.json 时加锁
+        state = load_usage_state()
+        updates: dict[str, dict] = {}
+        for env in env_names:
+            env_dir = self.config.base_dir / env
+            if not env_dir.is_dir():
+                continue  # 已归档: 沿用归档前的统计
+            parsed, parsed_bytes, updated = refresh_env(env_dir, state.setdefault(env, {}))
+            files_parsed += parsed
+            bytes_parsed += parsed_bytes
+            if updated:
+                updates[env] = updated
+        if updates:
+            with state_lock():
+                state = load_usage_state()
+                for env, updated in updates.items():
+                    merge_updates(state.setdefault(env, {}), updated)
+                for env in list(state):
+                    if env not in self.registry:
+                        del state[env]
+                save_usage_state(state)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        table = Table(
+            title=(
+                f"[bold]Token 用量{f' (最近 {days} 天, 自 {since} 起)' if days else ''}[/bold]"
+                "\n[dim]日期为本地时间[/dim]"
+            ),
+            show_header=True,
+            header_style="bold magenta",
+            border_style="dim",
+        )
+        table.add_column("日期" if env_name else "环境", style="bold cyan")
+        table.add_column("模型", style="green")
+        for column in ("输入", "输出", "缓存写入", "缓存读取"):
+            table.add_column(column, style="yellow", justify="right")
+
+        grand_total = [0, 0, 0, 0]
+        for env in env_names:
+            per_day = aggregate(state.get(env, {}), since)
+            if env_name:
+                # 单个环境: 按天、模型逐行列出
+                rows = [
+                    (day, model, counts)
+                    for day in sorted(per_day, reverse=True)
+                    for model, counts in sorted(per_day[day].items())
+                ]
+            else:
+                # 所有环境: 每个环境按模型汇总
+                per_model: dict[str, list[int]] = {}
+                for models in per_day.values():
+                    for model, counts in models.items():
+                        total = per_model.setdefault(model, [0, 0, 0, 0])
+                        for i, value in enumerate(counts):
+                            total[i] += value
+                rows = [(env, model, counts) for model, counts in sorted(per_model.items())]
+            last_label = None
+            for label, model, counts in rows:
+                table.add_row(
+                    label if label != last_label else "",
+                    model,
+                    *(f"{value:,}" for value in counts),
+                )
+                last_label = label
+                for i, value in enumerate(counts):
+                    grand_total[i] += value
+
+        self.console.print()
+        self.console.print(table)
+        self.console.print(
+            f"合计 输入 [bold]{grand_total[0]:,}[/bold] / 输出 [bold]{grand_total[1]:,}[/bold] / "
+            f"缓存写入 {grand_total[2]:,} / 缓存读取 {grand_total[3]:,} "
+            f"[dim](新解析 {files_parsed} 个文件 {format_size(bytes_parsed)}, "
+            f"耗时 {elapsed_ms:.0f} ms)[/dim]"
+        )
+        self.console.print()
+
+    def _api_key_envs(self, env_names: list[str]) -> list[tuple[str, str, Optional[str]]]:
+        """
+        读取 API Key 环境的 (环境名, apiKey, apiEndpoint)。
+        显式指定的环境若已归档会先解压；未指定时跳过已归档和非 API Key 的环境
+        """
+        explicit = bool(env_names)
+        result = []
+        for env in env_names or self.registry.names():
+            if env not in self.registry:
+                self.console.print(f"[bold red]错误[/bold red]: 环境 '{env}' 不存在。")
+                continue
+            if explicit:
+                if not self._ensure_expanded(env):
+                    continue
+            elif not (self.config.base_dir / env).is_dir():
+                continue
+            config_path = self.config.base_dir / env / self.primary_config_file
+            try:
+                with open(config_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            api_key = data.get("apiKey") or data.get("api_key")
+            if not api_key:
+                if explicit:
+                    self.console.print(
+                        f"[yellow]跳过[/yellow] '{env}': 不是 API Key 环境 (请先使用 set-api 配置)"
+                    )
+                continue
+            endpoint = data.get("apiEndpoint") or data.get("api_endpoint") or data.get("endpoint")
+            result.append((env, api_key, endpoint))
+        return result
+
+    def proxy(
+        self,
+        env_names: list[str],
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ):
+        """
+        启动本地负载均衡代理，把请求分摊到多个 API Key 环境 (Ctrl+C 停止)
+        """
+        import asyncio
+        import secrets
+        from rich.table import Table
+        from claude_env.proxy import ProxyError, ProxyPool, Upstream, serve
+
+        host = host or self.config.proxy_host
+        port = port or self.config.proxy_port
+        token = self.config.proxy_token or secrets.token_urlsafe(24)
+        try:
+            upstreams = [
+                Upstream(env, api_key, endpoint)
+                for env, api_key, endpoint in self._api_key_envs(env_names)
+            ]
+            pool = ProxyPool(
+                upstreams,
+                token=token,
+                retries=self.config.proxy_retries,
+                backoff_max=self.config.proxy_backoff_max,
+                response_timeout=self.config.proxy_timeout,
+                max_body=self.config.proxy_max_body_mb * 1024 * 1024,
+            )
+        except ProxyError as e:
+            self.console.print(f"[bold red]错误[/bold red]: {e}")
+            if not env_names:
+                self.console.print("请先使用 set-api 为至少一个环境配置 API Key。")
+            return
+
+        self.console.print(f"[bold]上游 ({len(upstreams)} 个环境):[/bold]")
+        for upstream in upstreams:
+            self.console.print(
+                f"  • [cyan]{upstream.name}[/cyan] → {upstream.endpoint} "
+                f"[dim]({upstream.api_key[:8]}...{upstream.api_key[-4:]})[/dim]"
+            )
+        self.console.print()
+        self.console.print(f"[green]✓ 代理已启动[/green]: http://{host}:{port}")
+        self.console.print(f'  export ANTHROPIC_BASE_URL="http://{host}:{port}"')
+        # 代理会替请求注入真实的 API Key，只接受携带本次令牌的客户端
+        self.console.print(f'  export ANTHROPIC_API_KEY="{token}"')
+        if host not in ("127.0.0.1", "::1", "localhost"):
+            self.console.print(
+                f"[yellow]警告[/yellow]: 代理监听在 {host}，其他主机上持有令牌的客户端"
+                "都可以使用这些环境的 API Key。"
+            )
+        self.console.print("[dim]按 Ctrl+C 停止[/dim]")
+
+        try:
+            asyncio.run(serve(pool, host, port))
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            self.console.print(f"[bold red]代理启动失败[/bold red]: {e}")
+            return
+
+        table = Table(
+            title="[bold]代理统计[/bold]",
+            show_header=True,
+            header_style="bold magenta",
+            border_style="dim",
+        )
+        table.add_column("环境", style="bold cyan")
+        table.add_column("请求", justify="right")
+        table.add_column("429 / 5xx / 连接失败", style="red", justify="right")
+        table.add_column("新建连接", style="dim", justify="right")
+        for upstream in upstreams:
+            table.add_row(
+                upstream.name,
+                str(upstream.requests),
+                str(upstream.errors),
+                str(upstream.connections_opened),
+            )
+        self.console.print()
+        self.console.print(table)
+
+    def _measure_latency(
+        self, env_names: list[str], refresh: bool = False
+    ) -> tuple[list[tuple[str, dict]], int]:
+        """
+        并发测量 API Key 环境的 endpoint 延迟 (TTL 内复用缓存)，返回 (按速度排序的结果, 实际测量数)
+        """
+        from claude_env.latency import load_latency_cache, measure, rank, save_latency_cache
+
+        endpoints = {env: endpoint for env, _, endpoint in self._api_key_envs(env_names)}
+        if not endpoints:
+            return [], 0
+        # 测量在锁外进行 (最多 latency_samples * latency_timeout 秒，不阻塞 switch 等命令)，
+        # 新结果在锁内合并进最新的缓存再写回，并发的 probe 不会互相覆盖
+        results, fresh = measure(
+            endpoints,
+            load_latency_cache(),
+            samples=self.config.latency_samples,
+            timeout=self.config.latency_timeout,
+            ttl=self.config.latency_cache_ttl,
+            refresh=refresh,
+        )
+        measured = len(fresh)
+        if fresh:
+            with state_lock():
+                cache = load_latency_cache()
+                cache.update(fresh)
+                for env in list(cache):
+                    if env not in self.registry:
+                        del cache[env]
+                save_latency_cache(cache)
+        return rank(results), measured
+
+    def probe(self, env_names: list[str], refresh: bool = False):
+        """
+        并发测量各 API Key 环境 endpoint 的连接、TLS 和首字节时间，按速度排序显示
+        """
+        from rich.table import Table
+
+        ranked, measured = self._measure_latency(env_names, refresh=refresh)
+        if not ranked:
+            self.console.print("[yellow]没有可测量的 API Key 环境。[/yellow]")
+            self.console.print("请先使用 set-api 为环境配置 API Key 和 Endpoint。")
+            return
+
+        active_env = self._get_active_env()
+        table = Table(
+            title="[bold]Endpoint 延迟[/bold]",
+            show_header=True,
+            header_style="bold magenta",
+            border_style="dim",
+        )
+        table.add_column("#", justify="right", style="dim")
+        table.add_column("环境", style="bold cyan")
+        table.add_column("Endpoint", style="dim")
+        for column in ("DNS", "连接", "TLS", "TTFB", "总计"):
+            table.add_column(column, justify="right")
+
+        for rank, (env, result) in enumerate(ranked, 1):
+            name = f"{env} [green](当前)[/green]" if env == active_env else env
+            if result.get("total") is None:
+                table.add_row(
+                    "-", name, result["endpoint"], "", "", "", "",
+                    f"[red]{result.get('error') or '失败'}[/red]",
+                )
+                continue
+            table.add_row(
+                str(rank),
+                name,
+                result["endpoint"],
+                *(f"{result[phase]:.1f}" for phase in ("dns", "connect", "tls", "ttfb")),
+                f"[bold yellow]{result['total']:.1f} ms[/bold yellow]",
+            )
+
+        self.console.print()
+        self.console.print(table)
+        oldest = min(result["measured_at"] for _, result in ranked)
+        if measured < len(ranked):
+            self.console.print(
+                f"[dim]{len(ranked) - measured} 个结果来自缓存 "
+                f"(最早 {time.time() - oldest:.0f} 秒前测量，--refresh 重新测量)[/dim]"
+            )
+        self.console.print(f"[dim]每个 endpoint 采样 {self.config.latency_samples} 次，取中位数 (ms)[/dim]")
+        self.console.print()
+
+    def switch_fastest(self, refresh: bool = False):
+        """
+        切换到 endpoint 延迟最低的 API Key 环境
+        """
+        ranked, _ = self._measure_latency([], refresh=refresh)
+        reachable = [(env, result) for env, result in ranked if result.get("total") is not None]
+        if not reachable:
+            self.console.print("[bold red]错误[/bold red]: 没有可连接的 API Key 环境。")
+            return
+        env, result = reachable[0]
+        self.console.print(
+            f"最快的环境: [bold cyan]{env}[/bold cyan] "
+            f"({result['endpoint']}, {result['total']:.1f} ms)"
+        )
+        self.switch(env)
+
+    def undo_remove(self, env_name: str):
+        """
+        撤销 remove: 从回收站中恢复环境 (仅在撤销窗口内、数据尚未被回收时可用)
+        """
+        from claude_env.archive import archive_path, load_archive_state, save_archive_state
+        from claude_env.snapshot import env_snapshot_dir
+        from claude_env.trash import find_entry, read_meta, restore_entry
+
+        with state_lock():
+            entry = find_entry(self.config.base_dir, env_name)
+            if entry is None:
+                self.console.print(
+                    f"[bold red]错误[/bold red]: 回收站中没有环境 '{env_name}' (可能已被回收)。"
+                )
+                return
+            if env_name in self.registry or (self.config.base_dir / env_name).exists():
+                self.console.print(
+                    f"[bold red]错误[/bold red]: 环境 '{env_name}' 已存在，无法恢复。"
+                )
+                return
+
+            meta = read_meta(entry)
+            archive_entry = meta.get("archive")
+            extras = {"snapshots": env_snapshot_dir(self.config.base_dir, env_name)}
+            if archive_entry:
+                extras["archive"] = archive_path(self.config.base_dir, archive_entry["file"])
+            restore_entry(self.config.base_dir, entry, env_name, extras)
+            if archive_entry:
+                archives = load_archive_state()
+                archives[env_name] = archive_entry
+                save_archive_state(archives)
+            self.registry.add(env_name)
+
+        self.console.print(f"[green]✓ 已从回收站恢复环境 '[bold]{env_name}[/bold]'[/green]")
+
+    def dedup(self, env_name: Optional[str] = None):
+        """
+        对一个或所有环境做增量去重，内容相同的文件共享同一份对象
+        """
+        if env_name and env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+        env_names = [env_name] if env_name else self.registry.names()
+
+        from claude_env.dedup import ObjectStore
+
+        mode = "reflink" if ObjectStore(self.config.base_dir).supports_reflink() else "硬链接"
+        self.console.print(f"正在去重 {len(env_names)} 个环境 [dim](模式: {mode})[/dim] ...")
+        stats = self._run_dedup(env_names)
+        self.console.print(
+            f"[green]✓ 去重完成[/green]: 扫描 {stats.files_scanned} 个文件, "
+            f"重新计算哈希 {stats.files_hashed} 个, 新共享 {stats.files_linked} 个, "
+            f"节省 [bold]{stats.bytes_saved / 1024 / 1024:.1f} MB[/bold]"
+        )
+
+    def gc(self):
+        """
+        删除对象存储中不再被任何环境引用的对象
+        """
+        from claude_env.dedup import (
+            ObjectStore,
+            collect_garbage,
+            load_dedup_state,
+            save_dedup_state,
+        )
+
+        with state_lock():
+            # 先做一次增量去重，确保状态反映各环境的当前文件
+            self._run_dedup(self.registry.names())
+            state = load_dedup_state()
+            stats = collect_garbage(
+                ObjectStore(self.config.base_dir), state, self.registry.names()
+            )
+            save_dedup_state(state)
+        self.console.print(
+            f"[green]✓ 垃圾回收完成[/green]: 删除 {stats.objects_removed} 个对象, "
+            f"回收 [bold]{stats.bytes_reclaimed / 1024 / 1024:.1f} MB[/bold]"
+        )
+
+    def archive(
+        self,
+        env_name: Optional[str] = None,
+        days: Optional[int] = None,
+        dry_run: bool = False,
+    ):
+        """
+        归档冷环境: 超过 days 天 (默认 archive_after_days) 未使用的环境被打包并删除展开的目录。
+        当前环境和最近使用的 archive_keep_recent 个环境不会被归档。指定 env_name 时只归档该环境。
+        """
+        from claude_env.archive import (
+            archive_env,
+            cleanup_leftovers,
+            load_archive_state,
+            save_archive_state,
+        )
+
+        days = days if days is not None else self.config.archive_after_days
+        active_env = self._get_active_env() or self.registry.last_active_env
+        archived = load_archive_state()
+
+        def last_used(env: str) -> float:
+            # 没有激活记录的环境 (例如迁移前创建的) 使用主配置文件的修改时间
+            if env in used_times:
+                return used_times[env]
+            env_path = self.config.base_dir / env
+            for path in (env_path / self.primary_config_file, env_path):
+                try:
+                    return path.stat().st_mtime
+                except OSError:
+                    continue
+            return 0.0
+
+        used_times = self.registry.last_used_times()
+        expanded = [
+            env
+            for env in self.registry.names()
+            if env not in archived and (self.config.base_dir / env).is_dir()
+        ]
+        if env_name:
+            if env_name not in self.registry:
+                self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+                return
+            if env_name == active_env:
+                self.console.print(f"[bold red]错误[/bold red]: 不能归档当前激活的环境 '{env_name}'。")
+                return
+            if env_name not in expanded:
+                self.console.print(f"[yellow]环境 '{env_name}' 已归档。[/yellow]")
+                return
+            candidates = [env_name]
+        else:
+            by_recency = sorted(expanded, key=last_used, reverse=True)
+            keep = set(by_recency[: self.config.archive_keep_recent])
+            cutoff = time.time() - days * 86400
+            candidates = [
+                env
+                for env in by_recency
+                if env != active_env and env not in keep and last_used(env) < cutoff
+            ]
+
+        if not candidates:
+            self.console.print(f"没有超过 {days} 天未使用的环境需要归档。")
+            return
+
+        if dry_run:
+            self.console.print(f"[yellow](dry-run)[/yellow] 将归档 {len(candidates)} 个环境:")
+            for env in candidates:
+                idle_days = (time.time() - last_used(env)) / 86400
+                self.console.print(f"  • {env} [dim](已 {idle_days:.0f} 天未使用)[/dim]")
+            return
+
+        # 归档前确保 index.json 中有这些环境的元数据，list 不需要解压即可显示
+        self._probe_env_profiles(candidates)
+        self._flush_profile_index()
+
+        total = ArchiveStats()
+        with state_lock():
+            cleanup_leftovers(self.config.base_dir)
+            archived = load_archive_state()
+            for env in candidates:
+                if env in archived or not (self.config.base_dir / env).is_dir():
+                    continue  # 并发的命令已处理
+                try:
+                    entry = archive_env(
+                        self.config.base_dir, env, self.config.archive_compression
+                    )
+                except OSError as e:
+                    self.console.print(f"[bold red]归档 {env} 失败[/bold red]: {e}")
+                    continue
+                archived[env] = entry
+                save_archive_state(archived)
+                total.envs_archived += 1
+                total.bytes_before += entry["bytes_before"]
+                total.archive_bytes += entry["archive_bytes"]
+                print(
+                    f"  [归档] {env}: {entry['bytes_before'] / 1024 / 1024:.1f} MB -> "
+                    f"{entry['archive_bytes'] / 1024 / 1024:.1f} MB ({entry['file']})"
+                )
+        total.bytes_reclaimed = max(total.bytes_before - total.archive_bytes, 0)
+        self.console.print(
+            f"[green]✓ 归档完成[/green]: {total.envs_archived} 个环境, "
+            f"回收 [bold]{total.bytes_reclaimed / 1024 / 1024:.1f} MB[/bold]"
+        )
+
+    def snapshot(self, env_name: Optional[str] = None, list_only: bool = False):
+        """
+        为环境 (默认当前环境) 创建快照，或列出已有快照
+        """
+        from claude_env.snapshot import env_snapshot_dir, list_snapshots
+
+        env_name = env_name or self._get_active_env()
+        if not env_name:
+            self.console.print("[bold red]错误[/bold red]: 没有激活的环境，请指定环境名称。")
+            return
+        if env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+
+        if list_only:
+            ids = list_snapshots(self.config.base_dir, env_name)
+            if not ids:
+                self.console.print(f"环境 '{env_name}' 还没有快照。")
+                return
+            self.console.print(f"[bold]环境 '{env_name}' 的快照[/bold] (从新到旧):")
+            for snapshot_id in reversed(ids):
+                self.console.print(f"  • {snapshot_id}")
+            self.console.print(
+                f"[dim]位置: {env_snapshot_dir(self.config.base_dir, env_name)}[/dim]"
+            )
+            return
+
+        if not self._ensure_expanded(env_name):
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 的目录未找到。")
+            return
+        start = time.perf_counter()
+        try:
+            snapshot_id = self._take_snapshot(env_name, "manual")
+        except OSError as e:
+            self.console.print(f"[bold red]创建快照失败[/bold red]: {e}")
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.console.print(
+            f"[green]✓ 已创建快照[/green] [bold]{snapshot_id}[/bold] "
+            f"[dim]({elapsed_ms:.1f} ms)[/dim]"
+        )
+
+    def restore(self, env_name: Optional[str] = None, snapshot_id: Optional[str] = None):
+        """
+        把环境 (默认当前环境) 恢复到指定快照 (默认最新的快照)，只重写有差异的文件。
+        恢复前会先为当前状态创建一个快照，恢复本身也可以撤销。
+        """
+        from claude_env.snapshot import list_snapshots, restore_snapshot
+
+        env_name = env_name or self._get_active_env()
+        if not env_name:
+            self.console.print("[bold red]错误[/bold red]: 没有激活的环境，请指定环境名称。")
+            return
+        if env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+
+        with state_lock():
+            ids = list_snapshots(self.config.base_dir, env_name)
+            if snapshot_id is None:
+                snapshot_id = ids[-1] if ids else None
+            if snapshot_id is None or snapshot_id not in ids:
+                self.console.print(
+                    f"[bold red]错误[/bold red]: 环境 '{env_name}' 没有快照 "
+                    f"'{snapshot_id or ''}'。使用 'snapshot --list' 查看可用快照。"
+                )
+                return
+            if not self._ensure_expanded(env_name):
+                self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 的目录未找到。")
+                return
+
+            # 先把 home 中被替换成实体文件的内容收回，再恢复
+            if env_name == self._get_active_env():
+                self._save_current_env(env_name)
+            try:
+                undo_id = self._take_snapshot(env_name, "pre-restore")
+                rewritten, removed = restore_snapshot(
+                    self.config.base_dir,
+                    env_name,
+                    snapshot_id,
+                    self.config.snapshot_exclude,
+                )
+            except OSError as e:
+                self.console.print(f"[bold red]恢复失败[/bold red]: {e}")
+                return
+            self._drop_profile_index(env_name)
+            self._flush_profile_index()
+
+        self.console.print(
+            f"[green]✓ 已将 '[bold]{env_name}[/bold]' 恢复到快照 {snapshot_id}[/green]: "
+            f"重写 {rewritten} 个文件, 删除 {removed} 个文件"
+        )
+        self.console.print(f"[dim]如需撤销: claude_env restore {env_name} --id {undo_id}[/dim]")
+
+    def export_env(
+        self,
+        env_name: str,
+        output: str = "-",
+        since: Optional[str] = None,
+        include: Optional[list[str]] = None,
+        exclude: Optional[list[str]] = None,
+        manifest_out: Optional[str] = None,
+    ):
+        """
+        把环境导出为流式 bundle。output 为 "-" (stdout)、文件路径，或一个目录:
+        目录模式下自动以目录中上一次的清单为基准做增量导出 (目录充当“远端”)。
+        """
+        import sys
+        from claude_env.bundle import (
+            BundleError,
+            build_manifest,
+            read_manifest,
+            scan_env,
+            write_bundle,
+        )
+
+        # 写到 stdout 时，提示信息只能输出到 stderr
+        console = Console(stderr=True) if output == "-" else self.console
+        if env_name not in self.registry:
+            console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return
+        if not self._ensure_expanded(env_name, console=console):
+            console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 的目录未找到。")
+            return
+
+        env_dir = self.config.base_dir / env_name
+        remote_dir = Path(output) if output != "-" and Path(output).is_dir() else None
+        try:
+            base = None
+            if since:
+                base = read_manifest(Path(since))
+            elif remote_dir and (remote_dir / f"{env_name}.manifest.json").is_file():
+                base = read_manifest(remote_dir / f"{env_name}.manifest.json")
+            files = scan_env(
+                env_dir,
+                include or [],
+                self.config.bundle_exclude + (exclude or []),
+                self.config.shared_paths,
+            )
+            manifest = build_manifest(env_name, files, base)
+
+            if output == "-":
+                size = write_bundle(env_dir, manifest, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+                target = "stdout"
+            else:
+                if remote_dir:
+                    dest = remote_dir / f"{env_name}-{manifest['id']}.tar.gz"
+                    manifest_out = manifest_out or str(remote_dir / f"{env_name}.manifest.json")
+                else:
+                    dest = Path(output)
+                tmp_path = dest.with_name(f".{dest.name}.tmp-{os.getpid()}")
+                try:
+                    with open(tmp_path, "wb") as f:
+                        size = write_bundle(env_dir, manifest, f)
+                    os.replace(tmp_path, dest)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+                target = str(dest)
+            if manifest_out:
+                atomic_write_text(
+                    Path(manifest_out), json.dumps(manifest, ensure_ascii=False)
+                )
+        except (OSError, ValueError, BundleError) as e:
+            console.print(f"[bold red]导出失败[/bold red]: {e}")
+            return
+
+        kind = f"增量 (基准 {manifest['base']})" if manifest["base"] else "完整"
+        console.print(
+            f"[green]✓ 已导出 '[bold]{env_name}[/bold]'[/green] -> {target}: {kind}, "
+            f"{len(manifest['changed'])} 个文件 ({size / 1024 / 1024:.1f} MB), "
+            f"删除 {len(manifest['deleted'])} 个"
+        )
+
+    def import_env(self, source: str = "-", env_name: Optional[str] = None):
+        """
+        导入 bundle。source 为 "-" (stdin)、bundle 文件，或 export 使用的目录:
+        目录模式下按基准链依次应用尚未导入的 bundle。
+        """
+        import sys
+        from claude_env.bundle import BundleError, import_bundle, load_bundle_state, read_manifest
+
+        def apply(stream) -> Optional[str]:
+            try:
+                with state_lock():
+                    manifest, name, count = import_bundle(
+                        self.config.base_dir, stream, env_name, self.registry.__contains__
+                    )
+                    if manifest["base"] is None:
+                        self.registry.add(name)
+                    self._drop_profile_index(name)
+                    self._flush_profile_index()
+            except (OSError, ValueError, BundleError) as e:
+                self.console.print(f"[bold red]导入失败[/bold red]: {e}")
+                return None
+            kind = "增量" if manifest["base"] else "完整"
+            self.console.print(
+                f"[green]✓ 已导入[/green] {kind} bundle {manifest['id']} -> "
+                f"'[bold]{name}[/bold]': 写入 {count} 个文件, 删除 {len(manifest['deleted'])} 个"
+            )
+            return name
+
+        source_path = Path(source)
+        if source == "-":
+            apply(sys.stdin.buffer)
+            return
+        if not source_path.is_dir():
+            with open(source_path, "rb") as f:
+                apply(f)
+            return
+
+        # 目录模式: 读取所有 bundle 的清单，按基准链应用
+        bundles: dict[str, list[tuple[dict, Path]]] = {}
+        for path in sorted(source_path.glob("*.tar.gz")):
+            try:
+                manifest = read_manifest(path)
+            except (OSError, ValueError, BundleError):
+                continue
+            bundles.setdefault(manifest["env"], []).append((manifest, path))
+        names = [env_name] if env_name else sorted(bundles)
+        for name in names:
+            chain = bundles.get(name, [])
+            current = load_bundle_state().get(name) if name in self.registry else None
+            if current is None and name in self.registry:
+                self.console.print(
+                    f"[yellow]跳过 '{name}'[/yellow]: 本地已有同名环境且不是从 bundle 导入的。"
+                )
+                continue
+            applied = 0
+            while True:
+                # 基准为 current 的 bundle (未导入时取最新的完整 bundle)
+                candidates = [(m, p) for m, p in chain if m["base"] == current]
+                if not candidates:
+                    break
+                manifest, path = candidates[-1]
+                with open(path, "rb") as f:
+                    if apply(f) is None:
+                        applied = -1
+                        break
+                current = manifest["id"]
+                applied += 1
+            if applied == 0:
+                self.console.print(f"'{name}' 已是最新。")
+
+    def exec_in_env(self, env_name: str, command: list[str]) -> int:
+        """
+        在指定环境中运行一个命令，不修改全局的符号链接。
+        子进程的 HOME 指向一个私有覆盖层：managed_paths 链接到该环境，
+        其余条目链接回真实的 $HOME。返回子进程的退出码。
+        """
+        from claude_env.overlay import (
+            build_home_overlay,
+            cleanup_stale_overlays,
+            remove_overlay,
+        )
+
+        if env_name not in self.registry:
+            self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 不存在。")
+            return 1
+        if not command:
+            self.console.print("[bold red]错误[/bold red]: 请在 -- 之后指定要运行的命令。")
+            return 2
+
+        overlay_root = self.config.base_dir / ".exec"
+        cleanup_stale_overlays(overlay_root)
+        with state_lock():
+            if not self._ensure_expanded(env_name):
+                self.console.print(f"[bold red]错误[/bold red]: 环境 '{env_name}' 的目录未找到。")
+                return 1
+            self._apply_shared_layer(env_name)
+        overlay = build_home_overlay(
+            Path.home(),
+            self.config.base_dir / env_name,
+            self.config.managed_paths,
+            overlay_root,
+        )
+
+        child_env = dict(os.environ, HOME=str(overlay), CLAUDE_ENV=env_name)
+        try:
+            try:
+                proc = subprocess.Popen(command, env=child_env)
+            except OSError as e:
+                self.console.print(f"[bold red]启动失败[/bold red]: {e}")
+                return 127
+            # Ctrl+C 由子进程自己处理，这里只等待它退出
+            previous = signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                returncode = proc.wait()
+            finally:
+                signal.signal(signal.SIGINT, previous)
+        finally:
+            # Claude Code 可能用 写临时文件+rename 替换了覆盖层中的链接，收回这些修改
+            with state_lock():
+                self._save_current_env(env_name, home_dir=overlay)
+            remove_overlay(
+                overlay,
+                Path.home(),
+                self.config.managed_paths,
+                self.config.base_dir / env_name,
+            )
+
+        # 与 shell 一致: 被信号终止时返回 128 + 信号编号
+        return 128 - returncode if returncode < 0 else returncode
+
     def uninstall(self):
         """
         卸载 ClaudeCodeManager（交互式确认）
         """
         import subprocess
-        import shutil
         from pathlib import Path
 
         self.console.print()
@@ -671,10 +2314,13 @@ class EnvironmentManager:
             delete_data = "n"
 
         if delete_data in ["y", "yes"]:
+            from claude_env.trash import detach_tree
+
             env_dir = Path.home() / ".claude_env"
             if env_dir.exists():
                 try:
-                    shutil.rmtree(env_dir)
+                    # 先整体改名再在后台删除，命令立即返回
+                    detach_tree(env_dir)
                     self.console.print(f"[green]✓ 已删除环境数据:[/green] {env_dir}")
                 except Exception as e:
                     self.console.print(f"[red]✗ 删除环境数据失败:[/red] {e}")
@@ -689,3 +2335,39 @@ class EnvironmentManager:
         self.console.print()
         self.console.print("[dim]项目源代码仍保留在当前目录[/dim]")
         self.console.print("[dim]如需完全删除，请手动删除项目目录[/dim]")
+
+    def watch(self, interval: float = 1.0, debounce: float = 0.2, force_poll: bool = False):
+        """
+        持续监听 managed paths：一旦链接被 Claude Code 替换为真实文件，
+        立即把新内容收回激活环境并恢复链接。
+        """
+        from claude_env.watch import InotifyWatcher, create_watcher
+
+        paths = [Path.home() / rel for rel in self.config.managed_paths]
+        watcher = create_watcher(paths, interval, force_poll=force_poll)
+        mode = "inotify" if isinstance(watcher, InotifyWatcher) else f"轮询 ({interval}s)"
+
+        self.console.print(f"[bold]正在监听 managed paths[/bold] [dim](模式: {mode})[/dim]")
+        for path in paths:
+            self.console.print(f"  • {path}")
+        self.console.print("[dim]按 Ctrl+C 退出[/dim]")
+
+        try:
+            # 启动时先修复一次
+            self._recapture_clobbered()
+            while True:
+                changed = watcher.wait()
+                if not changed:
+                    continue
+                # 合并短时间内的连续写入 (写临时文件 -> rename)
+                time.sleep(debounce)
+                repaired = self._recapture_clobbered()
+                if repaired:
+                    self.console.print(
+                        f"[green]✓ 已收回并恢复链接:[/green] {', '.join(repaired)}"
+                    )
+        except KeyboardInterrupt:
+            self.console.print()
+            self.console.print("[yellow]已停止监听[/yellow]")
+        finally:
+            watcher.close()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# claude_env/migrate.py
+# 描述: init 时把现有的 ~/.claude.json / ~/.claude 迁移到第一个环境
+# 同一文件系统上直接 rename(2)；跨文件系统时用有界线程池并发复制 (fast_copy_file:
+# reflink -> copy_file_range -> 普通读写)，逐个校验后记入日志，全部完成才删除源文件。
+# 中断后再次运行 init 会读取日志，跳过已完成的文件继续迁移。
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from claude_env.config import MIGRATE_JOURNAL_DIR
+from claude_env.models import MigrateStats
+from claude_env.utils import atomic_write_text, fast_copy_file
+
+PENDING_PATH = MIGRATE_JOURNAL_DIR / "pending.json"
+_HASH_CHUNK = 1024 * 1024
+
+
+def load_pending() -> Optional[dict]:
+    """
+    未完成的迁移: {"env": 环境名称}
+    """
+    try:
+        with open(PENDING_PATH, "r", encoding="utf-8") as f:
+            pending = json.load(f)
+        return pending if isinstance(pending, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def save_pending(env_name: str):
+    atomic_write_text(PENDING_PATH, json.dumps({"env": env_name}))
+
+
+def clear_pending():
+    shutil.rmtree(MIGRATE_JOURNAL_DIR, ignore_errors=True)
+
+
+def _journal_path(src: Path) -> Path:
+    return MIGRATE_JOURNAL_DIR / (hashlib.sha1(str(src).encode()).hexdigest() + ".log")
+
+
+def _load_journal(path: Path) -> dict[str, tuple[int, int]]:
+    """
+    日志每行: 相对路径 \\t size \\t mtime_ns (只追加；最后一行可能不完整)
+    """
+    done = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+                    done[parts[0]] = (int(parts[1]), int(parts[2]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _file_digest(path: Path) -> bytes:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _copy_verified(src: Path, dest: Path, verify: bool) -> int:
+    """
+    复制到临时文件，校验后再 rename 到目标位置，返回复制的字节数
+    """
+    tmp_path = dest.with_name(f".{dest.name}.migrate-tmp")
+    try:
+        size = fast_copy_file(src, tmp_path)
+        if os.stat(tmp_path).st_size != size or (
+            verify and _file_digest(src) != _file_digest(tmp_path)
+        ):
+            raise OSError(errno.EIO, f"校验失败: {src}")
+        # 数据落盘后才会记入日志，之后源文件会被删除
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+    return size
+
+
+def _scan(src: Path):
+    """
+    返回 (目录列表, 符号链接列表, 文件列表 [(相对路径, size, mtime_ns)])
+    """
+    dirs, links, files = [], [], []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(src / rel_dir) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(rel)
+                    stack.append(rel)
+                elif entry.is_symlink():
+                    links.append(rel)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((rel, st.st_size, st.st_mtime_ns))
+    return dirs, links, files
+
+
+def migrate_path(
+    src: Path,
+    dest: Path,
+    workers: int = 4,
+    verify: bool = True,
+    on_start: Optional[Callable[[int], None]] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> MigrateStats:
+    """
+    把 src (文件或目录) 迁移到 dest。
+    on_start 接收需要复制的总字节数，on_progress 接收每个完成文件的字节数 (可能在工作线程中调用)。
+    """
+    stats = MigrateStats()
+    journal_path = _journal_path(src)
+    os.makedirs(dest.parent, exist_ok=True)
+
+    # 1. 同一文件系统: 一次 rename 即可 (有日志说明上次已进入复制阶段)
+    if not journal_path.exists():
+        try:
+            os.rename(src, dest)
+            stats.renamed = True
+            return stats
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOTEMPTY, errno.EEXIST):
+                raise
+
+    if src.is_file():
+        if on_start:
+            on_start(src.stat().st_size)
+        stats.files_total = stats.files_copied = 1
+        stats.bytes_copied = _copy_verified(src, dest, verify)
+        if on_progress:
+            on_progress(stats.bytes_copied)
+        os.unlink(src)
+        return stats
+
+    # 2. 跨文件系统: 先建目录和符号链接，再并发复制文件
+    dirs, links, files = _scan(src)
+    done = _load_journal(journal_path)
+    os.makedirs(dest, exist_ok=True)
+    for rel in dirs:
+        os.makedirs(dest / rel, exist_ok=True)
+    for rel in links:
+        if os.path.lexists(dest / rel):
+            os.unlink(dest / rel)
+        os.symlink(os.readlink(src / rel), dest / rel)
+
+    pending = []
+    for rel, size, mtime_ns in files:
+        if done.get(rel) == (size, mtime_ns) and os.path.exists(dest / rel):
+            stats.files_resumed += 1
+        else:
+            pending.append((rel, size, mtime_ns))
+    stats.files_total = len(files)
+    if on_start:
+        on_start(sum(size for _, size, _ in pending))
+
+    os.makedirs(journal_path.parent, exist_ok=True)
+    with open(journal_path, "a", encoding="utf-8") as journal:
+
+        def copy_one(item):
+            rel, size, mtime_ns = item
+            copied = _copy_verified(src / rel, dest / rel, verify)
+            if on_progress:
+                on_progress(copied)
+            return item, copied
+
+        error: Optional[OSError] = None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="claude_env_migrate") as pool:
+            futures = [pool.submit(copy_one, item) for item in pending]
+            # 结果在主线程中按完成顺序写入日志，每条都落盘，中断时已复制的文件不会重做
+            for future in as_completed(futures):
+                try:
+                    (rel, size, mtime_ns), copied = future.result()
+                except OSError as e:
+                    error = error or e
+                    continue
+                journal.write(f"{rel}\t{size}\t{mtime_ns}\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+                stats.files_copied += 1
+                stats.bytes_copied += copied
+        if error is not None:
+            raise error
+
+    # 3. 目录的元数据最后设置 (复制文件会更新目录 mtime)
+    for rel in reversed(dirs):
+        shutil.copystat(src / rel, dest / rel, follow_symlinks=False)
+    shutil.copystat(src, dest)
+
+    # 4. 全部完成后才删除源目录和日志
+    shutil.rmtree(src)
+    journal_path.unlink(missing_ok=True)
+    return stats
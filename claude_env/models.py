@@ -3,13 +3,25 @@
 # 描述: 定义所有 Pydantic 数据模型
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from pathlib import Path
 
 # --- 路径常量 ---
 HOME_DIR = Path.home()
 # 新的配置根目录, 替换 ~/.claude_manager
 CONFIG_ROOT_DIR = HOME_DIR / ".claude_env"
+# pointer 切换模式下指向激活环境的符号链接 (~/.claude_env/current -> <env_name>)
+CURRENT_POINTER_NAME = "current"
+# 这些名称被 base_dir 下的管理文件占用，不能用作环境名称
+# (此外，以 "." 开头的名称也保留给内部目录，如 .sync)
+RESERVED_ENV_NAMES = {
+    CURRENT_POINTER_NAME,
+    "config.yaml",
+    "env.yaml",
+    "index.json",
+    "daemon.sock",
+    "registry.db",
+}
 
 
 # --- 模型定义 ---
@@ -30,6 +42,87 @@ class AppConfig(BaseModel):
             ".claude",  # Claude Code 相关配置目录
         ]
     )
+    # 切换模式:
+    #   "direct"  - 每个 managed_path 直接链接到环境目录，切换时逐个重建链接
+    #   "pointer" - home 下的链接固定指向 base_dir/current/<path>，
+    #               切换时只用 rename(2) 原子替换 current 指针
+    switch_mode: Literal["direct", "pointer"] = "direct"
+    # 环境列表的存储方式:
+    #   "yaml"   - env.yaml 中的列表 (默认)
+    #   "sqlite" - registry.db，带唯一索引和事务，首次启用时自动从 env.yaml 迁移
+    registry: Literal["yaml", "sqlite"] = "yaml"
+    # 去重 (claude_env dedup): 这些子树中内容相同的文件在各环境之间共享同一份对象
+    # (支持 reflink 时使用写时复制；否则使用硬链接，此时原地写入会影响所有共享该文件的环境，
+    #  因此默认只包含通常不会被原地修改的目录)
+    dedup_paths: List[str] = Field(
+        default_factory=lambda: [
+            ".claude/commands",
+            ".claude/agents",
+            ".claude/skills",
+            ".claude/plugins",
+        ]
+    )
+    # 每次 switch 后对刚离开的环境做一次增量去重
+    dedup_on_switch: bool = False
+    # 分层环境: 这些路径 (相对于 HOME，位于某个 managed_path 之内) 只在共享层
+    # base_dir/.base 中保存一份，所有环境通过符号链接共用，切换时不再随环境替换。
+    # 例如 [".claude/commands", ".claude/agents", ".claude/skills", ".claude/plugins"]
+    shared_paths: List[str] = Field(default_factory=list)
+    # 归档 (claude_env archive): 超过 archive_after_days 天未使用的环境被打包为
+    # base_dir/.archive/<env>.tar.xz (或 .tar.gz)，switch 时自动解压。
+    # 当前环境和最近使用的 archive_keep_recent 个环境始终保持展开
+    archive_after_days: int = Field(default=90, ge=1)
+    archive_keep_recent: int = Field(default=3, ge=0)
+    archive_compression: Literal["xz", "gz"] = "xz"
+    # 快照 (claude_env snapshot / restore): 每个环境保留最新的 snapshot_keep 个，
+    # 并删除超过 snapshot_max_age_days 天的快照 (0 表示不按时间删除)
+    snapshot_keep: int = Field(default=10, ge=1)
+    snapshot_max_age_days: int = Field(default=30, ge=0)
+    # 不进入快照的路径 (对话记录只追加且体积大，恢复时也不会被改动)
+    snapshot_exclude: List[str] = Field(default_factory=lambda: [".claude/projects"])
+    # 在 switch (离开的环境) 和 set-api 之前自动创建快照 (仅在 base_dir 支持 reflink 时)
+    auto_snapshot: bool = True
+    # prune 的默认策略 (命令行参数优先)，均为 None 时 prune 需要显式指定策略:
+    #   prune_older_than_days   - 删除超过 N 天未修改的对话记录
+    #   prune_keep_per_project  - 每个项目只保留最新的 N 个对话记录
+    #   prune_max_size_mb       - 每个环境的对话记录总量超过 N MB 时从最旧的开始删除
+    prune_older_than_days: Optional[int] = Field(default=None, ge=1)
+    prune_keep_per_project: Optional[int] = Field(default=None, ge=1)
+    prune_max_size_mb: Optional[int] = Field(default=None, ge=1)
+    # remove 之后可以用 undo-remove 撤销的时间 (秒)，之后回收站中的数据会在后台被删除
+    trash_undo_window: int = Field(default=600, ge=0)
+    # export 默认排除的路径 (对话记录与缓存)，可用 --include / --exclude 调整
+    bundle_exclude: List[str] = Field(
+        default_factory=lambda: [
+            ".claude/projects",
+            ".claude/todos",
+            ".claude/shell-snapshots",
+            ".claude/statsig",
+        ]
+    )
+    # init 跨文件系统迁移 ~/.claude 时的并发复制线程数
+    migrate_workers: int = Field(default=4, ge=1)
+    # list 时并发探测各环境的线程数 (网络文件系统上可适当调大)
+    probe_workers: int = Field(default=8, ge=1)
+    # 单个环境从开始探测起的最长等待时间 (秒)，超时的环境在表格中标记为超时
+    probe_timeout: float = Field(default=5.0, gt=0)
+    # 本地负载均衡代理 (claude_env proxy) 的监听地址
+    proxy_host: str = "127.0.0.1"
+    proxy_port: int = Field(default=8787, ge=1, le=65535)
+    # 上游返回 429 / 5xx 或连接失败时换其他上游重试的次数，以及单个上游最长的退避时间 (秒)
+    proxy_retries: int = Field(default=2, ge=0)
+    proxy_backoff_max: float = Field(default=60.0, gt=0)
+    # 等待上游响应头的最长时间 (秒)，超时按上游失败处理并换其他上游重试
+    proxy_timeout: float = Field(default=600.0, gt=0)
+    # 请求体的最大大小 (MB)：请求体需要完整缓存以便重试，超出时返回 413
+    proxy_max_body_mb: int = Field(default=32, ge=1)
+    # 客户端访问代理所需的令牌 (作为 ANTHROPIC_API_KEY 使用)；为空时每次启动随机生成
+    proxy_token: Optional[str] = None
+    # endpoint 延迟测量 (claude_env probe / switch --fastest): 每个 endpoint 的采样次数、
+    # 单次采样的超时 (秒)，以及结果缓存的有效期 (秒)
+    latency_samples: int = Field(default=3, ge=1)
+    latency_timeout: float = Field(default=5.0, gt=0)
+    latency_cache_ttl: int = Field(default=300, ge=0)
 
 
 class EnvState(BaseModel):
@@ -40,3 +133,85 @@ class EnvState(BaseModel):
     active_env: Optional[str] = None
     last_active_env: Optional[str] = None  # 记录上次激活的环境（用于自动保存）
     environments: List[str] = Field(default_factory=list)
+    last_used: Dict[str, float] = Field(default_factory=dict)  # 环境 -> 最近激活时间
+
+
+class EnvProfile(BaseModel):
+    """
+    单个环境 .claude.json 的解析结果 (一次解析, 多处复用)
+    """
+
+    auth_type: str = "Unknown"  # "OAuth", "API Key" 或 "Unknown"
+    email: Optional[str] = None  # email 或截断后的 userID
+    endpoint: Optional[str] = None
+    is_valid: bool = False
+
+
+class SyncStats(BaseModel):
+    """
+    一次增量同步的统计信息
+    """
+
+    files_scanned: int = 0
+    files_copied: int = 0
+    bytes_copied: int = 0
+
+
+class DedupStats(BaseModel):
+    """
+    一次去重 / 垃圾回收的统计信息
+    """
+
+    files_scanned: int = 0
+    files_hashed: int = 0
+    files_linked: int = 0
+    bytes_saved: int = 0
+    objects_removed: int = 0
+    bytes_reclaimed: int = 0
+
+
+class CloneStats(BaseModel):
+    """
+    一次环境克隆的统计信息
+    """
+
+    mode: str = "reflink"  # "reflink" 或 "hardlink"
+    files: int = 0
+    bytes: int = 0
+    # 以硬链接共享的文件: {相对路径: [size, mtime_ns]} (克隆时的 stat 签名)
+    shared_paths: Dict[str, List[int]] = Field(default_factory=dict)
+
+
+class ArchiveStats(BaseModel):
+    """
+    一次归档的统计信息
+    """
+
+    envs_archived: int = 0
+    bytes_before: int = 0  # 归档前环境目录中独占的数据量
+    archive_bytes: int = 0  # 压缩包大小
+    bytes_reclaimed: int = 0
+
+
+class MigrateStats(BaseModel):
+    """
+    一次迁移 (init 吸收现有配置) 的统计信息
+    """
+
+    renamed: bool = False  # 同一文件系统，直接 rename
+    files_total: int = 0
+    files_copied: int = 0
+    files_resumed: int = 0  # 上次中断前已完成、本次跳过的文件
+    bytes_copied: int = 0
+
+
+class PruneStats(BaseModel):
+    """
+    一次对话记录清理的统计信息
+    """
+
+    dirs_scanned: int = 0
+    dirs_skipped: int = 0  # 根据水位跳过、未列目录的项目
+    files_scanned: int = 0
+    files_removed: int = 0
+    bytes_reclaimed: int = 0
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# claude_env/overlay.py
+# 描述: 为 `claude_env exec` 构建私有的 HOME 覆盖层
+# 覆盖层中的每个条目都是指向真实 $HOME 对应条目的符号链接，
+# 只有 managed_paths 指向指定环境的目录。构建开销只是一次 scandir + 若干 symlink，
+# 与 $HOME 中文件的大小无关，因此可以同时启动大量绑定不同环境的进程。
+
+import os
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from claude_env.utils import atomic_write_text
+
+
+def _populate(real_dir: Path, overlay_dir: Path, overrides: dict[tuple[str, ...], Path]):
+    """
+    在 overlay_dir 中为 real_dir 的每个条目创建符号链接。
+    overrides 的键是相对路径的各级名称，值是该路径应指向的目标。
+    """
+    direct, nested = _group_overrides(overrides)
+
+    try:
+        names = os.listdir(real_dir)
+    except OSError:
+        names = []
+
+    for name in set(names) | set(direct) | set(nested):
+        link_path = overlay_dir / name
+        if name in direct:
+            link_path.symlink_to(direct[name])
+        elif name in nested:
+            link_path.mkdir()
+            _populate(real_dir / name, link_path, nested[name])
+        else:
+            link_path.symlink_to(real_dir / name)
+
+
+def _group_overrides(
+    overrides: dict[tuple[str, ...], Path],
+) -> tuple[dict[str, Path], dict[str, dict[tuple[str, ...], Path]]]:
+    """
+    按第一级名称分组: 直接覆盖的条目 / 需要继续向下展开的目录
+    """
+    direct: dict[str, Path] = {}
+    nested: dict[str, dict[tuple[str, ...], Path]] = {}
+    for parts, target in overrides.items():
+        if len(parts) == 1:
+            direct[parts[0]] = target
+        else:
+            nested.setdefault(parts[0], {})[parts[1:]] = target
+    return direct, nested
+
+
+def _overrides(env_path: Path, managed_paths: list[str]) -> dict[tuple[str, ...], Path]:
+    return {
+        Path(rel_path_str).parts: env_path / rel_path_str
+        for rel_path_str in managed_paths
+    }
+
+
+def _meta_path(overlay: Path) -> Path:
+    return overlay.with_name(overlay.name + ".json")
+
+
+def build_home_overlay(
+    real_home: Path, env_path: Path, managed_paths: list[str], parent_dir: Path
+) -> Path:
+    """
+    在 parent_dir 下创建一个新的 HOME 覆盖层，返回其路径。
+    目录名以当前进程 pid 开头，便于之后清理残留的覆盖层；
+    同名的 .json 记录真实 HOME 和环境路径，清理残留时据此把子进程新建的文件放回原处。
+    """
+    os.makedirs(parent_dir, exist_ok=True)
+    overlay = Path(tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=parent_dir))
+    atomic_write_text(
+        _meta_path(overlay),
+        json.dumps(
+            {
+                "home": str(real_home),
+                "env_path": str(env_path),
+                "managed_paths": list(managed_paths),
+            }
+        ),
+    )
+    _populate(real_home, overlay, _overrides(env_path, managed_paths))
+    return overlay
+
+
+def _restore_entries(
+    overlay_dir: Path,
+    real_dir: Optional[Path],
+    overrides: dict[tuple[str, ...], Path],
+    drop_overrides: bool,
+    kept: list[Path],
+):
+    """
+    拆除 overlay_dir: 符号链接直接删除；子进程新建或原子替换出来的真实文件/目录
+    移回真实 HOME 的对应位置 (real_dir 为 None 时无法确定位置，保留在覆盖层中)。
+    managed_paths 对应的条目在 drop_overrides 为 True 时删除 (调用方已保存回环境)，否则保留。
+    无法放回的条目加入 kept。
+    """
+    direct, nested = _group_overrides(overrides)
+    try:
+        entries = list(os.scandir(overlay_dir))
+    except OSError:
+        return
+    for entry in entries:
+        path = Path(entry.path)
+        if entry.is_symlink():
+            path.unlink()
+            continue
+        if entry.name in direct:
+            if drop_overrides:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink()
+            else:
+                kept.append(path)
+            continue
+
+        dest = real_dir / entry.name if real_dir is not None else None
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if is_dir and (entry.name in nested or (dest is not None and dest.is_dir())):
+            # 构建时创建的中间目录，或子进程在已有目录的位置新建的目录: 逐项处理
+            _restore_entries(path, dest, nested.get(entry.name, {}), drop_overrides, kept)
+            try:
+                path.rmdir()
+            except OSError:
+                pass  # 仍有保留的条目
+            continue
+        if dest is None or (dest.is_dir() and not dest.is_symlink()):
+            kept.append(path)
+            continue
+        try:
+            os.makedirs(dest.parent, exist_ok=True)
+            # 与子进程在真实 HOME 中执行 rename 的效果相同: 新内容覆盖旧文件
+            shutil.move(str(path), str(dest))
+            print(f"  [exec] 新文件已放回: {dest}")
+        except OSError as e:
+            print(f"  [警告] 无法放回 {path} -> {dest}: {e}")
+            kept.append(path)
+
+
+def remove_overlay(
+    overlay: Path,
+    real_home: Optional[Path] = None,
+    managed_paths: Optional[list[str]] = None,
+    env_path: Optional[Path] = None,
+    drop_overrides: bool = True,
+) -> list[Path]:
+    """
+    拆除覆盖层。覆盖层中除符号链接和中间目录外，还可能有子进程新建或原子替换
+    (写临时文件 + rename) 出来的真实文件，这些文件会被移回真实 $HOME，而不是随覆盖层删除。
+    managed_paths 中的条目由调用方先保存回环境 (drop_overrides=True 时随后删除)。
+    返回无法放回、因此保留在覆盖层中的条目。
+    """
+    meta_path = _meta_path(overlay)
+    if real_home is None:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            real_home = Path(meta["home"])
+            env_path = Path(meta["env_path"])
+            managed_paths = meta["managed_paths"]
+        except (OSError, ValueError, KeyError):
+            pass  # 没有记录: 真实文件一律保留
+    overrides = (
+        _overrides(env_path, managed_paths) if env_path is not None and managed_paths else {}
+    )
+
+    kept: list[Path] = []
+    _restore_entries(overlay, real_home, overrides, drop_overrides, kept)
+    if kept:
+        print(f"  [警告] 覆盖层中有 {len(kept)} 个条目无法放回 $HOME，已保留在 {overlay}:")
+        for path in kept[:10]:
+            print(f"    {path}")
+        return kept
+    try:
+        overlay.rmdir()
+    except OSError:
+        shutil.rmtree(overlay, ignore_errors=True)  # 只剩空目录
+    meta_path.unlink(missing_ok=True)
+    return kept
+
+
+def cleanup_stale_overlays(parent_dir: Path):
+    """
+    清理创建进程已不存在的覆盖层 (例如 exec 被 SIGKILL 中断)。
+    此时 managed_paths 中被替换的条目没有保存回环境，因此保留这些条目，其余照常放回
+    """
+    try:
+        entries = list(os.scandir(parent_dir))
+    except OSError:
+        return
+    for entry in entries:
+        pid_str = entry.name.split("-", 1)[0]
+        if not pid_str.isdigit():
+            continue
+        if entry.name.endswith(".json"):
+            if not Path(entry.path[: -len(".json")]).exists():
+                Path(entry.path).unlink(missing_ok=True)
+            continue
+        try:
+            os.kill(int(pid_str), 0)
+        except ProcessLookupError:
+            remove_overlay(Path(entry.path), drop_overrides=False)
+        except PermissionError:
+            pass  # 进程存在但属于其他用户
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# claude_env/prompt.py
+# 描述: `claude_env current` 的快速路径，供 PS1 / tmux 状态栏在每次渲染时调用
+# 只使用标准库：从 .layout.json 读取目录布局 (与 status 快速路径相同，一次 json 加载加一次
+# config.yaml 的 stat)，再一次 readlink 得到激活环境 (pointer 模式下再多一次)，
+# 不加载 config.yaml，不导入 Rich / Pydantic / PyYAML。
+# 布局缓存不存在或已过期时按默认布局 (~/.claude.json 与 ~/.claude_env) 解析。
+
+import os
+import json
+
+HOME_DIR = os.path.expanduser("~")
+CONFIG_ROOT_DIR = os.path.join(HOME_DIR, ".claude_env")
+CONFIG_PATH = os.path.join(CONFIG_ROOT_DIR, "config.yaml")
+LAYOUT_CACHE_PATH = os.path.join(CONFIG_ROOT_DIR, ".layout.json")
+INDEX_PATH = os.path.join(CONFIG_ROOT_DIR, "index.json")
+CURRENT_POINTER_NAME = "current"
+DEFAULT_PRIMARY = ".claude.json"
+
+AUTH_MARKERS = {True: "✓", False: "⚠"}
+
+
+def load_layout() -> tuple[str, str]:
+    """
+    返回 (base_dir, 主配置文件相对 HOME 的路径)。
+    布局缓存缺失、损坏或 config.yaml 在上次完整加载之后被修改过时返回默认布局。
+    """
+    try:
+        with open(LAYOUT_CACHE_PATH, "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        st = os.stat(CONFIG_PATH)
+        # 与 utils.stat_signature 相同: [inode, mtime_ns, size]
+        if layout["config"] == [st.st_ino, st.st_mtime_ns, st.st_size]:
+            return layout["base_dir"], layout["primary"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return CONFIG_ROOT_DIR, DEFAULT_PRIMARY
+
+
+def current_env_name() -> str | None:
+    """
+    通过 readlink 读取主配置文件 (默认 ~/.claude.json) 指向的环境名称，未激活时返回 None
+    """
+    base_dir, primary = load_layout()
+    try:
+        target = os.readlink(os.path.join(HOME_DIR, primary))
+    except OSError:
+        return None
+    if not os.path.isabs(target):
+        target = os.path.join(HOME_DIR, target)
+
+    prefix = base_dir.rstrip(os.sep) + os.sep
+    if not target.startswith(prefix):
+        return None
+    env_name = target[len(prefix) :].split(os.sep, 1)[0]
+
+    if env_name == CURRENT_POINTER_NAME:
+        # pointer 模式: <base_dir>/current -> <env_name>
+        try:
+            pointer = os.readlink(prefix + CURRENT_POINTER_NAME)
+        except OSError:
+            return None
+        env_name = os.path.basename(pointer.rstrip(os.sep))
+    return env_name or None
+
+
+def cached_auth_valid(env_name: str) -> bool | None:
+    """
+    从元数据索引 (index.json) 读取环境的可用性，没有缓存时返回 None
+    """
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(env_name)
+        return bool(entry["profile"]["is_valid"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def render_current(show_auth: bool = False) -> str | None:
+    """
+    返回用于提示符的文本，例如 "work" 或 "work ✓"
+    """
+    env_name = current_env_name()
+    if env_name is None:
+        return None
+    if show_auth:
+        valid = cached_auth_valid(env_name)
+        if valid is not None:
+            return f"{env_name} {AUTH_MARKERS[valid]}"
+    return env_name
+
+
+def main(argv: list[str]) -> int:
+    text = render_current(show_auth="--auth" in argv)
+    if text is None:
+        return 1
+    os.write(1, (text + "\n").encode())
+    return 0
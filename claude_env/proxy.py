@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+# claude_env/proxy.py
+# 描述: 本地负载均衡反向代理 (claude_env proxy)
+# 把发往本地端口的 API 请求分摊到多个 API Key 环境 (各自的 apiKey / apiEndpoint)。
+# 只使用 asyncio 标准库实现 HTTP/1.1:
+#   - 每个上游维护一组 keep-alive 空闲连接，复用连接避免重复握手
+#   - 路由选择进行中请求最少的上游 (least-outstanding)
+#   - 上游返回 429 / 5xx 或连接失败时按指数退避 (或 Retry-After) 暂停使用，并换一个上游重试
+#   - 响应 (包括 SSE 流式输出) 按块原样转发，不在内存中缓存
+# 代理会把真实的 API Key 注入每个请求，因此客户端必须携带本次运行的访问令牌
+# (x-api-key 或 Authorization: Bearer)，否则返回 401。
+
+import ssl
+import hmac
+import json
+import asyncio
+from typing import Optional
+from urllib.parse import urlsplit
+
+DEFAULT_ENDPOINT = "https://api.anthropic.com"
+# 每个上游最多保留的空闲连接数
+MAX_IDLE_CONNECTIONS = 32
+# 退避: 第 n 次连续失败暂停 BACKOFF_BASE * 2^(n-1) 秒，最长 backoff_max 秒
+BACKOFF_BASE = 1.0
+# 请求头 / 分块长度行的最大长度 (asyncio.StreamReader 的缓冲上限)
+STREAM_LIMIT = 1024 * 1024
+RELAY_CHUNK = 64 * 1024
+# 建立上游连接 (含 TLS 握手) 的超时 (秒)
+CONNECT_TIMEOUT = 10.0
+# 请求体的默认上限 (字节)，与 Messages API 的请求大小上限相同
+DEFAULT_MAX_BODY = 32 * 1024 * 1024
+
+# 逐跳头部，不转发给对端
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "upgrade",
+}
+# 由代理重新生成的请求头
+REWRITTEN_REQUEST_HEADERS = HOP_BY_HOP | {
+    "host",
+    "x-api-key",
+    "authorization",
+    "content-length",
+    "transfer-encoding",
+    # 请求体已经完整读取，不再需要 100-continue 握手
+    "expect",
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    413: "Content Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    529: "Overloaded",
+}
+
+
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class ProxyError(Exception):
+    """
+    代理无法完成请求 (请求格式错误或所有上游均不可用)
+    """
+
+
+class BodyTooLarge(ProxyError):
+    """
+    请求体超过 max_body
+    """
+
+
+class Upstream:
+    """
+    一个上游 (一个 API Key 环境): 连接池、进行中的请求数和退避状态
+    """
+
+    def __init__(self, name: str, api_key: str, endpoint: Optional[str] = None):
+        url = urlsplit(endpoint or DEFAULT_ENDPOINT)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ProxyError(f"环境 '{name}' 的 apiEndpoint 无效: {endpoint}")
+        self.name = name
+        self.api_key = api_key
+        self.endpoint = endpoint or DEFAULT_ENDPOINT
+        self.tls = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port or (443 if self.tls else 80)
+        self.host_header = url.netloc
+        self.base_path = url.path.rstrip("/")
+
+        self.outstanding = 0
+        self.failures = 0  # 连续失败次数
+        self.backoff_until = 0.0
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        # 统计
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+
+    async def acquire(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """
+        取一个空闲连接，没有时新建 (最多等待 CONNECT_TIMEOUT 秒)。返回 (reader, writer, 是否为复用的连接)
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host,
+                self.port,
+                ssl=_get_ssl_context() if self.tls else None,
+                limit=STREAM_LIMIT,
+            ),
+            CONNECT_TIMEOUT,
+        )
+        self.connections_opened += 1
+        return reader, writer, False
+
+    def release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reusable: bool):
+        if reusable and len(self.idle) < MAX_IDLE_CONNECTIONS and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+    def mark_failure(self, now: float, backoff_max: float, retry_after: Optional[float] = None):
+        self.errors += 1
+        self.failures += 1
+        delay = retry_after if retry_after is not None else BACKOFF_BASE * 2 ** (self.failures - 1)
+        self.backoff_until = now + min(delay, backoff_max)
+
+    def mark_success(self):
+        self.failures = 0
+        self.backoff_until = 0.0
+
+
+class ProxyPool:
+    """
+    一组上游及路由策略
+    """
+
+    def __init__(
+        self,
+        upstreams: list[Upstream],
+        token: Optional[str] = None,
+        retries: int = 2,
+        backoff_max: float = 60.0,
+        response_timeout: float = 600.0,
+        max_body: int = DEFAULT_MAX_BODY,
+    ):
+        """
+        token: 客户端必须携带的访问令牌 (None 表示不校验，仅用于测试)
+        response_timeout: 发出请求后等待上游响应头的最长时间 (秒)，超时按上游失败处理
+        max_body: 请求体的最大字节数 (请求体需要完整缓存以便重试)，超出时返回 413
+        """
+        if not upstreams:
+            raise ProxyError("没有可用的上游")
+        self.upstreams = upstreams
+        self.token = token
+        self.retries = retries
+        self.backoff_max = backoff_max
+        self.response_timeout = response_timeout
+        self.max_body = max_body
+
+    def authorized(self, headers: list[tuple[str, str]]) -> bool:
+        if self.token is None:
+            return True
+        presented = header_value(headers, "x-api-key")
+        if presented is None:
+            authorization = header_value(headers, "authorization", "")
+            scheme, _, presented = authorization.partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+        return hmac.compare_digest(presented.strip().encode(), self.token.encode())
+
+    def pick(self, exclude: set) -> Optional[Upstream]:
+        """
+        least-outstanding: 在未退避的上游中选进行中请求最少的 (相同时选累计请求最少的)；
+        全部处于退避时选最早恢复的那个
+        """
+        candidates = [u for u in self.upstreams if u not in exclude]
+        if not candidates:
+            return None
+        now = asyncio.get_running_loop().time()
+        healthy = [u for u in candidates if u.backoff_until <= now]
+        if healthy:
+            return min(healthy, key=lambda u: (u.outstanding, u.requests))
+        return min(candidates, key=lambda u: u.backoff_until)
+
+    def close(self):
+        for upstream in self.upstreams:
+            upstream.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        处理一个客户端连接上的所有请求 (HTTP/1.1 keep-alive)
+        """
+        try:
+            while True:
+                try:
+                    request = await read_head(reader)
+                except ProxyError as e:
+                    await write_error(writer, 400, "Bad Request", str(e))
+                    break
+                if request is None:
+                    break
+                start_line, headers = request
+                try:
+                    method, target, version = start_line.split(" ", 2)
+                    if not self.authorized(headers):
+                        await write_error(
+                            writer, 401, "Unauthorized", "缺少或错误的代理访问令牌"
+                        )
+                        break
+                    if header_value(headers, "expect", "").lower() == "100-continue":
+                        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    body = await read_body(reader, headers, self.max_body)
+                except BodyTooLarge as e:
+                    # 请求体没有读完，连接无法继续使用
+                    await write_error(writer, 413, "Content Too Large", str(e))
+                    break
+                except (ValueError, ProxyError) as e:
+                    await write_error(writer, 400, "Bad Request", f"无效的请求: {e}")
+                    break
+                client_close = (
+                    version == "HTTP/1.0"
+                    or header_value(headers, "connection", "").lower() == "close"
+                )
+                keep_alive = await self.handle_request(writer, method, target, headers, body)
+                if client_close or not keep_alive:
+                    break
+        except (OSError, asyncio.IncompleteReadError):
+            pass  # 客户端断开
+        finally:
+            writer.close()
+
+    async def handle_request(
+        self,
+        writer: asyncio.StreamWriter,
+        method: str,
+        target: str,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> bool:
+        """
+        转发一个请求，必要时换上游重试。返回客户端连接是否可以继续使用
+        """
+        loop = asyncio.get_running_loop()
+        tried: set = set()
+        last_error = "所有上游均不可用"
+        for attempt in range(self.retries + 1):
+            upstream = self.pick(tried)
+            if upstream is None:
+                break
+            tried.add(upstream)
+            upstream.outstanding += 1
+            upstream.requests += 1
+            try:
+                try:
+                    reader, conn, status, response_headers = await self._send(
+                        upstream, method, target, headers, body
+                    )
+                except (OSError, asyncio.IncompleteReadError, ProxyError) as e:
+                    upstream.mark_failure(loop.time(), self.backoff_max)
+                    last_error = f"{upstream.name}: {str(e) or type(e).__name__}"
+                    continue
+
+                if status == 429 or status >= 500:
+                    upstream.mark_failure(
+                        loop.time(), self.backoff_max, retry_after(response_headers)
+                    )
+                    can_retry = attempt < self.retries and self.pick(tried) is not None
+                    if can_retry:
+                        upstream.release(
+                            reader, conn, await discard_response(reader, response_headers)
+                        )
+                        continue
+                else:
+                    upstream.mark_success()
+
+                # 开始向客户端写响应后不能再重试，出错时两端连接都关闭
+                try:
+                    reusable = await relay_response(
+                        reader, writer, method, status, response_headers
+                    )
+                except (OSError, asyncio.IncompleteReadError):
+                    upstream.release(reader, conn, reusable=False)
+                    return False
+                upstream.release(reader, conn, reusable)
+                return reusable
+            finally:
+                upstream.outstanding -= 1
+
+        await write_error(writer, 502, "Bad Gateway", last_error)
+        return True
+
+    async def _send(
+        self,
+        upstream: Upstream,
+        method: str,
+        target: str,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ):
+        """
+        在上游连接上发送请求并读取响应头 (跳过 1xx 中间响应)。
+        复用的空闲连接可能已被上游关闭，此时换新连接重发一次；等待响应头超时则直接失败
+        """
+        use_bearer = header_value(headers, "authorization") is not None
+        out_headers = [
+            (name, value) for name, value in headers if name.lower() not in REWRITTEN_REQUEST_HEADERS
+        ]
+        out_headers.append(("Host", upstream.host_header))
+        if use_bearer:
+            out_headers.append(("Authorization", f"Bearer {upstream.api_key}"))
+        else:
+            out_headers.append(("x-api-key", upstream.api_key))
+        if body or method in ("POST", "PUT", "PATCH"):
+            out_headers.append(("Content-Length", str(len(body))))
+        head = f"{method} {upstream.base_path}{target} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in out_headers
+        )
+        payload = head.encode("latin-1") + b"\r\n" + body
+
+        while True:
+            reader, conn, reused = await upstream.acquire()
+            try:
+                conn.write(payload)
+                await conn.drain()
+                status, response_headers = await asyncio.wait_for(
+                    _read_final_head(reader), self.response_timeout
+                )
+            except TimeoutError:
+                conn.close()
+                raise
+            except (OSError, asyncio.IncompleteReadError, ProxyError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            return reader, conn, status, response_headers
+
+
+async def _read_final_head(reader: asyncio.StreamReader) -> tuple[int, list[tuple[str, str]]]:
+    """
+    读取最终的响应头；100 Continue 等 1xx 中间响应没有响应体，直接跳过
+    """
+    while True:
+        response = await read_head(reader)
+        if response is None:
+            raise asyncio.IncompleteReadError(b"", None)
+        status_line, headers = response
+        try:
+            status = int(status_line.split(" ", 2)[1])
+        except (IndexError, ValueError):
+            raise ProxyError(f"无效的响应: {status_line[:80]}")
+        if not 100 <= status < 200 or status == 101:
+            return status, headers
+
+
+def header_value(
+    headers: list[tuple[str, str]], name: str, default: Optional[str] = None
+) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return default
+
+
+def retry_after(headers: list[tuple[str, str]]) -> Optional[float]:
+    value = header_value(headers, "retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None  # HTTP 日期格式，按指数退避处理
+
+
+async def read_head(
+    reader: asyncio.StreamReader,
+) -> Optional[tuple[str, list[tuple[str, str]]]]:
+    """
+    读取起始行和头部，连接在两个请求之间正常关闭时返回 None
+    """
+    try:
+        data = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise ProxyError("头部过长")
+    lines = data.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise ProxyError(f"无效的头部: {line[:80]}")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+async def read_body(
+    reader: asyncio.StreamReader,
+    headers: list[tuple[str, str]],
+    max_size: Optional[int] = None,
+) -> bytes:
+    """
+    读取完整的请求体 (重试需要重发，请求体在内存中保留一份)。
+    超过 max_size 字节时在读取超出部分之前抛出 BodyTooLarge
+    """
+    if header_value(headers, "transfer-encoding", "").lower() == "chunked":
+        parts = []
+        total = 0
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass  # 丢弃 trailer
+                return b"".join(parts)
+            total += size
+            if max_size is not None and total > max_size:
+                raise BodyTooLarge(f"请求体超过 {max_size} 字节")
+            parts.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    length = int(header_value(headers, "content-length", "0"))
+    if max_size is not None and length > max_size:
+        raise BodyTooLarge(f"请求体超过 {max_size} 字节 (Content-Length: {length})")
+    return await reader.readexactly(length) if length else b""
+
+
+async def discard_response(
+    reader: asyncio.StreamReader, headers: list[tuple[str, str]]
+) -> bool:
+    """
+    读掉不转发的错误响应体，使连接可以放回连接池。响应体较大或没有 Content-Length 时直接关闭连接
+    """
+    length = header_value(headers, "content-length")
+    if (
+        length is None
+        or not length.isdigit()
+        or int(length) > RELAY_CHUNK
+        or header_value(headers, "connection", "").lower() == "close"
+    ):
+        return False
+    try:
+        await reader.readexactly(int(length))
+    except (OSError, asyncio.IncompleteReadError):
+        return False
+    return True
+
+
+async def relay_response(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    method: str,
+    status: int,
+    headers: list[tuple[str, str]],
+) -> bool:
+    """
+    把上游响应原样转发给客户端 (分块编码逐块转发，保持流式输出)。
+    返回响应是否有明确的边界 (有则两端连接都可继续复用)
+    """
+    chunked = header_value(headers, "transfer-encoding", "").lower() == "chunked"
+    length = header_value(headers, "content-length")
+    no_body = method == "HEAD" or status in (204, 304) or 100 <= status < 200
+    framed = no_body or chunked or length is not None
+    upstream_close = header_value(headers, "connection", "").lower() == "close"
+
+    out_headers = [(name, value) for name, value in headers if name.lower() not in HOP_BY_HOP]
+    if not framed:
+        out_headers.append(("Connection", "close"))
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n" + "".join(
+        f"{name}: {value}\r\n" for name, value in out_headers
+    )
+    writer.write(head.encode("latin-1") + b"\r\n")
+
+    if no_body:
+        pass
+    elif chunked:
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";")[0], 16)
+            writer.write(size_line)
+            if size == 0:
+                while True:
+                    line = await reader.readuntil(b"\r\n")
+                    writer.write(line)
+                    if line == b"\r\n":
+                        break
+                break
+            writer.write(await reader.readexactly(size + 2))
+            await writer.drain()
+    elif length is not None:
+        remaining = int(length)
+        while remaining:
+            data = await reader.read(min(remaining, RELAY_CHUNK))
+            if not data:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            writer.write(data)
+            remaining -= len(data)
+            await writer.drain()
+    else:
+        while data := await reader.read(RELAY_CHUNK):
+            writer.write(data)
+            await writer.drain()
+    await writer.drain()
+    return framed and not upstream_close
+
+
+async def write_error(writer: asyncio.StreamWriter, status: int, reason: str, message: str):
+    """
+    以 Anthropic API 的错误格式返回代理自身的错误
+    """
+    body = json.dumps(
+        {"type": "error", "error": {"type": "proxy_error", "message": message}},
+        ensure_ascii=False,
+    ).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+        + body
+    )
+    try:
+        await writer.drain()
+    except OSError:
+        pass
+
+
+async def start_proxy(pool: ProxyPool, host: str, port: int) -> asyncio.Server:
+    return await asyncio.start_server(pool.handle_client, host, port, limit=STREAM_LIMIT)
+
+
+async def serve(pool: ProxyPool, host: str, port: int):
+    """
+    运行代理直到被取消 (Ctrl+C)
+    """
+    server = await start_proxy(pool, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# claude_env/prune.py
+# 描述: 对话记录清理 (claude_env prune)
+# 以生成器流水线处理 .claude/projects/**/*.jsonl: 目录 -> 单个目录中的文件 -> 待删除文件 -> 删除，
+# 任一时刻只持有一个目录的文件列表。每个目录记录上次检查时的水位
+# (目录 mtime, 最旧文件 mtime, 文件数, 子目录, 每天的字节数)：
+# 目录未变化且按水位不可能有文件满足策略时直接跳过，总量统计也沿用记录的每天字节数。
+
+import os
+import json
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from claude_env.config import PRUNE_STATE_PATH
+from claude_env.models import PruneStats
+from claude_env.utils import atomic_write_text
+
+TRANSCRIPTS_DIR = Path(".claude") / "projects"
+TRANSCRIPT_SUFFIX = ".jsonl"
+
+
+def load_prune_state() -> dict:
+    try:
+        with open(PRUNE_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_prune_state(state: dict):
+    atomic_write_text(PRUNE_STATE_PATH, json.dumps(state, separators=(",", ":")))
+
+
+def iter_batches(
+    root: Path,
+    watermarks: dict,
+    cutoff: Optional[float],
+    keep: Optional[int],
+    stats: PruneStats,
+    skipped: Optional[set] = None,
+) -> Iterator[tuple[str, int, list[str], list[tuple[Path, int, float]]]]:
+    """
+    深度优先遍历 root，为每个需要检查的目录生成 (相对路径, 目录 mtime, 子目录, 文件列表)，
+    文件按 mtime 从新到旧排序。目录 mtime 与水位相同 (没有文件被增删)、
+    最旧文件也不早于 cutoff、文件数不超过 keep 时不列目录，直接沿用水位中记录的子目录。
+    """
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        directory = root / rel
+        try:
+            dir_mtime = os.lstat(directory).st_mtime_ns
+        except OSError:
+            continue
+        mark = watermarks.get(rel)
+        if (
+            mark is not None
+            and len(mark) > 4  # 旧版本的水位没有每天字节数，重新列出一次
+            and mark[0] == dir_mtime
+            and (cutoff is None or mark[1] >= cutoff)
+            and (keep is None or mark[2] <= keep)
+        ):
+            stats.dirs_skipped += 1
+            if skipped is not None:
+                skipped.add(rel)
+            stack.extend(os.path.join(rel, name) for name in mark[3])
+            continue
+
+        stats.dirs_scanned += 1
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.endswith(TRANSCRIPT_SUFFIX) and entry.is_file(
+                        follow_symlinks=False
+                    ):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((Path(entry.path), st.st_size, st.st_mtime))
+        except OSError:
+            continue
+        stats.files_scanned += len(files)
+        files.sort(key=lambda item: item[2], reverse=True)
+        stack.extend(os.path.join(rel, name) for name in subdirs)
+        yield rel, dir_mtime, subdirs, files
+
+
+def select_doomed(
+    batches: Iterator[tuple[str, int, list[str], list]],
+    cutoff: Optional[float],
+    keep: Optional[int],
+    watermarks: dict,
+) -> Iterator[tuple[Path, int]]:
+    """
+    按策略生成待删除的 (文件, size)；同时记录每个目录清理后的水位
+    """
+    for rel, dir_mtime, subdirs, files in batches:
+        survivors = []
+        per_day: dict[str, int] = {}
+        removed = False
+        for index, (path, size, mtime) in enumerate(files):
+            if (cutoff is not None and mtime < cutoff) or (keep is not None and index >= keep):
+                removed = True
+                yield path, size
+            else:
+                survivors.append(mtime)
+                day = str(int(mtime // 86400))
+                per_day[day] = per_day.get(day, 0) + size
+        # 有文件被删除时目录 mtime 会变化，先记为 None，由 prune_env 在删除后重新读取
+        watermarks[rel] = [
+            None if removed else dir_mtime,
+            min(survivors) if survivors else time.time(),
+            len(survivors),
+            subdirs,
+            per_day,
+        ]
+
+
+def size_cutoff(
+    env_dir: Path, watermarks: dict, max_bytes: int, cutoff: Optional[float]
+) -> Optional[float]:
+    """
+    总量策略: 先流式统计每天 (按 mtime) 的字节数，找出需要删除到哪一天为止，
+    返回对应的 mtime 截止时间 (不需要时返回 None)。只占用与天数成正比的内存。
+    目录 mtime 未变化、且最旧文件也不早于 cutoff 的目录直接使用水位中记录的每天字节数，不列目录。
+    追加写入已有文件不改变目录 mtime，这部分增长在该目录下次被重新列出时计入。
+    """
+    root = env_dir / TRANSCRIPTS_DIR
+    per_day: dict[int, int] = {}
+    total = 0
+    skipped: set = set()
+    for _rel, _mtime, _subdirs, files in iter_batches(
+        root, watermarks, cutoff, None, PruneStats(), skipped
+    ):
+        for _path, size, mtime in files:
+            if cutoff is not None and mtime < cutoff:
+                continue  # 已经会被年龄策略删除
+            day = int(mtime // 86400)
+            per_day[day] = per_day.get(day, 0) + size
+            total += size
+    for rel in skipped:
+        for day, size in watermarks[rel][4].items():
+            per_day[int(day)] = per_day.get(int(day), 0) + size
+            total += size
+    if total <= max_bytes:
+        return None
+    for day in sorted(per_day):
+        total -= per_day[day]
+        if total <= max_bytes:
+            return (day + 1) * 86400.0
+    return time.time()
+
+
+def prune_env(
+    env_dir: Path,
+    watermarks: dict,
+    older_than_days: Optional[int] = None,
+    keep: Optional[int] = None,
+    max_size_mb: Optional[int] = None,
+    dry_run: bool = False,
+) -> PruneStats:
+    """
+    按策略清理一个环境的对话记录。watermarks 为该环境的水位，会被原地更新 (dry-run 时不更新)。
+    """
+    stats = PruneStats()
+    root = env_dir / TRANSCRIPTS_DIR
+    if not root.is_dir():
+        return stats
+
+    cutoff = None
+    if older_than_days is not None:
+        cutoff = time.time() - older_than_days * 86400
+    if max_size_mb is not None:
+        by_size = size_cutoff(env_dir, watermarks, max_size_mb * 1024 * 1024, cutoff)
+        if by_size is not None:
+            cutoff = max(cutoff or 0.0, by_size)
+
+    new_marks: dict = {}
+    skipped: set = set()
+    batches = iter_batches(root, watermarks, cutoff, keep, stats, skipped)
+    for path, size in select_doomed(batches, cutoff, keep, new_marks):
+        if not dry_run:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+        stats.files_removed += 1
+        stats.bytes_reclaimed += size
+
+    if not dry_run:
+        # 已不存在的目录不再保留水位
+        for rel in list(watermarks):
+            if rel not in skipped and rel not in new_marks:
+                del watermarks[rel]
+        # 删除之后目录 mtime 已变化，补上最新的值
+        for rel, mark in new_marks.items():
+            if mark[0] is None:
+                try:
+                    mark[0] = os.lstat(root / rel).st_mtime_ns
+                except OSError:
+                    continue
+            watermarks[rel] = mark
+    return stats
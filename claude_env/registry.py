@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# claude_env/registry.py
+# 描述: 环境注册表 (环境名称列表 + 上次激活的环境 + 元数据)
+# 两种实现共享同一接口，由 config.yaml 中的 'registry' 选择:
+#   YamlRegistry   - 兼容原有的 env.yaml (每次修改在 state_lock 内重新读取并原子重写整个文件)
+#   SqliteRegistry - registry.db，名称带唯一索引，每次修改是一个事务，
+#                    add / remove / rename 的开销与环境数量无关
+
+import sqlite3
+import time
+from typing import Optional
+
+from claude_env.config import (
+    ENV_STATE_PATH,
+    REGISTRY_DB_PATH,
+    load_env_state,
+    save_env_state,
+    state_lock,
+)
+from claude_env.models import AppConfig
+
+
+class YamlRegistry:
+    """
+    基于 env.yaml 的注册表
+    """
+
+    def __init__(self):
+        self.state = load_env_state()
+
+    def reload(self):
+        self.state = load_env_state()
+
+    def names(self) -> list[str]:
+        return list(self.state.environments)
+
+    def __contains__(self, env_name: str) -> bool:
+        return env_name in self.state.environments
+
+    def __len__(self) -> int:
+        return len(self.state.environments)
+
+    def _mutate(self, apply):
+        """
+        在跨进程锁内: 重新读取 env.yaml -> 修改 -> 原子写回，
+        避免并发调用互相覆盖对方的修改
+        """
+        with state_lock():
+            self.state = load_env_state()
+            apply(self.state)
+            save_env_state(self.state)
+
+    def add(self, env_name: str):
+        def apply(state):
+            if env_name in state.environments:
+                raise ValueError(f"环境 '{env_name}' 已存在")
+            state.environments.append(env_name)
+
+        self._mutate(apply)
+
+    def remove(self, env_name: str):
+        def apply(state):
+            if env_name not in state.environments:
+                raise ValueError(f"环境 '{env_name}' 不存在")
+            state.environments.remove(env_name)
+            state.last_used.pop(env_name, None)
+
+        self._mutate(apply)
+
+    def rename(self, old_name: str, new_name: str):
+        def apply(state):
+            if new_name in state.environments:
+                raise ValueError(f"环境 '{new_name}' 已存在")
+            state.environments.remove(old_name)
+            state.environments.append(new_name)
+            if old_name in state.last_used:
+                state.last_used[new_name] = state.last_used.pop(old_name)
+
+        self._mutate(apply)
+
+    @property
+    def last_active_env(self) -> Optional[str]:
+        return self.state.last_active_env
+
+    def set_last_active_env(self, env_name: str):
+        def apply(state):
+            state.last_active_env = env_name
+            state.last_used[env_name] = time.time()
+
+        self._mutate(apply)
+
+    def last_used_times(self) -> dict[str, float]:
+        return dict(self.state.last_used)
+
+    def update_auth_types(self, auth_types: dict[str, str]):
+        pass  # env.yaml 不保存元数据
+
+    def update_size(self, env_name: str, size_bytes: int):
+        pass
+
+
+class SqliteRegistry:
+    """
+    基于 SQLite 的注册表
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS environments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at REAL NOT NULL,
+            last_used_at REAL,
+            auth_type TEXT,
+            size_bytes INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self):
+        REGISTRY_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(REGISTRY_DB_PATH, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+        self._migrate_from_yaml()
+
+    def _migrate_from_yaml(self):
+        """
+        首次启用时从 env.yaml 导入环境列表和上次激活的环境
+        """
+        if self._get_meta("migrated_from_yaml") is not None:
+            return
+        now = time.time()
+        with state_lock(), self._conn:
+            if self._get_meta("migrated_from_yaml") is not None:
+                return  # 并发的调用已完成迁移
+            if ENV_STATE_PATH.is_file():
+                state = load_env_state()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO environments (name, created_at) VALUES (?, ?)",
+                    [(name, now) for name in state.environments],
+                )
+                if state.last_active_env:
+                    self._set_meta("last_active_env", state.last_active_env)
+                if state.environments:
+                    print(
+                        f"  [迁移] 已从 {ENV_STATE_PATH} 导入 "
+                        f"{len(state.environments)} 个环境到 {REGISTRY_DB_PATH}"
+                    )
+            self._set_meta("migrated_from_yaml", str(now))
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def reload(self):
+        pass  # 每次查询都直接读取数据库
+
+    def names(self) -> list[str]:
+        return [row[0] for row in self._conn.execute("SELECT name FROM environments ORDER BY id")]
+
+    def __contains__(self, env_name: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM environments WHERE name = ?", (env_name,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM environments").fetchone()[0]
+
+    def add(self, env_name: str):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO environments (name, created_at) VALUES (?, ?)",
+                    (env_name, time.time()),
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"环境 '{env_name}' 已存在")
+
+    def remove(self, env_name: str):
+        with self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM environments WHERE name = ?", (env_name,)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"环境 '{env_name}' 不存在")
+
+    def rename(self, old_name: str, new_name: str):
+        try:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "UPDATE environments SET name = ? WHERE name = ?",
+                    (new_name, old_name),
+                )
+                if cursor.rowcount == 0:
+                    raise ValueError(f"环境 '{old_name}' 不存在")
+                if self._get_meta("last_active_env") == old_name:
+                    self._set_meta("last_active_env", new_name)
+        except sqlite3.IntegrityError:
+            raise ValueError(f"环境 '{new_name}' 已存在")
+
+    @property
+    def last_active_env(self) -> Optional[str]:
+        return self._get_meta("last_active_env")
+
+    def set_last_active_env(self, env_name: str):
+        with self._conn:
+            self._set_meta("last_active_env", env_name)
+            self._conn.execute(
+                "UPDATE environments SET last_used_at = ? WHERE name = ?",
+                (time.time(), env_name),
+            )
+
+    def last_used_times(self) -> dict[str, float]:
+        return {
+            name: last_used
+            for name, last_used in self._conn.execute(
+                "SELECT name, last_used_at FROM environments WHERE last_used_at IS NOT NULL"
+            )
+        }
+
+    def update_auth_types(self, auth_types: dict[str, str]):
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE environments SET auth_type = ? "
+                "WHERE name = ? AND auth_type IS NOT ?",
+                [(auth, name, auth) for name, auth in auth_types.items()],
+            )
+
+    def update_size(self, env_name: str, size_bytes: int):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE environments SET size_bytes = ? WHERE name = ?",
+                (size_bytes, env_name),
+            )
+
+
+def open_registry(config: AppConfig):
+    """
+    根据 config.yaml 中的 'registry' 选项打开注册表
+    """
+    if config.registry == "sqlite":
+        return SqliteRegistry()
+    return YamlRegistry()
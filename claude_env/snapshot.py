@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# claude_env/snapshot.py
+# 描述: 环境快照 (claude_env snapshot / restore)
+# 快照保存在 base_dir/.snapshots/<env>/<id>/，文件以 reflink 共享数据块；
+# 不支持 reflink 时，只对只会被整体替换的 shareable_paths (即 dedup_paths) 使用硬链接，
+# 其余文件复制一份。snapshot_exclude 中的路径 (默认 .claude/projects 下的对话记录，
+# 只追加且体积大) 不进入快照，恢复时也不会被改动。
+
+import os
+import time
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from claude_env.utils import fast_copy_file, reflink_file
+
+SNAPSHOTS_DIR_NAME = ".snapshots"
+_TMP_PREFIX = ".tmp-"
+
+
+def env_snapshot_dir(base_dir: Path, env_name: str) -> Path:
+    return base_dir / SNAPSHOTS_DIR_NAME / env_name
+
+
+def reflink_supported(base_dir: Path) -> bool:
+    """
+    在 base_dir 中用一个临时文件探测文件系统是否支持 reflink
+    """
+    probe = base_dir / f"{_TMP_PREFIX}reflink-{os.getpid()}"
+    try:
+        probe.write_bytes(b"\0")
+        return reflink_file(probe, probe.with_name(probe.name + ".clone"))
+    except OSError:
+        return False
+    finally:
+        for path in (probe, probe.with_name(probe.name + ".clone")):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_snapshots(base_dir: Path, env_name: str) -> list[str]:
+    """
+    返回环境的快照 ID 列表 (从旧到新)
+    """
+    try:
+        names = os.listdir(env_snapshot_dir(base_dir, env_name))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if not name.startswith("."))
+
+
+def _under(rel: str, prefixes: tuple[str, ...]) -> bool:
+    return any(rel == p or rel.startswith(p + "/") for p in prefixes)
+
+
+def _walk_files(root: Path, exclude: tuple[str, ...]):
+    """
+    生成 (相对路径, DirEntry)，不进入 exclude 中的子树，也不跟随符号链接
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(root / rel_dir) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                if _under(rel, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                else:
+                    yield rel, entry
+
+
+def take_snapshot(
+    base_dir: Path,
+    env_name: str,
+    reason: str,
+    exclude: list[str],
+    shareable_paths: list[str],
+) -> str:
+    """
+    为环境创建一个快照，返回快照 ID
+    """
+    env_dir = base_dir / env_name
+    snapshots = env_snapshot_dir(base_dir, env_name)
+    now = time.time()
+    snapshot_id = (
+        time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        + f"-{int(now * 1e6) % 10**6:06d}-{reason}"
+    )
+    staging = snapshots / f"{_TMP_PREFIX}{snapshot_id}"
+    os.makedirs(staging)
+
+    exclude_prefixes = tuple(p.rstrip("/") for p in exclude)
+    shareable = tuple(p.rstrip("/") for p in shareable_paths)
+    use_reflink = True
+    try:
+        for rel, entry in _walk_files(env_dir, exclude_prefixes):
+            dest = staging / rel
+            os.makedirs(dest.parent, exist_ok=True)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dest)
+            elif entry.is_file(follow_symlinks=False):
+                src = Path(entry.path)
+                if use_reflink and reflink_file(src, dest):
+                    continue
+                use_reflink = False
+                if _under(rel, shareable):
+                    os.link(src, dest)
+                else:
+                    fast_copy_file(src, dest)
+        # 快照整体出现: 中断时只会留下 .tmp- 目录
+        os.replace(staging, snapshots / snapshot_id)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return snapshot_id
+
+
+def prune_snapshots(
+    base_dir: Path, env_name: str, keep: int, max_age_days: int
+) -> list[str]:
+    """
+    按保留策略删除旧快照: 只保留最新的 keep 个，并删除超过 max_age_days 天的快照
+    (max_age_days 为 0 表示不按时间删除；最新的一个快照总会保留)。返回被删除的快照 ID。
+    """
+    snapshots = env_snapshot_dir(base_dir, env_name)
+    # 清理被中断的快照
+    if snapshots.is_dir():
+        for name in os.listdir(snapshots):
+            if name.startswith(_TMP_PREFIX):
+                shutil.rmtree(snapshots / name, ignore_errors=True)
+
+    ids = list_snapshots(base_dir, env_name)
+    doomed = set(ids[:-keep] if keep > 0 else ids[:-1])
+    if max_age_days > 0:
+        cutoff = time.time() - max_age_days * 86400
+        for snapshot_id in ids[:-1]:
+            if (snapshots / snapshot_id).stat().st_mtime < cutoff:
+                doomed.add(snapshot_id)
+    for snapshot_id in doomed:
+        shutil.rmtree(snapshots / snapshot_id, ignore_errors=True)
+    return sorted(doomed)
+
+
+def _same_file(a: os.stat_result, b: os.stat_result) -> bool:
+    if (a.st_dev, a.st_ino) == (b.st_dev, b.st_ino):
+        return True
+    # 快照保留了 mtime，大小和 mtime 相同视为未改变 (与 sync 的 quick check 一致)
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
+def restore_snapshot(
+    base_dir: Path, env_name: str, snapshot_id: str, exclude: list[str]
+) -> tuple[int, int]:
+    """
+    把环境恢复到快照的状态，只重写有差异的文件。
+    返回 (重写的文件数, 删除的文件数)。
+    """
+    env_dir = base_dir / env_name
+    snapshot = env_snapshot_dir(base_dir, env_name) / snapshot_id
+    exclude_prefixes = tuple(p.rstrip("/") for p in exclude)
+    rewritten = removed = 0
+
+    wanted: set[str] = set()
+    for rel, entry in _walk_files(snapshot, exclude_prefixes):
+        wanted.add(rel)
+        live = env_dir / rel
+        snap_st = entry.stat(follow_symlinks=False)
+        try:
+            live_st = os.lstat(live)
+        except FileNotFoundError:
+            live_st = None
+
+        if entry.is_symlink():
+            target = os.readlink(entry.path)
+            if live_st is not None and live.is_symlink() and os.readlink(live) == target:
+                continue
+        elif live_st is not None and not live.is_symlink() and live.is_file():
+            if _same_file(snap_st, live_st):
+                continue
+
+        os.makedirs(live.parent, exist_ok=True)
+        if live.is_dir() and not live.is_symlink():
+            shutil.rmtree(live)
+        tmp_path = live.with_name(f".{live.name}.restore-{os.getpid()}")
+        if entry.is_symlink():
+            os.symlink(os.readlink(entry.path), tmp_path)
+        else:
+            # 复制而不是链接回快照，之后对环境的写入不会影响快照
+            fast_copy_file(Path(entry.path), tmp_path)
+        os.replace(tmp_path, live)
+        rewritten += 1
+
+    # 快照之后新增的文件
+    for rel, entry in list(_walk_files(env_dir, exclude_prefixes)):
+        if rel not in wanted:
+            os.unlink(entry.path)
+            removed += 1
+    return rewritten, removed
+
+
+def latest_snapshot(base_dir: Path, env_name: str) -> Optional[str]:
+    ids = list_snapshots(base_dir, env_name)
+    return ids[-1] if ids else None
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# claude_env/status.py
+# 描述: `claude_env status` 的快速路径 (守护进程未运行时)
+# 只使用标准库：从 .layout.json 读取上次加载 config.yaml 时解析出的目录布局，
+# 从 index.json 读取激活环境的认证信息，不导入 Rich / Pydantic / PyYAML。
+# 布局缓存或索引条目过期、链接断开等情况返回 None，由 EnvironmentManager.status 处理。
+# 面板内容由 status_fields 生成，与 EnvironmentManager.status 共用。
+
+import os
+import unicodedata
+
+CONFIG_ROOT_DIR = os.path.join(os.path.expanduser("~"), ".claude_env")
+CONFIG_PATH = os.path.join(CONFIG_ROOT_DIR, "config.yaml")
+LAYOUT_CACHE_PATH = os.path.join(CONFIG_ROOT_DIR, ".layout.json")
+INDEX_PATH = os.path.join(CONFIG_ROOT_DIR, "index.json")
+
+PANEL_TITLE = "Claude-Env 状态面板"
+ANSI_STYLES = {
+    "bold": "1",
+    "red": "31",
+    "green": "32",
+    "yellow": "33",
+    "blue": "34",
+    "magenta": "35",
+    "cyan": "36",
+}
+
+
+def status_fields(
+    env_name: str | None,
+    auth_type: str,
+    email: str | None,
+    endpoint: str | None,
+) -> list[tuple[str, str, str]]:
+    """
+    状态面板的内容，返回 [(标签, 值, 颜色)]
+    """
+    fields = [("激活环境", env_name if env_name else "无 (已断开链接)", "cyan")]
+    if auth_type == "OAuth":
+        color = "green" if email else "red"
+        fields += [
+            ("认证类型", "OAuth 订阅", "magenta"),
+            ("用户信息", email if email else "未登录", color),
+            ("状态", "✓ 已登录" if email else "✗ 未登录", color),
+        ]
+    elif auth_type == "API Key":
+        color = "green" if endpoint else "red"
+        fields += [
+            ("认证类型", "API Key 镜像", "magenta"),
+            ("Endpoint", endpoint if endpoint else "未配置", color),
+            ("状态", "✓ 已配置" if endpoint else "✗ 未配置", color),
+        ]
+    else:
+        fields += [("认证类型", "未知", "yellow"), ("状态", "✗ 未配置", "red")]
+    return fields
+
+
+def _load_json(path: str):
+    import json
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _signature(path: str) -> list[int] | None:
+    """
+    与 utils.stat_signature 相同: [inode, mtime_ns, size]
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def _display_width(text: str) -> int:
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+
+def _style(text: str, style: str, color: bool) -> str:
+    return f"\x1b[{ANSI_STYLES[style]}m{text}\x1b[0m" if color else text
+
+
+def render_panel(fields: list[tuple[str, str, str]], width: int, color: bool) -> str:
+    """
+    以 Rich Panel 相同的样式 (圆角边框、标题居中、padding (1, 2)) 渲染状态面板
+    """
+    inner = width - 2
+    title = f" {PANEL_TITLE} "
+    left = max(0, (inner - _display_width(title)) // 2)
+    right = max(0, inner - left - _display_width(title))
+
+    def border(text: str) -> str:
+        return _style(text, "blue", color)
+
+    lines = [border("╭" + "─" * left) + title + border("─" * right + "╮")]
+    body = [""] + [f"{label}: {value}" for label, value, _ in fields] + [""]
+    styled = [""] + [
+        _style(f"{label}:", "bold", color) + " " + _style(value, style, color)
+        for label, value, style in fields
+    ] + [""]
+    for plain, text in zip(body, styled):
+        pad = max(0, inner - 4 - _display_width(plain))
+        lines.append(border("│") + "  " + text + " " * pad + "  " + border("│"))
+    lines.append(border("╰" + "─" * inner + "╯"))
+    return "\n".join(lines) + "\n"
+
+
+def run_status(width: int, color: bool) -> int | None:
+    """
+    通过缓存的布局和元数据索引显示状态面板，返回退出码；无法走快速路径时返回 None
+    """
+    layout = _load_json(LAYOUT_CACHE_PATH)
+    if not isinstance(layout, dict) or layout.get("config") != _signature(CONFIG_PATH):
+        return None  # config.yaml 在上次完整加载之后被修改过
+    try:
+        base_dir, primary = layout["base_dir"], layout["primary"]
+    except KeyError:
+        return None
+
+    # 与 utils.get_symlink_target_env 相同：解析整条链接 (pointer 模式下经过 current)
+    primary_home = os.path.join(os.path.expanduser("~"), primary)
+    if not os.path.islink(primary_home):
+        return None
+    prefix = base_dir.rstrip(os.sep) + os.sep
+    target = os.path.realpath(primary_home)
+    if not target.startswith(prefix):
+        return None
+    env_name = target[len(prefix) :].split(os.sep, 1)[0]
+
+    index = _load_json(INDEX_PATH)
+    entry = index.get(env_name) if isinstance(index, dict) else None
+    signature = _signature(os.path.join(base_dir, env_name, primary))
+    if signature is None or not isinstance(entry, dict) or entry.get("signature") != signature:
+        return None
+    try:
+        profile = entry["profile"]
+        fields = status_fields(
+            env_name, profile["auth_type"], profile["email"], profile["endpoint"]
+        )
+    except (KeyError, TypeError):
+        return None
+
+    os.write(1, render_panel(fields, width, color).encode())
+    return 0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# claude_env/sync.py
+# 描述: 内置的增量目录同步引擎 (替代 rsync -a 子进程)
+#
+# 每个环境在 SYNC_MANIFEST_DIR 下保存一份清单:
+#   {managed_path: {relpath: [size, mtime_ns, inode]}}
+# 同步时只遍历源目录，(size, mtime_ns) 与清单一致的文件直接跳过，
+# 不需要 stat 目标端；新增或变化的文件使用 reflink / copy_file_range 复制。
+# 与 rsync -a (不带 --delete) 一致，目标端多出的文件会被保留。
+
+import os
+import json
+from pathlib import Path
+
+from claude_env.config import SYNC_MANIFEST_DIR
+from claude_env.models import SyncStats
+from claude_env.utils import atomic_write_text, fast_copy_file
+
+
+def _manifest_path(env_name: str) -> Path:
+    return SYNC_MANIFEST_DIR / f"{env_name}.json"
+
+
+def load_manifest(env_name: str) -> dict:
+    """
+    加载环境的同步清单，不存在或损坏时返回空清单
+    """
+    try:
+        with open(_manifest_path(env_name), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(env_name: str, manifest: dict):
+    """
+    保存环境的同步清单
+    """
+    atomic_write_text(
+        _manifest_path(env_name), json.dumps(manifest, separators=(",", ":"))
+    )
+
+
+def drop_manifest(env_name: str):
+    """
+    删除环境的同步清单 (环境被删除时调用)
+    """
+    _manifest_path(env_name).unlink(missing_ok=True)
+
+
+def rename_manifest(old_name: str, new_name: str):
+    """
+    环境重命名时同步移动清单
+    """
+    try:
+        os.replace(_manifest_path(old_name), _manifest_path(new_name))
+    except FileNotFoundError:
+        pass
+
+
+def sync_tree(src: Path, dest: Path, entries: dict) -> SyncStats:
+    """
+    将 src 目录增量同步到 dest。
+    entries 是上次同步的清单 {relpath: [size, mtime_ns, inode]}，会被原地更新。
+    如果 dest 不存在，清单视为失效，全部重新复制。
+    """
+    stats = SyncStats()
+    if not dest.is_dir():
+        entries.clear()
+    os.makedirs(dest, exist_ok=True)
+
+    seen: set[str] = set()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        src_dir = os.path.join(src, rel_dir)
+        dest_dir = os.path.join(dest, rel_dir)
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                dest_item = os.path.join(dest_dir, entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    os.makedirs(dest_item, exist_ok=True)
+                    stack.append(rel)
+                    continue
+
+                stats.files_scanned += 1
+                seen.add(rel)
+                st = entry.stat(follow_symlinks=False)
+                signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+                previous = entries.get(rel)
+                # 按 rsync 的 quick check 规则，只比较 size 和 mtime；
+                # 写临时文件再 rename 会换 inode，但内容不变时 mtime 也不会变
+                if previous and previous[:2] == signature[:2]:
+                    continue
+
+                if entry.is_symlink():
+                    link_target = os.readlink(entry.path)
+                    if os.path.lexists(dest_item):
+                        os.unlink(dest_item)
+                    os.symlink(link_target, dest_item)
+                elif entry.is_file(follow_symlinks=False):
+                    # 先删除再写入: 目标可能是去重后的硬链接，不能原地截断
+                    if os.path.lexists(dest_item):
+                        os.unlink(dest_item)
+                    stats.bytes_copied += fast_copy_file(
+                        Path(entry.path), Path(dest_item)
+                    )
+                else:
+                    continue  # 跳过 socket / fifo 等特殊文件
+
+                entries[rel] = signature
+                stats.files_copied += 1
+
+    # 源端已删除的文件不再出现在清单中 (目标端文件保留)
+    for rel in list(entries):
+        if rel not in seen:
+            del entries[rel]
+
+    return stats
+
+
+def sync_env_path(env_name: str, rel_path_str: str, src: Path, dest: Path) -> SyncStats:
+    """
+    同步一个 managed path 目录到环境中，并持久化该环境的清单
+    """
+    manifest = load_manifest(env_name)
+    entries = manifest.setdefault(rel_path_str, {})
+    stats = sync_tree(src, dest, entries)
+    save_manifest(env_name, manifest)
+    return stats
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# claude_env/trash.py
+# 描述: 回收站 (claude_env remove / undo-remove)
+# remove 只把环境目录 rename(2) 到 base_dir/.trash/<删除时间>-<env>-<随机>/data，立即返回；
+# 撤销窗口过后由一个低优先级的分离进程 (python -m claude_env.trash) 删除，
+# 之后的命令也会顺带检查并启动它。删除前先把条目原子地改名为 .doomed-*，
+# 因此删除中断后会被下一次回收继续，且不会与撤销操作冲突。
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+TRASH_DIR_NAME = ".trash"
+_DOOMED_PREFIX = ".doomed-"
+# 包含 claude_env 包的目录: 项目未安装时，子进程需要它在 PYTHONPATH 中才能 -m claude_env.trash
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def trash_dir(base_dir: Path) -> Path:
+    return base_dir / TRASH_DIR_NAME
+
+
+def format_window(seconds: int) -> str:
+    """
+    撤销窗口的显示形式，如 90 -> "1 分钟 30 秒"，600 -> "10 分钟"
+    """
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = [
+        f"{value} {unit}"
+        for value, unit in ((hours, "小时"), (minutes, "分钟"), (secs, "秒"))
+        if value
+    ]
+    return " ".join(parts) or "0 秒"
+
+
+def _removed_at(entry_name: str) -> Optional[int]:
+    # 条目名称以删除时间 (秒) 开头
+    head = entry_name.split("-", 1)[0]
+    return int(head) if head.isdigit() else None
+
+
+def move_to_trash(base_dir: Path, env_name: str, extras: dict[str, Path], meta: dict) -> Path:
+    """
+    把环境目录 (以及 extras 中的附属数据，如快照、归档) 移入回收站，返回条目目录。
+    调用方需持有 state_lock。
+    """
+    entry = trash_dir(base_dir) / f"{int(time.time())}-{env_name}-{uuid.uuid4().hex[:6]}"
+    from claude_env.utils import atomic_write_text
+
+    os.makedirs(entry)
+    atomic_write_text(
+        entry / "meta.json",
+        json.dumps(dict(meta, env=env_name, removed_at=time.time()), ensure_ascii=False),
+    )
+    env_dir = base_dir / env_name
+    if env_dir.exists():
+        os.replace(env_dir, entry / "data")
+    for name, path in extras.items():
+        if os.path.lexists(path):
+            os.replace(path, entry / name)
+    return entry
+
+
+def find_entry(base_dir: Path, env_name: str) -> Optional[Path]:
+    """
+    返回该环境最近一次被删除、仍可撤销的条目
+    """
+    try:
+        names = os.listdir(trash_dir(base_dir))
+    except FileNotFoundError:
+        return None
+    candidates = [
+        n
+        for n in names
+        if _removed_at(n) is not None and n.split("-", 1)[1].rsplit("-", 1)[0] == env_name
+    ]
+    if not candidates:
+        return None
+    return trash_dir(base_dir) / max(candidates, key=_removed_at)
+
+
+def read_meta(entry: Path) -> dict:
+    try:
+        with open(entry / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def restore_entry(base_dir: Path, entry: Path, env_name: str, extras: dict[str, Path]):
+    """
+    撤销删除: 把环境目录和附属数据移回原处。调用方需持有 state_lock。
+    """
+    if (entry / "data").exists():
+        os.replace(entry / "data", base_dir / env_name)
+    else:
+        os.makedirs(base_dir / env_name)
+    for name, path in extras.items():
+        if os.path.lexists(entry / name):
+            os.makedirs(path.parent, exist_ok=True)
+            os.replace(entry / name, path)
+    shutil.rmtree(entry, ignore_errors=True)
+
+
+def expired_entries(base_dir: Path, undo_window: int) -> list[str]:
+    """
+    已超过撤销窗口的条目，以及上次删除未完成的 .doomed-* 条目
+    """
+    try:
+        names = os.listdir(trash_dir(base_dir))
+    except FileNotFoundError:
+        return []
+    cutoff = time.time() - undo_window
+    return [
+        n
+        for n in names
+        if n.startswith(_DOOMED_PREFIX)
+        or (_removed_at(n) is not None and _removed_at(n) <= cutoff)
+    ]
+
+
+def purge_expired(base_dir: Path, undo_window: int) -> int:
+    """
+    删除过期条目，返回删除的条目数。
+    改名 (.doomed-*) 在 state_lock 内完成，耗时的 rmtree 在锁外进行。
+    """
+    from claude_env.config import state_lock
+
+    root = trash_dir(base_dir)
+    doomed = []
+    with state_lock():
+        for name in expired_entries(base_dir, undo_window):
+            if name.startswith(_DOOMED_PREFIX):
+                doomed.append(root / name)
+                continue
+            target = root / f"{_DOOMED_PREFIX}{name}"
+            try:
+                os.replace(root / name, target)
+            except FileNotFoundError:
+                continue  # 已被撤销或被另一个回收进程处理
+            doomed.append(target)
+    for path in doomed:
+        shutil.rmtree(path, ignore_errors=True)
+    return len(doomed)
+
+
+def spawn_reaper(base_dir: Path, undo_window: int, delay: float = 0.0):
+    """
+    启动一个分离的低优先级进程，在 delay 秒后回收过期条目。
+    不等待它结束；失败时忽略，之后的命令会再次尝试。
+    """
+    pythonpath = os.environ.get("PYTHONPATH")
+    env = dict(
+        os.environ,
+        PYTHONPATH=f"{_PROJECT_DIR}{os.pathsep}{pythonpath}" if pythonpath else str(_PROJECT_DIR),
+    )
+    try:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "claude_env.trash",
+                str(base_dir),
+                str(undo_window),
+                str(delay),
+            ],
+            cwd=_PROJECT_DIR,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
+
+
+def detach_tree(path: Path) -> Optional[Path]:
+    """
+    把整个目录原子地改名为同级的 <name>.trash-<时间> 并在后台删除 (用于 uninstall)
+    """
+    if not path.exists():
+        return None
+    doomed = path.with_name(f"{path.name}.trash-{int(time.time())}")
+    os.replace(path, doomed)
+    try:
+        # nice 值也决定了 Linux 上默认的 I/O 优先级
+        nice = ["nice", "-n", "19"] if shutil.which("nice") else []
+        subprocess.Popen(
+            nice + ["rm", "-rf", "--", str(doomed)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        shutil.rmtree(doomed, ignore_errors=True)
+    return doomed
+
+
+def main(argv: list[str]):
+    import fcntl
+
+    base_dir, undo_window, delay = Path(argv[0]), int(argv[1]), float(argv[2])
+    try:
+        # 在子进程自身中降低优先级 (nice 值也决定了 Linux 上默认的 I/O 优先级)；
+        # 不使用 preexec_fn，它在多线程的父进程中并不安全
+        os.nice(19)
+    except OSError:
+        pass
+    if delay > 0:
+        time.sleep(delay)
+    os.makedirs(trash_dir(base_dir), exist_ok=True)
+    with open(trash_dir(base_dir) / ".reaper.lock", "w") as lock:
+        try:
+            # 同一时间只需要一个回收进程
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        purge_expired(base_dir, undo_window)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# claude_env/usage.py
+# 描述: 基于本地对话记录的 token 用量统计 (claude_env usage)
+# 扫描 .claude/projects/**/*.jsonl 中 assistant 消息的 message.usage，按天和模型汇总。
+# 每个文件记录 (inode, 已解析的字节偏移)，之后只解析新追加的完整行；
+# 读取使用 mmap 逐行查找，不把整个文件读入内存。
+
+import os
+import json
+import mmap
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from claude_env.config import USAGE_STATE_PATH
+from claude_env.utils import atomic_write_text
+
+TRANSCRIPTS_DIR = Path(".claude") / "projects"
+# 检查点格式版本: 版本不同的文件条目从头重新解析
+# (2: 按本地日期分组; 3: 用最近的若干个消息键去重)
+STATE_VERSION = 3
+# 每个文件保留的最近消息键 (message.id:requestId) 数量
+RECENT_KEYS = 32
+# 每个模型的计数: [输入, 输出, 缓存写入, 缓存读取]
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+def load_usage_state() -> dict:
+    """
+    格式: {env: {相对路径: {"v": 格式版本, "inode": ..., "offset": ..., "recent": 最近的消息键 (去重),
+                             "days": {日期: {模型: [4 个计数]}}}}}
+    已删除 (例如被 prune 清理) 的文件保留其统计，历史用量不会因此消失。
+    """
+    try:
+        with open(USAGE_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_usage_state(state: dict):
+    atomic_write_text(USAGE_STATE_PATH, json.dumps(state, separators=(",", ":")))
+
+
+def local_day(timestamp) -> str:
+    """
+    对话记录中的 timestamp 是 UTC (ISO 8601)，转换为本地日期 YYYY-MM-DD，
+    与 usage --days 使用的 date.today() 一致
+    """
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return str(timestamp or "")[:10] or "unknown"
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone().date().isoformat()
+
+
+def _add_line(line: bytes, entry: dict):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return
+    message = record.get("message") if isinstance(record, dict) else None
+    if not isinstance(message, dict):
+        return
+    usage = message.get("usage")
+    if not isinstance(usage, dict):
+        return
+    # 流式输出时同一条消息会写成多行 (中间可能夹着工具结果)，带有相同的 id 和用量，只计一次
+    key = f"{message.get('id')}:{record.get('requestId')}"
+    recent = entry["recent"]
+    if key in recent:
+        return
+    recent.append(key)
+    if len(recent) > RECENT_KEYS:
+        del recent[0]
+
+    day = local_day(record.get("timestamp"))
+    model = message.get("model") or "unknown"
+    counts = entry["days"].setdefault(day, {}).setdefault(model, [0, 0, 0, 0])
+    for i, field in enumerate(USAGE_FIELDS):
+        value = usage.get(field)
+        if isinstance(value, int):
+            counts[i] += value
+
+
+def parse_appended(path: Path, entry: dict, size: int) -> int:
+    """
+    从 entry["offset"] 开始解析新追加的完整行，返回解析的字节数。
+    最后一行若还没有换行符 (正在写入) 留到下次。
+    """
+    offset = entry["offset"]
+    if size <= offset:
+        return 0
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # stat 之后文件被删除或截断为空 (空文件无法 mmap)，下次运行时重新判断
+        return 0
+    with mm:
+        end = mm.rfind(b"\n", offset, size)
+        if end < 0:
+            return 0
+        pos = offset
+        while pos <= end:
+            newline = mm.find(b"\n", pos, end + 1)
+            # 大多数行 (用户消息、工具结果) 没有 usage 字段，不需要解析 JSON
+            if mm.find(b'"usage"', pos, newline) >= 0:
+                _add_line(mm[pos:newline], entry)
+            pos = newline + 1
+    entry["offset"] = end + 1
+    return end + 1 - offset
+
+
+def refresh_env(env_dir: Path, files_state: dict) -> tuple[int, int, dict]:
+    """
+    增量更新一个环境的用量统计，返回 (解析过的文件数, 解析的字节数, 有变化的文件)。
+    有变化的文件为 {相对路径: (更新前的 [inode, offset] 或 None, 新条目)}，供 merge_updates 使用。
+    """
+    root = env_dir / TRANSCRIPTS_DIR
+    files_parsed = bytes_parsed = 0
+    updated: dict = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                    continue
+                if not entry.name.endswith(".jsonl") or not entry.is_file(
+                    follow_symlinks=False
+                ):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                rel = os.path.relpath(entry.path, root)
+                state = files_state.get(rel)
+                base = None if state is None else [state["inode"], state["offset"]]
+                if (
+                    state is None
+                    or state["inode"] != st.st_ino
+                    or st.st_size < state["offset"]
+                    or state.get("v") != STATE_VERSION
+                ):
+                    # 新文件、被重写的文件或旧格式的条目: 从头解析
+                    state = files_state[rel] = {
+                        "v": STATE_VERSION,
+                        "inode": st.st_ino,
+                        "offset": 0,
+                        "recent": [],
+                        "days": {},
+                    }
+                    updated[rel] = (base, state)
+                if st.st_size == state["offset"]:
+                    continue
+                parsed = parse_appended(Path(entry.path), state, st.st_size)
+                if parsed:
+                    files_parsed += 1
+                    bytes_parsed += parsed
+                    updated[rel] = (base, state)
+    return files_parsed, bytes_parsed, updated
+
+
+def merge_updates(files_state: dict, updated: dict):
+    """
+    把锁外解析得到的文件条目合并进最新加载的状态。
+    已有条目仍是解析前的版本时直接替换；否则说明并发的运行也更新了该文件，
+    同一文件 (inode 相同) 已被解析得更远时保留已有条目。
+    """
+    for rel, (base, entry) in updated.items():
+        current = files_state.get(rel)
+        if (
+            isinstance(current, dict)
+            and [current.get("inode"), current.get("offset")] != base
+            and current.get("inode") == entry["inode"]
+            and current["offset"] >= entry["offset"]
+        ):
+            continue
+        files_state[rel] = entry
+
+
+def aggregate(
+    files_state: dict, since: Optional[str] = None
+) -> dict[str, dict[str, list[int]]]:
+    """
+    汇总一个环境所有文件的统计: {日期: {模型: [4 个计数]}}，只包含 since (YYYY-MM-DD) 及之后的日期
+    """
+    result: dict[str, dict[str, list[int]]] = {}
+    for state in files_state.values():
+        for day, models in state["days"].items():
+            if since and day < since:
+                continue
+            for model, counts in models.items():
+                total = result.setdefault(day, {}).setdefault(model, [0, 0, 0, 0])
+                for i, value in enumerate(counts):
+                    total[i] += value
+    return result
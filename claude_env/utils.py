@@ -3,38 +3,113 @@
 # 描述: 提供通用的文件操作和辅助工具 (已更新为使用 pathlib.Path)
 
 import os
+import sys
 import json
 import shutil
+import tempfile
+import threading
 from pathlib import Path
 from typing import Optional
 
-# 注意：这个文件不再需要 config_loader 或 models，它只接收 Path 对象
+from claude_env.models import EnvProfile, RESERVED_ENV_NAMES
 
+# Linux FICLONE ioctl (btrfs/xfs 等支持 reflink 的文件系统)
+_FICLONE = 0x40049409
 
-def get_current_email(claude_json_path: Path) -> Optional[str]:
+# 注意：这个文件不需要 config_loader，它只接收 Path 对象
+
+# --- .claude.json 解析缓存 ---
+# 键为文件路径，值为 (stat 签名, EnvProfile)。
+# 签名 (inode, mtime, size) 不变时直接复用，不再打开文件。
+_profile_cache: dict[str, tuple[tuple[int, int, int], EnvProfile]] = {}
+
+
+def stat_signature(path: Path) -> Optional[tuple[int, int, int]]:
     """
-    尝试从 .claude.json 文件中读取当前登录的 email 或 userID
+    返回文件的 stat 签名 (inode, mtime_ns, size)，文件不存在时返回 None
     """
-    if not claude_json_path.is_file():
-        return None
     try:
-        with open(claude_json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
-        # 先尝试传统的 user.email 格式
-        email = data.get("user", {}).get("email")
-        if email:
-            return email
 
-        # Claude Code 使用 userID 字段
+def parse_env_profile(data: dict) -> EnvProfile:
+    """
+    从已加载的 .claude.json 数据中提取认证类型、用户信息、endpoint 和可用性
+    """
+    # 1. 认证类型
+    # 检查是否存在 API Key 相关字段
+    if "apiKey" in data or "api_key" in data:
+        auth_type = "API Key"
+    # 检查是否存在 OAuth token 或 userID (Claude Code 格式)
+    elif "token" in data or "accessToken" in data or "user" in data or "userID" in data:
+        auth_type = "OAuth"
+    else:
+        auth_type = "Unknown"
+
+    # 2. 用户信息：先尝试传统的 user.email 格式，再尝试 Claude Code 的 userID
+    email = data.get("user", {}).get("email")
+    if not email:
         user_id = data.get("userID")
-        if user_id:
-            return f"User: {user_id[:12]}..."  # 显示前12位
+        email = f"User: {user_id[:12]}..." if user_id else None  # 显示前12位
+
+    # 3. endpoint（用于镜像站）
+    endpoint = (
+        data.get("apiEndpoint") or data.get("api_endpoint") or data.get("endpoint")
+    )
+
+    # 4. 可用性
+    if auth_type == "OAuth":
+        # OAuth: 检查是否有 userID 或 token
+        has_user_id = bool(data.get("userID"))
+        has_token = bool(data.get("token") or data.get("accessToken"))
+        has_user = bool(data.get("user", {}).get("email"))
+        is_valid = has_user_id or has_token or has_user
+    elif auth_type == "API Key":
+        # API Key: 必须同时有 apiKey 和 endpoint
+        has_api_key = bool(data.get("apiKey") or data.get("api_key"))
+        is_valid = has_api_key and bool(endpoint)
+    else:
+        is_valid = False
+
+    return EnvProfile(
+        auth_type=auth_type, email=email, endpoint=endpoint, is_valid=is_valid
+    )
+
+
+def load_env_profile(claude_json_path: Path) -> EnvProfile:
+    """
+    读取并解析 .claude.json，返回 EnvProfile。
+    结果按 (inode, mtime, size) 缓存，文件未变化时只做一次 stat，不再读取和解析。
+    """
+    signature = stat_signature(claude_json_path)
+    if signature is None or not claude_json_path.is_file():
+        return EnvProfile()
 
-        return None
+    key = str(claude_json_path)
+    cached = _profile_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    try:
+        with open(claude_json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        profile = parse_env_profile(data)
     except Exception as e:
         print(f"读取 {claude_json_path} 出错: {e}")
-        return None
+        profile = EnvProfile()
+
+    _profile_cache[key] = (signature, profile)
+    return profile
+
+
+def get_current_email(claude_json_path: Path) -> Optional[str]:
+    """
+    尝试从 .claude.json 文件中读取当前登录的 email 或 userID
+    """
+    return load_env_profile(claude_json_path).email
 
 
 def get_auth_type(claude_json_path: Path) -> str:
@@ -42,27 +117,7 @@ def get_auth_type(claude_json_path: Path) -> str:
     检测认证类型：OAuth 或 API Key
     返回: "OAuth", "API Key", 或 "Unknown"
     """
-    if not claude_json_path.is_file():
-        return "Unknown"
-    try:
-        with open(claude_json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        # 检查是否存在 API Key 相关字段
-        if "apiKey" in data or "api_key" in data:
-            return "API Key"
-        # 检查是否存在 OAuth token 或 userID (Claude Code 格式)
-        elif (
-            "token" in data
-            or "accessToken" in data
-            or "user" in data
-            or "userID" in data
-        ):
-            return "OAuth"
-        else:
-            return "Unknown"
-    except Exception:
-        return "Unknown"
+    return load_env_profile(claude_json_path).auth_type
 
 
 def is_auth_valid(claude_json_path: Path) -> bool:
@@ -70,37 +125,7 @@ def is_auth_valid(claude_json_path: Path) -> bool:
     检查认证是否有效（环境是否真正可用）
     返回: True 表示可用，False 表示需要登录/配置
     """
-    if not claude_json_path.is_file():
-        return False
-
-    try:
-        with open(claude_json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        auth_type = get_auth_type(claude_json_path)
-
-        if auth_type == "OAuth":
-            # OAuth: 检查是否有 userID 或 token
-            has_user_id = bool(data.get("userID"))
-            has_token = bool(data.get("token") or data.get("accessToken"))
-            has_user = bool(data.get("user", {}).get("email"))
-            return has_user_id or has_token or has_user
-
-        elif auth_type == "API Key":
-            # API Key: 必须同时有 apiKey 和 endpoint
-            has_api_key = bool(data.get("apiKey") or data.get("api_key"))
-            has_endpoint = bool(
-                data.get("apiEndpoint")
-                or data.get("api_endpoint")
-                or data.get("endpoint")
-            )
-            return has_api_key and has_endpoint
-
-        else:
-            return False
-
-    except Exception:
-        return False
+    return load_env_profile(claude_json_path).is_valid
 
 
 def get_api_endpoint(claude_json_path: Path) -> Optional[str]:
@@ -108,18 +133,105 @@ def get_api_endpoint(claude_json_path: Path) -> Optional[str]:
     获取 API endpoint（用于镜像站）
     返回: endpoint URL 或 None
     """
-    if not claude_json_path.is_file():
-        return None
+    return load_env_profile(claude_json_path).endpoint
+
+
+def atomic_write_text(path: Path, text: str, mode: Optional[int] = None):
+    """
+    原子地写入文本文件：写入同目录下的临时文件，fsync 后用 rename(2) 替换。
+    读者只会看到旧内容或完整的新内容，不会看到被截断的文件。
+    新文件的权限沿用被替换文件的权限 (例如保存 API Key 的 0600 .claude.json)，
+    文件原本不存在时使用 mode，默认 0600。
+    """
+    os.makedirs(path.parent, exist_ok=True)
     try:
-        with open(claude_json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # 检查常见的 endpoint 字段
-        endpoint = (
-            data.get("apiEndpoint") or data.get("api_endpoint") or data.get("endpoint")
-        )
-        return endpoint
-    except Exception:
-        return None
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o600 if mode is None else mode
+    # mkstemp 生成唯一的临时文件名 (同一进程的多个线程也不会冲突)，
+    # 并以 0600 创建，写入内容前不会对其他用户可读
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.tmp-")
+    tmp_path = Path(tmp_name)
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    # 持久化目录项 (rename 本身)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def is_reserved_env_name(env_name: str) -> bool:
+    """
+    检查名称是否被 base_dir 下的管理文件/内部目录占用
+    """
+    return env_name in RESERVED_ENV_NAMES or env_name.startswith(".")
+
+
+def _try_ficlone(src_fd: int, dest_fd: int) -> bool:
+    """
+    尝试用 FICLONE 让 dest 与 src 共享数据块 (写时复制)，不支持时返回 False
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import fcntl
+
+        fcntl.ioctl(dest_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def reflink_file(src: Path, dest: Path) -> bool:
+    """
+    创建 src 的 reflink 副本 dest (含元数据)。文件系统不支持时删除 dest 并返回 False。
+    """
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        cloned = _try_ficlone(fsrc.fileno(), fdst.fileno())
+    if not cloned:
+        os.unlink(dest)
+        return False
+    shutil.copystat(src, dest)
+    return True
+
+
+def fast_copy_file(src: Path, dest: Path) -> int:
+    """
+    复制单个文件的内容和元数据，返回复制的字节数。
+    依次尝试: reflink (FICLONE) -> os.copy_file_range -> 普通读写。
+    """
+    size = os.stat(src).st_size
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        copied = _try_ficlone(fsrc.fileno(), fdst.fileno())
+        if not copied and hasattr(os, "copy_file_range"):
+            try:
+                offset = 0
+                while offset < size:
+                    n = os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), size - offset, offset, offset
+                    )
+                    if n == 0:
+                        break
+                    offset += n
+                copied = offset == size
+            except OSError:
+                fdst.seek(0)
+                fdst.truncate()
+        if not copied:
+            fsrc.seek(0)
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dest)
+    return size
 
 
 def safe_copy_file(src: Path, dest: Path):
@@ -242,6 +354,27 @@ def safe_create_symlink(target: Path, link_path: Path):
         print(f"创建符号链接失败: {e}")
 
 
+def atomic_replace_symlink(target: Path, link_path: Path):
+    """
+    原子地创建或替换符号链接：先在同目录创建临时链接，再用 rename(2) 覆盖。
+    任何时刻 link_path 要么指向旧目标，要么指向新目标，不会不存在。
+    注意：link_path 不能是真实目录（rename 无法用链接覆盖目录）。
+    """
+    os.makedirs(link_path.parent, exist_ok=True)
+    # 临时名称包含线程 id: 同一进程的多个线程 (如守护进程) 可能同时替换同一个链接
+    tmp_link = link_path.with_name(
+        f".{link_path.name}.tmp-{os.getpid()}-{threading.get_ident()}"
+    )
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    tmp_link.symlink_to(target)
+    try:
+        os.replace(tmp_link, link_path)
+    except OSError:
+        tmp_link.unlink(missing_ok=True)
+        raise
+
+
 def safe_remove_symlink(link_path: Path):
     """
     安全地删除符号链接（不删除目标）
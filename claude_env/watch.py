@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# claude_env/watch.py
+# 描述: 监听 managed paths 所在目录的变化
+# Linux 下使用 inotify (通过 ctypes 调用 libc，无额外依赖)，
+# 其他平台或 inotify 不可用时退回到 stat 轮询。
+
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Iterable, Optional
+
+# inotify 事件掩码 (见 <sys/inotify.h>)
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    监听若干目录中指定名称的条目被创建/替换/删除
+    """
+
+    def __init__(self, paths: Iterable[Path]):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("当前平台不支持 inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+        # wd -> (目录, 关心的条目名称集合)
+        self._watches: dict[int, tuple[Path, set[str]]] = {}
+        by_dir: dict[Path, set[str]] = {}
+        for path in paths:
+            by_dir.setdefault(path.parent, set()).add(path.name)
+        for directory, names in by_dir.items():
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), _WATCH_MASK
+            )
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"无法监听 {directory}")
+            self._watches[wd] = (directory, names)
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        """
+        阻塞等待事件 (不占用 CPU)，返回发生变化的被监听路径
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        changed: list[Path] = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0").decode(
+                    errors="surrogateescape"
+                )
+                offset += length
+                directory, names = self._watches.get(wd, (None, set()))
+                if directory is not None and name in names:
+                    changed.append(directory / name)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    inotify 不可用时的后备方案：定期 lstat 每个路径，比较 (类型, inode, mtime)
+    """
+
+    def __init__(self, paths: Iterable[Path], interval: float):
+        self._paths = list(paths)
+        self._interval = interval
+        self._last = {path: self._snapshot(path) for path in self._paths}
+
+    @staticmethod
+    def _snapshot(path: Path) -> Optional[tuple[int, int, int]]:
+        try:
+            st = path.lstat()
+        except OSError:
+            return None
+        return (st.st_mode, st.st_ino, st.st_mtime_ns)
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self._interval)
+            changed = []
+            for path in self._paths:
+                current = self._snapshot(path)
+                if current != self._last[path]:
+                    self._last[path] = current
+                    changed.append(path)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(paths: Iterable[Path], interval: float, force_poll: bool = False):
+    """
+    优先使用 inotify，失败时退回到轮询
+    """
+    paths = list(paths)
+    if not force_poll:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths, interval)
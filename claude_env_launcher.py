@@ -9,9 +9,9 @@ import os
 # 将项目目录添加到 Python 路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from claude_env.cli import app
+from claude_env.client import main
 
 if __name__ == "__main__":
     # 设置程序名为 claude_env
     sys.argv[0] = "claude_env"
-    app()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -51,9 +51,15 @@ cat > "$LAUNCHER_PATH" <<EOF
 # 自动生成于: $(date)
 
 INSTALL_DIR="$SCRIPT_DIR"
-cd "\$INSTALL_DIR"
+VENV_PYTHON="\$INSTALL_DIR/.venv/bin/python"
+
+# 直接使用 uv sync 生成的虚拟环境解释器，避免每次调用都经过 uv run 解析项目环境
+if [ -x "\$VENV_PYTHON" ]; then
+    exec "\$VENV_PYTHON" "\$INSTALL_DIR/claude_env_launcher.py" "\$@"
+fi
 
-# 使用 uv 运行 launcher
+# 虚拟环境不存在时退回到 uv run (会自动同步依赖)
+cd "\$INSTALL_DIR"
 exec uv run python claude_env_launcher.py "\$@"
 EOF
 
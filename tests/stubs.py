@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# tests/stubs.py
+# 描述: 测试与压测共用的本地模拟 API 服务 (proxy / probe 的上游)
+
+import random
+import asyncio
+from typing import Optional
+
+from claude_env.proxy import header_value, read_body, read_head
+
+RESPONSE_BODY = (
+    b'{"id":"msg_stub","type":"message","content":[{"type":"text","text":"'
+    + b"x" * 512
+    + b'"}],"usage":{"input_tokens":10,"output_tokens":20}}'
+)
+
+
+class StubUpstream:
+    """
+    模拟的 API 服务 (HTTP/1.1 keep-alive):
+      - status: 固定返回的状态码 (429 / 5xx 用于测试退避)
+      - flaky_rate: 以该概率返回 429
+      - latency: 每个请求的处理延迟 (秒)
+      - hang: 读取请求后不再响应
+      - send_continue: 最终响应前先发送 100 Continue
+    路径中包含 "stream" 时返回分块编码的 SSE 响应。记录收到的认证头和并发数
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        status: int = 200,
+        flaky_rate: float = 0.0,
+        latency: float = 0.0,
+        retry_after: Optional[str] = None,
+        hang: bool = False,
+        send_continue: bool = False,
+    ):
+        self.api_key = api_key
+        self.status = status
+        self.flaky_rate = flaky_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.hang = hang
+        self.send_continue = send_continue
+
+        self.served = 0
+        self.rejected = 0
+        self.wrong_keys = 0
+        self.requests: list[list[tuple[str, str]]] = []  # 每个请求的请求头
+        self.inflight = 0
+        self.max_inflight = 0
+        self.server: Optional[asyncio.Server] = None
+
+    async def start(self) -> str:
+        """
+        在随机端口上启动，返回 endpoint
+        """
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (request := await read_head(reader)) is not None:
+                start_line, headers = request
+                await read_body(reader, headers)
+                self.requests.append(headers)
+                authorization = header_value(headers, "authorization")
+                if header_value(headers, "x-api-key") != self.api_key and (
+                    authorization != f"Bearer {self.api_key}"
+                ):
+                    self.wrong_keys += 1
+                if self.hang:
+                    await asyncio.sleep(3600)
+                self.inflight += 1
+                self.max_inflight = max(self.max_inflight, self.inflight)
+                try:
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                finally:
+                    self.inflight -= 1
+                if self.send_continue:
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                rejected = self.status != 200 or (
+                    self.flaky_rate and random.random() < self.flaky_rate
+                )
+                if rejected:
+                    self.rejected += 1
+                    status = self.status if self.status != 200 else 429
+                    body = b'{"type":"error","error":{"type":"rate_limit_error"}}'
+                    extra = (
+                        f"retry-after: {self.retry_after}\r\n".encode()
+                        if self.retry_after is not None
+                        else b""
+                    )
+                    writer.write(
+                        b"HTTP/1.1 %d Error\r\n%scontent-length: %d\r\n\r\n%s"
+                        % (status, extra, len(body), body)
+                    )
+                elif "stream" in start_line:
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+                        b"transfer-encoding: chunked\r\n\r\n"
+                    )
+                    for i in range(5):
+                        event = b'event: content_block_delta\ndata: {"i": %d}\n\n' % i
+                        writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                    self.served += 1
+                else:
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                        b"content-length: %d\r\n\r\n%s" % (len(RESPONSE_BODY), RESPONSE_BODY)
+                    )
+                    self.served += 1
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
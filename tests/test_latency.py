@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# tests/test_latency.py
+# 描述: claude_env probe / switch --fastest 的延迟测量测试 (本地 HTTP / 自签名 HTTPS 模拟服务)
+#
+# 运行: python -m unittest discover tests
+
+import ssl
+import time
+import socket
+import asyncio
+import unittest
+import threading
+import socketserver
+from pathlib import Path
+
+from claude_env.latency import measure, probe_all, rank
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+CERT = DATA_DIR / "localhost.pem"
+KEY = DATA_DIR / "localhost-key.pem"
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+
+class StandInServer:
+    """
+    本地的 endpoint 替身: 读取请求头，等待 delay 秒后返回 401 (与未带认证访问 API 时相同)
+    """
+
+    def __init__(self, delay: float = 0.0, tls: bool = False):
+        delay_ = delay
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data = b""
+                while b"\r\n\r\n" not in data:
+                    chunk = self.request.recv(4096)
+                    if not chunk:
+                        return
+                    data += chunk
+                time.sleep(delay_)
+                self.request.sendall(b"HTTP/1.1 401 Unauthorized\r\ncontent-length: 0\r\n\r\n")
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        if tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(CERT, KEY)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def endpoint(self, scheme: str = "http", host: str = "127.0.0.1") -> str:
+        return f"{scheme}://{host}:{self.port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LatencyTestCase(unittest.TestCase):
+    def server(self, **kwargs) -> StandInServer:
+        server = StandInServer(**kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def silent_server(self) -> int:
+        """
+        只监听、从不 accept 的端口: 连接能建立 (进入 backlog)，但永远收不到响应
+        """
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(8)
+        self.addCleanup(sock.close)
+        return sock.getsockname()[1]
+
+    def trusted_context(self) -> ssl.SSLContext:
+        return ssl.create_default_context(cafile=str(CERT))
+
+
+class TestProbeAll(LatencyTestCase):
+    def test_ranks_fast_endpoint_first(self):
+        fast, slow = self.server(), self.server(delay=0.15)
+        results = asyncio.run(
+            probe_all({"slow": slow.endpoint(), "fast": fast.endpoint()}, samples=2, timeout=2)
+        )
+        self.assertEqual([env for env, _ in rank(results)], ["fast", "slow"])
+        self.assertEqual(results["fast"]["samples"], 2)
+        self.assertGreater(results["slow"]["ttfb"], 100)
+        self.assertEqual(results["fast"]["tls"], 0)
+
+    def test_https_measures_tls_handshake(self):
+        server = self.server(tls=True)
+        results = asyncio.run(
+            probe_all(
+                {"tls": server.endpoint("https", "localhost")},
+                samples=2,
+                timeout=2,
+                ssl_context=self.trusted_context(),
+            )
+        )
+        self.assertNotIn("error", results["tls"])
+        self.assertGreater(results["tls"]["tls"], 0)
+
+    def test_untrusted_certificate_reported(self):
+        server = self.server(tls=True)
+        results = asyncio.run(
+            probe_all({"tls": server.endpoint("https", "localhost")}, samples=1, timeout=2)
+        )
+        self.assertEqual(results["tls"]["samples"], 0)
+        self.assertIn("CERTIFICATE_VERIFY_FAILED", results["tls"]["error"])
+
+    def test_refused_port_ranked_last(self):
+        ok = self.server()
+        results = asyncio.run(
+            probe_all(
+                {"refused": f"http://127.0.0.1:{free_port()}", "ok": ok.endpoint()},
+                samples=1,
+                timeout=2,
+            )
+        )
+        self.assertIn("error", results["refused"])
+        self.assertEqual([env for env, _ in rank(results)], ["ok", "refused"])
+
+    def test_silent_server_times_out(self):
+        port = self.silent_server()
+        start = time.perf_counter()
+        results = asyncio.run(
+            probe_all({"silent": f"http://127.0.0.1:{port}"}, samples=2, timeout=0.2)
+        )
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertIn("超时", results["silent"]["error"])
+
+    def test_endpoints_probed_concurrently(self):
+        servers = [self.server(delay=0.3) for _ in range(4)]
+        start = time.perf_counter()
+        asyncio.run(
+            probe_all({f"env-{i}": s.endpoint() for i, s in enumerate(servers)}, 1, timeout=2)
+        )
+        # 串行需要 1.2 秒以上
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+
+class TestMeasureCache(LatencyTestCase):
+    def test_cached_results_reused_within_ttl(self):
+        server = self.server()
+        endpoints = {"env": server.endpoint()}
+        results, fresh = measure(endpoints, {}, samples=1, timeout=2, ttl=300)
+        self.assertEqual(list(fresh), ["env"])
+
+        cache = dict(fresh)
+        results, fresh = measure(endpoints, cache, samples=1, timeout=2, ttl=300)
+        self.assertEqual(fresh, {})
+        self.assertEqual(results["env"], cache["env"])
+
+    def test_expired_changed_or_refreshed_entries_remeasured(self):
+        server, other = self.server(), self.server()
+        _, cache = measure({"env": server.endpoint()}, {}, samples=1, timeout=2, ttl=300)
+
+        _, fresh = measure(
+            {"env": server.endpoint()}, cache, samples=1, timeout=2, ttl=300, refresh=True
+        )
+        self.assertEqual(list(fresh), ["env"])
+
+        _, fresh = measure({"env": other.endpoint()}, cache, samples=1, timeout=2, ttl=300)
+        self.assertEqual(fresh["env"]["endpoint"], other.endpoint())
+
+        cache["env"]["measured_at"] -= 600
+        _, fresh = measure({"env": server.endpoint()}, cache, samples=1, timeout=2, ttl=300)
+        self.assertEqual(list(fresh), ["env"])
+
+    def test_missing_endpoint_defaults_to_official_api(self):
+        cache = {
+            "env": {
+                "endpoint": "https://api.anthropic.com",
+                "measured_at": time.time(),
+                "total": 1.0,
+            }
+        }
+        results, fresh = measure({"env": None}, cache, samples=1, timeout=2, ttl=300)
+        self.assertEqual(fresh, {})
+        self.assertEqual(results["env"]["total"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# tests/test_proxy.py
+# 描述: claude_env proxy 的测试 (上游为 tests/stubs.py 中的本地模拟服务)
+#
+# 运行: python -m unittest discover tests
+
+import asyncio
+import unittest
+
+from claude_env.proxy import ProxyPool, Upstream, read_body, read_head, start_proxy
+from tests.stubs import StubUpstream
+
+TOKEN = "proxy-token"
+
+
+class ProxyClient:
+    """
+    一个到代理的 keep-alive 连接
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(
+        self,
+        path: str = "/v1/messages",
+        headers: dict[str, str] | None = None,
+        body: bytes = b'{"max_tokens": 16}',
+    ) -> tuple[int, list[tuple[str, str]], bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        headers = {"x-api-key": TOKEN} if headers is None else headers
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: localhost\r\n".encode()
+            + "".join(f"{k}: {v}\r\n" for k, v in headers.items()).encode()
+            + f"content-length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await self.writer.drain()
+        while True:
+            status_line, response_headers = await read_head(self.reader)
+            status = int(status_line.split(" ", 2)[1])
+            if status != 100:
+                break
+        return status, response_headers, await read_body(self.reader, response_headers)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ProxyTestCase(unittest.IsolatedAsyncioTestCase):
+    async def start(self, *stubs: StubUpstream, **pool_options) -> ProxyClient:
+        self.stubs = stubs
+        upstreams = [
+            Upstream(f"env-{i}", stub.api_key, await stub.start()) for i, stub in enumerate(stubs)
+        ]
+        pool_options.setdefault("token", TOKEN)
+        pool_options.setdefault("backoff_max", 5.0)
+        self.pool = ProxyPool(upstreams, **pool_options)
+        self.server = await start_proxy(self.pool, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        client = ProxyClient(self.port)
+        self.addCleanup(self.cleanup, client)
+        return client
+
+    def cleanup(self, client: ProxyClient):
+        client.close()
+        self.server.close()
+        self.pool.close()
+        for stub in self.stubs:
+            stub.close()
+
+    def upstream(self, index: int) -> Upstream:
+        return self.pool.upstreams[index]
+
+
+class TestKeyRewriting(ProxyTestCase):
+    async def test_x_api_key_replaced_with_upstream_key(self):
+        stub = StubUpstream("sk-upstream-0")
+        client = await self.start(stub)
+        status, _, _ = await client.request()
+        self.assertEqual(status, 200)
+        self.assertEqual(stub.wrong_keys, 0)
+        self.assertNotIn(TOKEN, str(stub.requests[0]))
+
+    async def test_bearer_authorization_replaced(self):
+        stub = StubUpstream("sk-upstream-0")
+        client = await self.start(stub)
+        status, _, _ = await client.request(headers={"Authorization": f"Bearer {TOKEN}"})
+        self.assertEqual(status, 200)
+        self.assertIn(("Authorization", "Bearer sk-upstream-0"), stub.requests[0])
+        self.assertEqual(stub.wrong_keys, 0)
+
+    async def test_request_without_token_is_rejected(self):
+        stub = StubUpstream("sk-upstream-0")
+        client = await self.start(stub)
+        status, _, body = await client.request(headers={"x-api-key": "wrong"})
+        self.assertEqual(status, 401)
+        self.assertIn(b"proxy_error", body)
+        self.assertEqual(stub.requests, [])
+
+    async def test_expect_continue_not_forwarded(self):
+        # 上游返回的 100 Continue 不能被当作最终响应，否则真正的响应会留在连接池中
+        stub = StubUpstream("sk-upstream-0", send_continue=True)
+        client = await self.start(stub)
+        for _ in range(3):
+            status, _, body = await client.request(
+                headers={"x-api-key": TOKEN, "Expect": "100-continue"}
+            )
+            self.assertEqual(status, 200)
+            self.assertIn(b"msg_stub", body)
+        self.assertFalse(any(k.lower() == "expect" for k, _ in stub.requests[0]))
+
+    async def test_oversized_body_rejected(self):
+        stub = StubUpstream("sk-upstream-0")
+        client = await self.start(stub, max_body=1024)
+        status, _, body = await client.request(body=b"x" * 2048)
+        self.assertEqual(status, 413)
+        self.assertIn(b"proxy_error", body)
+        self.assertEqual(stub.requests, [])
+
+    async def test_oversized_chunked_body_rejected(self):
+        stub = StubUpstream("sk-upstream-0")
+        await self.start(stub, max_body=1024)
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            chunk = b"x" * 600
+            writer.write(
+                f"POST /v1/messages HTTP/1.1\r\nHost: localhost\r\nx-api-key: {TOKEN}\r\n"
+                "Transfer-Encoding: chunked\r\n\r\n".encode()
+                + (b"258\r\n" + chunk + b"\r\n") * 2
+                + b"0\r\n\r\n"
+            )
+            await writer.drain()
+            status_line, _ = await read_head(reader)
+        finally:
+            writer.close()
+        self.assertEqual(status_line.split(" ", 2)[1], "413")
+        self.assertEqual(stub.requests, [])
+
+    async def test_streaming_response_relayed(self):
+        stub = StubUpstream("sk-upstream-0")
+        client = await self.start(stub)
+        status, headers, body = await client.request("/v1/messages?stream")
+        self.assertEqual(status, 200)
+        self.assertEqual(body.count(b"event: content_block_delta"), 5)
+
+
+class TestRouting(ProxyTestCase):
+    async def test_pick_least_outstanding(self):
+        await self.start(StubUpstream("sk-0"), StubUpstream("sk-1"), StubUpstream("sk-2"))
+        self.upstream(0).outstanding = 3
+        self.upstream(1).outstanding = 1
+        self.upstream(2).outstanding = 2
+        self.assertIs(self.pool.pick(set()), self.upstream(1))
+        self.assertIs(self.pool.pick({self.upstream(1)}), self.upstream(2))
+
+    async def test_concurrent_requests_spread_evenly(self):
+        stubs = [StubUpstream("sk-0", latency=0.2), StubUpstream("sk-1", latency=0.2)]
+        await self.start(*stubs)
+        clients = [ProxyClient(self.port) for _ in range(4)]
+        try:
+            results = await asyncio.gather(*(c.request() for c in clients))
+        finally:
+            for c in clients:
+                c.close()
+        self.assertEqual([r[0] for r in results], [200] * 4)
+        self.assertEqual([s.max_inflight for s in stubs], [2, 2])
+
+    async def test_busy_upstream_skipped(self):
+        # 一个上游有长时间未完成的请求时，其余请求都发往空闲的上游
+        slow, fast = StubUpstream("sk-0", latency=0.5), StubUpstream("sk-1")
+        client = await self.start(slow, fast)
+        self.upstream(1).outstanding = 1
+        long_client = ProxyClient(self.port)
+        long_request = asyncio.ensure_future(long_client.request())
+        await asyncio.sleep(0.1)
+        self.upstream(1).outstanding = 0
+        try:
+            for _ in range(5):
+                status, _, _ = await client.request()
+                self.assertEqual(status, 200)
+            self.assertEqual(fast.served, 5)
+            self.assertEqual((await long_request)[0], 200)
+            self.assertEqual(slow.served, 1)
+        finally:
+            long_client.close()
+
+
+class TestBackoff(ProxyTestCase):
+    async def test_429_retried_on_other_upstream_and_backed_off(self):
+        limited, healthy = StubUpstream("sk-0", status=429), StubUpstream("sk-1")
+        client = await self.start(limited, healthy)
+        # 让第一个请求先选中被限流的上游
+        self.upstream(1).outstanding = 1
+        status, _, _ = await client.request()
+        self.upstream(1).outstanding = 0
+        self.assertEqual(status, 200)
+        self.assertEqual((limited.rejected, healthy.served), (1, 1))
+        self.assertGreater(self.upstream(0).backoff_until, asyncio.get_running_loop().time())
+
+        # 退避期间不再选择该上游
+        for _ in range(3):
+            status, _, _ = await client.request()
+            self.assertEqual(status, 200)
+        self.assertEqual((limited.rejected, healthy.served), (1, 4))
+
+    async def test_5xx_triggers_backoff(self):
+        broken, healthy = StubUpstream("sk-0", status=503), StubUpstream("sk-1")
+        client = await self.start(broken, healthy)
+        self.upstream(1).outstanding = 1
+        status, _, _ = await client.request()
+        self.upstream(1).outstanding = 0
+        self.assertEqual(status, 200)
+        self.assertEqual(broken.rejected, 1)
+        self.assertEqual(self.upstream(0).failures, 1)
+
+    async def test_retry_after_honoured(self):
+        limited = StubUpstream("sk-0", status=429, retry_after="3")
+        client = await self.start(limited, StubUpstream("sk-1"))
+        self.upstream(1).outstanding = 1
+        await client.request()
+        remaining = self.upstream(0).backoff_until - asyncio.get_running_loop().time()
+        self.assertGreater(remaining, 2.0)
+
+    async def test_backoff_resets_after_success(self):
+        stub = StubUpstream("sk-0")
+        client = await self.start(stub)
+        self.upstream(0).failures = 3
+        await client.request()
+        self.assertEqual(self.upstream(0).failures, 0)
+
+    async def test_all_upstreams_limited_returns_last_response(self):
+        client = await self.start(StubUpstream("sk-0", status=429), StubUpstream("sk-1", status=429))
+        status, _, body = await client.request()
+        self.assertEqual(status, 429)
+        self.assertIn(b"rate_limit_error", body)
+
+    async def test_hung_upstream_times_out(self):
+        hung, healthy = StubUpstream("sk-0", hang=True), StubUpstream("sk-1")
+        client = await self.start(hung, healthy, response_timeout=0.3)
+        self.upstream(1).outstanding = 1
+        status, _, _ = await asyncio.wait_for(client.request(), 5)
+        self.upstream(1).outstanding = 0
+        self.assertEqual(status, 200)
+        self.assertEqual(self.upstream(0).outstanding, 0)
+        self.assertEqual(self.upstream(0).failures, 1)
+
+    async def test_unreachable_upstream_returns_502(self):
+        stub = StubUpstream("sk-0")
+        client = await self.start(stub)
+        stub.close()
+        await stub.server.wait_closed()
+        self.pool.close()
+        status, _, body = await client.request()
+        self.assertEqual(status, 502)
+        self.assertIn(b"env-0", body)
+
+
+if __name__ == "__main__":
+    unittest.main()